@@ -115,3 +115,22 @@ layout = html.Div(
         ),
     ]
 )
+
+
+@app.callback(
+    dash.dependencies.Output("experiment-settings", "data"),
+    [
+        dash.dependencies.Input("save-input", "value"),
+        dash.dependencies.Input("device-id", "value"),
+        dash.dependencies.Input("meas-interval", "value"),
+        dash.dependencies.Input("timeout", "value"),
+    ],
+)
+def store_settings(save_folder, device_id, interval, timeout):
+    """Mirror the page settings into a store that outlives the page."""
+    return {
+        "save_folder": save_folder,
+        "device_id": device_id,
+        "interval": interval,
+        "timeout": timeout,
+    }
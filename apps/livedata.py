@@ -1,133 +1,673 @@
 """Page for plotting live data."""
+import functools
+import json
+import pathlib
+import threading
+import time
 
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-import dash_daq as daq
-import numpy as np
-import plotly
-import plotly.subplots
-import plotly.graph_objs as go
 
 from app import app
+from downsample import downsample
+from shmring import SharedRingBuffer
+from storage import COLUMNS
+from tailreader import RingBuffer, TailReader
+from tsvload import parse_lines, read_columns
+from zoomindex import INDEX_COLUMNS, ZoomIndex
 
+# number of most recent points held for plotting
+LIVE_POINTS = 10000
 
-def format_figure(data, fig):
-    """Format figure.
+# default max number of points drawn in each graph, roughly its width in pixels
+PLOT_POINTS = 1000
+
+# names of the save file columns plotted as R and phase. Streaming mode saves only
+# have the channel displays, which show R and phase by default.
+PLOT_COLUMNS = {
+    "poll": ["R (V)", "Phase (deg)"],
+    "stream": ["Ch1 display", "Ch2 display"],
+}
+
+# shown instead of plotting a save file without the columns above
+NO_PLOT_COLUMNS = (
+    f"The save file has none of the column pairs {list(PLOT_COLUMNS.values())} to "
+    + "plot."
+)
+
+# shown when plotting the columns of a streaming mode save file
+STREAM_PLOT_NOTE = "Streaming mode save: the Ch1 and Ch2 displays are plotted."
+
+# interval between updates when no new data are pushed, e.g. for runs started
+# outside the GUI, in ms
+FALLBACK_INTERVAL = 10000
+
+# tail readers and ring buffers for each save file, so each update only reads rows
+# appended since the last one
+live_data = {}
+
+# shared memory buffers written by the acquisition process, keyed by name
+shared_buffers = {}
+
+# callbacks run concurrently in the server's threads, so readers and buffers are only
+# used by one at a time and shared memory isn't closed while it's being read
+live_data_lock = threading.Lock()
+shared_buffers_lock = threading.Lock()
+
+# zoom indexes of save files for the history graph, keyed by path
+zoom_indexes = {}
+
+# callbacks run concurrently in the server's threads, so only one index is opened
+# for each save file
+zoom_indexes_lock = threading.Lock()
+
+
+def plot_columns(save_path):
+    """Get the columns of a tsv save file to plot as R and phase from its header.
+
+    Parameters
+    ----------
+    save_path : str
+        Path to save file.
+
+    Returns
+    -------
+    mode : str or None
+        Acquisition mode the save file was recorded in, "poll" or "stream", or None
+        if the file has no columns to plot.
+    all_columns : list of str
+        Column names of the save file.
+    """
+    all_columns, _ = read_columns(save_path)
+    for mode, names in PLOT_COLUMNS.items():
+        if all(name in all_columns for name in names):
+            return mode, all_columns
+    return None, all_columns
+
+
+def first_timestamp(save_path, ncols):
+    """Read the timestamp of the first row of a save file.
+
+    Parameters
+    ----------
+    save_path : str
+        Path to save file.
+    ncols : int
+        Number of columns in the file.
+
+    Returns
+    -------
+    t0 : float or None
+        Timestamp of the first row, or None if the file has no complete rows yet.
+    """
+    with open(save_path, "rb") as f:
+        # header and first row
+        lines = [f.readline() for _ in range(2)]
+    lines = [line.rstrip(b"\r\n") for line in lines if line.endswith(b"\n")]
+    data, _ = parse_lines(lines, usecols=[0], ncols=ncols)
+    return data[0, 0] if len(data) > 0 else None
+
+
+def read_live_data(save_path, mode, all_columns):
+    """Read new rows from a save file into its ring buffer.
+
+    Parameters
+    ----------
+    save_path : str
+        Path to save file.
+    mode : str
+        Acquisition mode the save file was recorded in, see `plot_columns`.
+    all_columns : list of str
+        Column names of the save file.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Most recent timestamp, R, and phase values, with timestamps relative to the
+        first row of the file.
+    total : int
+        Total number of rows read from the file.
+    epoch : int
+        Number of times the file has been truncated or replaced. Rows counted by
+        `total` in different epochs belong to different files.
+    """
+    with live_data_lock:
+        if save_path not in live_data:
+            usecols = [0] + [all_columns.index(name) for name in PLOT_COLUMNS[mode]]
+            live_data[save_path] = {
+                # only the rows that fit in the buffer are read from an existing file
+                "reader": TailReader(
+                    save_path,
+                    usecols=usecols,
+                    ncols=len(all_columns),
+                    tail_rows=LIVE_POINTS,
+                ),
+                "buffer": RingBuffer(LIVE_POINTS, len(usecols)),
+                "t0": None,
+                "epoch": 0,
+            }
+        live = live_data[save_path]
+
+        new_data, reset = live["reader"].read()
+        if reset:
+            live["buffer"].clear()
+            live["t0"] = None
+            live["epoch"] += 1
+        if (live["t0"] is None) and (len(new_data) > 0):
+            live["t0"] = first_timestamp(save_path, len(all_columns))
+        live["buffer"].extend(new_data)
+
+        data = live["buffer"].view().copy()
+        total = live["buffer"].total
+        epoch = live["epoch"]
+        t0 = live["t0"]
+
+    if len(data) > 0:
+        # calc experiment time from timestamp
+        data[:, 0] -= t0
+
+    return data, total, epoch
+
+
+def read_shared_data(live_name, since=0):
+    """Read new rows from the shared memory buffer of a run.
+
+    Parameters
+    ----------
+    live_name : str
+        Name of the shared memory buffer.
+    since : int
+        Total number of rows read from the buffer at the last read.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Timestamp, R, and phase values written since the last read, up to the
+        buffer's capacity, with timestamps relative to the first row of the run.
+    total : int
+        Total number of rows written to the buffer.
+    capacity : int
+        Max number of rows held by the buffer.
+    """
+    with shared_buffers_lock:
+        if live_name not in shared_buffers:
+            # only the current run's buffer is read, so detach from old ones
+            for name in list(shared_buffers):
+                shared_buffers.pop(name).close()
+            shared_buffers[live_name] = SharedRingBuffer.attach(live_name)
+        live = shared_buffers[live_name]
+
+        # runs started from the GUI share rows in the poll mode layout
+        usecols = [0] + [COLUMNS.index(name) for name in PLOT_COLUMNS["poll"]]
+        data, total = live.read(since, usecols)
+        if len(data) > 0:
+            # calc experiment time from timestamp
+            data[:, 0] -= live.t0
+
+        return data, total, live.capacity
+
+
+def read_history(save_path, mode, all_columns, x_range=None, width=PLOT_POINTS):
+    """Summarise a save file over a time range using its zoom index.
+
+    The index is updated with any rows appended since the last read first.
+
+    Parameters
+    ----------
+    save_path : str
+        Path to tsv save file.
+    mode : str
+        Acquisition mode the save file was recorded in, see `plot_columns`.
+    all_columns : list of str
+        Column names of the save file.
+    x_range : list of float or None
+        Start and end of the time range relative to the first row of the file. If
+        None, the whole file is summarised.
+    width : int
+        Max number of points.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Points with timestamps relative to the first row of the file, see
+        `zoomindex.ZoomIndex.query`.
+    level : int
+        Level of the index the points were made from, or -1 for rows.
+    """
+    with zoom_indexes_lock:
+        if save_path not in zoom_indexes:
+            zoom_indexes[save_path] = ZoomIndex(
+                save_path, PLOT_COLUMNS[mode], all_columns=all_columns
+            )
+        index = zoom_indexes[save_path]
+
+    # hold the index's lock so another callback can't update it between these calls
+    with index.lock:
+        index.update()
+
+        time_range = index.time_range()
+        if time_range is None:
+            raise dash.exceptions.PreventUpdate
+        t0 = time_range[0]
+
+        if x_range is None:
+            data, level = index.query(width=width)
+        else:
+            data, level = index.query(t0 + x_range[0], t0 + x_range[1], width)
+    data[:, 0] -= t0
+
+    return data, level
+
+
+def zoom_range(relayout, x_range):
+    """Get the x-axis range of a graph after it was zoomed, panned, or reset.
+
+    Parameters
+    ----------
+    relayout : dict or None
+        `relayoutData` property of the graph.
+    x_range : list of float or None
+        x-axis range before the change, or None if the axis was autoscaled.
+
+    Returns
+    -------
+    x_range : list of float or None
+        x-axis range, or None if the axis is autoscaled.
+    """
+    if relayout is None:
+        return x_range
+    elif "xaxis.range[0]" in relayout:
+        return [relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]]
+    elif "xaxis.range" in relayout:
+        return list(relayout["xaxis.range"])
+    elif relayout.get("xaxis.autorange", False):
+        return None
+    else:
+        # e.g. only the y-axis changed
+        return x_range
+
+
+def format_extension(data, max_points, n_out=None, method="lttb"):
+    """Format data for appending to a graph trace with `extendData`.
 
     Parameters
     ----------
     data : array
         Array of data.
-    fig : dict
-        Dictionary representation of Plotly figure.
+    max_points : int or None
+        Max number of points kept in the trace after extending it. If None, only the
+        points sent are kept, replacing the whole trace.
+    n_out : int or None
+        Max number of points to send. Data with more points are downsampled. If None,
+        all points are sent.
+    method : str
+        Downsampling method, see `downsample.downsample`.
 
     Returns
     -------
-    fig : dict
-        Dictionary representation of Plotly figure.
+    extension : list
+        `extendData` property value.
     """
-    # add data to fig
-    fig["data"][0]["x"] = data[:, 0]
-    fig["data"][0]["y"] = data[:, 1]
-
-    # update ranges
-    fig["layout"]["xaxis"]["range"] = [min(data[:, 0]), max(data[:, 0])]
-    fig["layout"]["yaxis"]["range"] = [min(data[:, 1]), max(data[:, 1])]
-
-    return fig
-
-
-fig_R = plotly.subplots.make_subplots()
-fig_R.add_trace(go.Scatter(x=[], y=[], mode="lines+markers", name="R"))
-fig_R.update_xaxes(
-    title="time (s)",
-    ticks="inside",
-    mirror="ticks",
-    linecolor="#444",
-    showline=True,
-    zeroline=False,
-    showgrid=False,
-    autorange=False,
-)
-fig_R.update_yaxes(
-    title="R (V)",
-    ticks="inside",
-    mirror=True,
-    linecolor="#444",
-    showline=True,
-    zeroline=False,
-    showgrid=False,
-    autorange=False,
-)
-fig_R.update_layout(
-    font={"size": 16}, margin=dict(l=30, r=30, t=30, b=30), plot_bgcolor="rgba(0,0,0,0)"
-)
+    x, y = downsample(data[:, 0], data[:, 1], n_out, method)
+    if max_points is None:
+        # downsampling can send fewer points than requested, so keep exactly the
+        # points sent rather than leaving old points in front of them
+        max_points = len(x)
+    return [{"x": [x.tolist()], "y": [y.tolist()]}, [0], max_points]
 
-fig_phase = plotly.subplots.make_subplots()
-fig_phase.add_trace(go.Scatter(x=[], y=[], mode="lines+markers", name="Phase"))
-fig_phase.update_xaxes(
-    title="time (s)",
-    ticks="inside",
-    mirror="ticks",
-    linecolor="#444",
-    showline=True,
-    zeroline=False,
-    showgrid=False,
-    autorange=False,
-)
-fig_phase.update_yaxes(
-    title="Phase (degrees)",
-    ticks="inside",
-    mirror=True,
-    linecolor="#444",
-    showline=True,
-    zeroline=False,
-    showgrid=False,
-    autorange=False,
-)
-fig_phase.update_layout(
-    font={"size": 16}, margin=dict(l=30, r=30, t=30, b=30), plot_bgcolor="rgba(0,0,0,0)"
+
+def make_figure(name, y_title):
+    """Make an empty live data figure.
+
+    The figure is built as a plain dictionary rather than with plotly's graph objects,
+    which are slow to import and validate, so the app starts quickly.
+
+    Parameters
+    ----------
+    name : str
+        Trace name.
+    y_title : str
+        y-axis title.
+
+    Returns
+    -------
+    figure : dict
+        Figure with one empty trace.
+    """
+    axis = {
+        "ticks": "inside",
+        "linecolor": "#444",
+        "showline": True,
+        "zeroline": False,
+        "showgrid": False,
+        "autorange": True,
+    }
+    return {
+        "data": [
+            {"type": "scatter", "x": [], "y": [], "mode": "lines+markers", "name": name}
+        ],
+        "layout": {
+            "xaxis": {"title": {"text": "time (s)"}, "mirror": "ticks", **axis},
+            "yaxis": {"title": {"text": y_title}, "mirror": True, **axis},
+            "font": {"size": 16},
+            "margin": {"l": 30, "r": 30, "t": 30, "b": 30},
+            "plot_bgcolor": "rgba(0,0,0,0)",
+        },
+    }
+
+
+def make_history_figure(data, level, column, x_range=None):
+    """Make a figure of a save file's history from its zoom index.
+
+    Points summarising several rows are drawn as their mean with a band between
+    their min and max.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Points, see `read_history`.
+    level : int
+        Level of the index the points were made from, or -1 for rows.
+    column : str
+        Name of the column to plot.
+    x_range : list of float or None
+        x-axis range, or None to autoscale the axis.
+
+    Returns
+    -------
+    figure : dict
+        History figure.
+    """
+    figure = make_figure(column, column)
+    i = 2 + 3 * INDEX_COLUMNS.index(column)
+    t = data[:, 0].tolist()
+    mean = {"x": t, "y": data[:, i + 2].tolist(), "mode": "lines"}
+    if level < 0:
+        figure["data"][0].update(mean)
+    else:
+        band = {"type": "scatter", "x": t, "mode": "lines", "showlegend": False}
+        figure["data"] = [
+            {**band, "y": data[:, i + 1].tolist(), "line": {"width": 0}},
+            {
+                **band,
+                "y": data[:, i].tolist(),
+                "line": {"width": 0},
+                "fill": "tonexty",
+                "fillcolor": "rgba(31,119,180,0.3)",
+            },
+            {**figure["data"][0], **mean},
+        ]
+
+    if x_range is not None:
+        figure["layout"]["xaxis"].update({"range": x_range, "autorange": False})
+
+    return figure
+
+
+@functools.lru_cache(maxsize=None)
+def layout():
+    """Build the page layout the first time the page is visited.
+
+    Returns
+    -------
+    layout : list
+        Page layout.
+    """
+    plot_points_input = dbc.FormGroup(
+        [
+            dbc.Label("Plot points"),
+            dbc.Input(
+                id="plot-points",
+                type="number",
+                value=PLOT_POINTS,
+                min=3,
+                step=1,
+                persistence=True,
+                persistence_type="session",
+            ),
+            dbc.Tooltip(
+                "Max number of points drawn in each graph. Longer traces are "
+                + "downsampled.",
+                target="plot-points",
+                placement="bottom",
+            ),
+        ]
+    )
+
+    downsample_method_select = dbc.FormGroup(
+        [
+            dbc.Label("Downsampling method"),
+            dbc.Select(
+                id="downsample-method",
+                value="lttb",
+                options=[
+                    {"label": "Largest triangle three buckets", "value": "lttb"},
+                    {"label": "Min/max", "value": "minmax"},
+                ],
+                persistence=True,
+                persistence_type="session",
+            ),
+            dbc.Tooltip(
+                "Method used to downsample long traces",
+                target="downsample-method",
+                placement="bottom",
+            ),
+        ]
+    )
+
+    history_column_select = dbc.FormGroup(
+        [
+            dbc.Label("History"),
+            dbc.InputGroup(
+                [
+                    dbc.Select(
+                        id="history-column",
+                        value=INDEX_COLUMNS[0],
+                        options=[
+                            {"label": name, "value": name} for name in INDEX_COLUMNS
+                        ],
+                        persistence=True,
+                        persistence_type="session",
+                    ),
+                    dbc.InputGroupAddon(
+                        dbc.Button("Refresh", id="history-refresh", n_clicks=0),
+                        addon_type="append",
+                    ),
+                ]
+            ),
+            dbc.Tooltip(
+                "Column plotted over the whole run. Zoom in to see more detail.",
+                target="history-column",
+                placement="bottom",
+            ),
+        ]
+    )
+
+    fig_R = make_figure("R", "R (V)")
+    fig_phase = make_figure("Phase", "Phase (degrees)")
+    fig_history = make_figure(INDEX_COLUMNS[0], INDEX_COLUMNS[0])
+
+    return [
+        dbc.Row(
+            [
+                dbc.Col(plot_points_input, width=6),
+                dbc.Col(downsample_method_select, width=6),
+            ],
+            form=True,
+        ),
+        dbc.Row(
+            dbc.Col(dcc.Graph(id="R_graph", figure=fig_R, style={"height": "36vh"}))
+        ),
+        dbc.Row(
+            dbc.Col(
+                dcc.Graph(id="phase_graph", figure=fig_phase, style={"height": "36vh"})
+            )
+        ),
+        dbc.Row(dbc.Col(html.Small(id="live-stats", className="text-muted"))),
+        dbc.Row(dbc.Col(history_column_select, width=6), form=True),
+        dbc.Row(
+            dbc.Col(
+                dcc.Graph(
+                    id="history_graph", figure=fig_history, style={"height": "36vh"}
+                )
+            )
+        ),
+        dbc.Row(dbc.Col(html.Small(id="history-stats", className="text-muted"))),
+        # x-axis range of the history graph, or None if autoscaled
+        dcc.Store(id="history-range", storage_type="memory"),
+        # rows of the save file this browser's graphs have been sent
+        dcc.Store(id="live-state", storage_type="memory"),
+        # clicked by assets/live_push.js when the server pushes new data
+        html.Button(id="live-push", n_clicks=0, style={"display": "none"}),
+        dcc.Interval(id="live-fallback", interval=FALLBACK_INTERVAL, n_intervals=0),
+    ]
+
+
+@app.callback(
+    [
+        dash.dependencies.Output("R_graph", "extendData"),
+        dash.dependencies.Output("phase_graph", "extendData"),
+        dash.dependencies.Output("live-state", "data"),
+        dash.dependencies.Output("live-stats", "children"),
+    ],
+    [
+        dash.dependencies.Input("live-push", "n_clicks"),
+        dash.dependencies.Input("live-fallback", "n_intervals"),
+    ],
+    [
+        dash.dependencies.State("live-state", "data"),
+        dash.dependencies.State("save_path", "children"),
+        dash.dependencies.State("live_buffer", "children"),
+        dash.dependencies.State("plot-points", "value"),
+        dash.dependencies.State("downsample-method", "value"),
+    ],
 )
+def update_graph_live(pushes, n, state, save_path, live_name, plot_points, method):
+    """Update graph.
 
+    Updates are triggered by the server pushing a notification of new data, with a
+    slow poll as a fallback.
 
-layout = [
-    dbc.Row(dbc.Col(dcc.Graph(id="R_graph", figure=fig_R, style={"height": "44vh"}))),
-    dbc.Row(
-        dbc.Col(
-            dcc.Graph(id="phase_graph", figure=fig_phase, style={"height": "44vh"},)
-        )
-    ),
-]
+    Only rows this browser hasn't been sent yet are appended to the graphs, keeping
+    the most recent `plot_points` points. When a browser has no data yet, is too far
+    behind, or the save file was replaced, the recent history is sent downsampled
+    and replaces the whole trace.
+
+    Rows of runs started from the GUI are read from the run's shared memory buffer,
+    otherwise they're read from the save file.
+    """
+    t_start = time.perf_counter()
+
+    if len(save_path) == 0:
+        raise dash.exceptions.PreventUpdate
+
+    up_to_date = (
+        (state is not None)
+        and (state["save_path"] == save_path)
+        and (state.get("live_name") == live_name)
+    )
+    if live_name:
+        since = state["total"] if up_to_date else 0
+        new_data, total, capacity = read_shared_data(live_name, since)
+        mode = "poll"
+        epoch = 0
+        available = min(total, capacity)
+        # replace everything in the trace if the browser missed overwritten rows
+        replace = (not up_to_date) or (total - since > len(new_data))
+    else:
+        if not pathlib.Path(save_path).is_file():
+            raise dash.exceptions.PreventUpdate
+        mode, all_columns = plot_columns(save_path)
+        if mode is None:
+            return [dash.no_update, dash.no_update, dash.no_update, NO_PLOT_COLUMNS]
+        data, total, epoch = read_live_data(save_path, mode, all_columns)
+        available = len(data)
+        if (
+            (not up_to_date)
+            or (state["epoch"] != epoch)
+            or (total - state["total"] > len(data))
+        ):
+            new_data = data
+            # replace everything in the trace
+            replace = True
+        else:
+            new_data = data[len(data) - (total - state["total"]) :]
+            replace = False
+
+    if len(new_data) == 0:
+        raise dash.exceptions.PreventUpdate
+
+    n_out = int(plot_points) if plot_points else PLOT_POINTS
+    max_points = None if replace else n_out
+    R_extension = format_extension(new_data[:, [0, 1]], max_points, n_out, method)
+    phase_extension = format_extension(new_data[:, [0, 2]], max_points, n_out, method)
+
+    # measure what this update costs so it can be compared with a full redraw
+    payload = len(json.dumps([R_extension, phase_extension]))
+    sent = len(R_extension[0]["x"][0])
+    full = payload / sent * min(available, n_out)
+    latency = (time.perf_counter() - t_start) * 1000
+    stats = (
+        f"Sent {sent} new points ({payload / 1000:.1f} kB) in {latency:.1f} ms. "
+        + f"Redrawing the whole graphs would send ~{full / 1000:.1f} kB."
+    )
+    if mode == "stream":
+        stats += f" {STREAM_PLOT_NOTE}"
+
+    state = {
+        "save_path": save_path,
+        "live_name": live_name,
+        "epoch": epoch,
+        "total": total,
+    }
+
+    return [R_extension, phase_extension, state, stats]
 
 
 @app.callback(
     [
-        dash.dependencies.Output("R_graph", "figure"),
-        dash.dependencies.Output("phase_graph", "figure"),
+        dash.dependencies.Output("history_graph", "figure"),
+        dash.dependencies.Output("history-range", "data"),
+        dash.dependencies.Output("history-stats", "children"),
     ],
-    [dash.dependencies.Input("interval-component", "n_intervals")],
     [
-        dash.dependencies.State("R_graph", "figure"),
-        dash.dependencies.State("phase_graph", "figure"),
+        dash.dependencies.Input("history_graph", "relayoutData"),
+        dash.dependencies.Input("history-refresh", "n_clicks"),
+        dash.dependencies.Input("history-column", "value"),
+    ],
+    [
+        dash.dependencies.State("history-range", "data"),
         dash.dependencies.State("save_path", "children"),
+        dash.dependencies.State("plot-points", "value"),
     ],
 )
-def update_graph_live(n, R_graph, phase_graph, save_path):
-    """Update graph."""
-    # print(session_data)
-    if len(save_path) != 0:
-        # # load data from save file
-        # data = np.genfromtxt(
-        #     save_path[0], delimiter="\t", skip_header=1, usecols=[0, 7, 8]
-        # )
-        # # calc experiment time from timestamp
-        # data[:, 0] = data[:, 0] - data[0, 0]
-
-        # # update graphs
-        # R_graph = format_figure(data[:, [0, 1]], R_graph)
-        # phase_graph = format_figure(data[:, [0, 2]], phase_graph)
-        pass
-
-    return [R_graph, phase_graph]
+def update_history(relayout, n_clicks, column, x_range, save_path, plot_points):
+    """Update the history graph.
+
+    The graph is redrawn from the save file's zoom index whenever it's zoomed or
+    panned, so the resolution matches the visible time range however long the run.
+    """
+    t_start = time.perf_counter()
+
+    # the index only covers tsv save files
+    if (len(save_path) == 0) or (not pathlib.Path(save_path).is_file()):
+        raise dash.exceptions.PreventUpdate
+
+    mode, all_columns = plot_columns(save_path)
+    if mode is None:
+        return [dash.no_update, dash.no_update, NO_PLOT_COLUMNS]
+
+    x_range = zoom_range(relayout, x_range)
+    width = int(plot_points) if plot_points else PLOT_POINTS
+    data, level = read_history(save_path, mode, all_columns, x_range, width)
+    figure = make_history_figure(data, level, column, x_range)
+
+    latency = (time.perf_counter() - t_start) * 1000
+    resolution = "rows" if level < 0 else f"index level {level}"
+    stats = f"Drew {len(data)} points from {resolution} in {latency:.1f} ms."
+    if mode == "stream":
+        stats += f" {STREAM_PLOT_NOTE}"
+
+    return [figure, x_range, stats]
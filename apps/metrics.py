@@ -0,0 +1,144 @@
+"""Page for monitoring acquisition loop timing metrics."""
+import json
+import time
+
+import dash
+import dash_html_components as html
+import dash_bootstrap_components as dbc
+
+from app import app
+from metrics import metrics_path
+
+
+def read_metrics(save_path):
+    """Read the metrics file exported for a save file.
+
+    Parameters
+    ----------
+    save_path : str
+        Path to save file.
+
+    Returns
+    -------
+    metrics : dict or None
+        Exported metrics, or None if they haven't been exported yet.
+    """
+    try:
+        with open(metrics_path(save_path), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def format_ms(value):
+    """Format a time in s as a string in ms."""
+    if value is None:
+        return "-"
+    return f"{value * 1000:.1f}"
+
+
+def histogram_table(histograms):
+    """Make a table summarising timing histograms.
+
+    Parameters
+    ----------
+    histograms : dict
+        Exported histograms, keyed by name.
+
+    Returns
+    -------
+    table : dbc.Table
+        Table with a row for each histogram.
+    """
+    header = html.Thead(
+        html.Tr(
+            [
+                html.Th(heading)
+                for heading in [
+                    "Phase",
+                    "Count",
+                    "Mean (ms)",
+                    "p50 (ms)",
+                    "p90 (ms)",
+                    "p99 (ms)",
+                    "Max (ms)",
+                ]
+            ]
+        )
+    )
+    rows = [
+        html.Tr(
+            [html.Td(name), html.Td(histogram["count"])]
+            + [
+                html.Td(format_ms(histogram[stat]))
+                for stat in ["mean", "p50", "p90", "p99", "max"]
+            ]
+        )
+        for name, histogram in sorted(histograms.items())
+    ]
+    return dbc.Table([header, html.Tbody(rows)], bordered=True, size="sm")
+
+
+def counter_table(counters, heading="Counter", value_heading="Total"):
+    """Make a table of counters or gauges.
+
+    Parameters
+    ----------
+    counters : dict
+        Exported counters or gauges, keyed by name.
+    heading : str
+        Heading of the name column.
+    value_heading : str
+        Heading of the value column.
+
+    Returns
+    -------
+    table : dbc.Table
+        Table with a row for each counter.
+    """
+    header = html.Thead(html.Tr([html.Th(heading), html.Th(value_heading)]))
+    rows = [
+        html.Tr([html.Td(name.replace("_", " ")), html.Td(value)])
+        for name, value in sorted(counters.items())
+    ]
+    return dbc.Table([header, html.Tbody(rows)], bordered=True, size="sm")
+
+
+layout = [
+    dbc.Row(dbc.Col(html.H4("Measurement phase timings"))),
+    dbc.Row(dbc.Col(html.Div(id="metrics-histograms"))),
+    dbc.Row(dbc.Col(html.H4("Counters"))),
+    dbc.Row(dbc.Col(html.Div(id="metrics-counters"))),
+    dbc.Row(dbc.Col(html.H4("Gauges"))),
+    dbc.Row(dbc.Col(html.Div(id="metrics-gauges"))),
+    dbc.Row(dbc.Col(html.Small(id="metrics-status", className="text-muted"))),
+]
+
+
+@app.callback(
+    [
+        dash.dependencies.Output("metrics-histograms", "children"),
+        dash.dependencies.Output("metrics-counters", "children"),
+        dash.dependencies.Output("metrics-gauges", "children"),
+        dash.dependencies.Output("metrics-status", "children"),
+    ],
+    [dash.dependencies.Input("interval-component", "n_intervals")],
+    [dash.dependencies.State("save_path", "children")],
+)
+def update_metrics(n, save_path):
+    """Update metrics tables from the exported metrics file."""
+    if len(save_path) == 0:
+        raise dash.exceptions.PreventUpdate
+
+    metrics = read_metrics(save_path)
+    if metrics is None:
+        return [], [], [], f"No metrics have been exported to {metrics_path(save_path)}."
+
+    age = time.time() - metrics["time"]
+    return (
+        histogram_table(metrics["histograms"]),
+        counter_table(metrics["counters"]),
+        counter_table(metrics.get("gauges", {}), "Gauge", "Value"),
+        f"Metrics for {metrics['labels'].get('device', 'device')} exported "
+        + f"{age:.0f} s ago.",
+    )
@@ -0,0 +1,37 @@
+// Update the live data graphs when the server pushes a notification of new data, and
+// the start and stop buttons when acquisition starts or stops.
+//
+// Notifications arriving faster than the browser draws are coalesced into one
+// update per animation frame, and none are made while the tab is hidden. The live
+// data page also polls slowly as a fallback, e.g. if the event stream drops.
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+
+    var pending = false;
+
+    function update() {
+        pending = false;
+        // the button only exists while the live data page is shown
+        var button = document.getElementById("live-push");
+        if (button) {
+            button.click();
+        }
+    }
+
+    // the browser reconnects automatically if the stream drops
+    var source = new EventSource("/live-events");
+    source.onmessage = function () {
+        if (!pending) {
+            pending = true;
+            window.requestAnimationFrame(update);
+        }
+    };
+    source.addEventListener("status", function () {
+        var button = document.getElementById("status-push");
+        if (button) {
+            button.click();
+        }
+    });
+})();
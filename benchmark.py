@@ -0,0 +1,367 @@
+"""Benchmark the freerun measurement loop using a simulated lock-in amplifier.
+
+Runs the same measurement and save functions as `freerun.py` against `sim_sr830` and
+reports the throughput in points per second along with the latency distribution of
+each phase of a measurement.
+"""
+import argparse
+import functools
+import math
+import pathlib
+import statistics
+import tempfile
+import time
+
+import yaml
+
+import freerun
+import sim_sr830
+from metrics import summarise
+from settingscache import CachedInstrument
+
+
+def timed(func, samples):
+    """Wrap a function so the duration of each call is recorded.
+
+    Parameters
+    ----------
+    func : callable
+        Function to wrap.
+    samples : list
+        List to append call durations to in s.
+
+    Returns
+    -------
+    wrapper : callable
+        Wrapped function.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        t_start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - t_start)
+
+    return wrapper
+
+
+def run(lia, setup, points, writer, interval=0):
+    """Run the measurement loop for a fixed number of points.
+
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    setup : dict
+        Instrument setup configuration dictionary.
+    points : int
+        Number of points to measure.
+    writer : storage.BufferedWriter
+        Save file writer.
+    interval : float
+        Interval to wait between measurements in s.
+
+    Returns
+    -------
+    phases : dict
+        Latency samples in s for each phase of the loop.
+    settle_cycles : list of int
+        Number of settle cycles needed for each point.
+    settle_times : list of float
+        Time taken by the last settle of each point in s.
+    skipped : int
+        Number of points autogain was skipped for.
+    elapsed : float
+        Total time taken in s.
+    """
+    phases = {
+        "point": [],
+        "custom_autogain": [],
+        "jump_autogain": [],
+        "wait_for_lia_to_settle": [],
+        "auto_gain": [],
+        "measure_multiple": [],
+        "writerow": [],
+    }
+
+    # patch the functions called by the loop with timed versions
+    original = {
+        name: getattr(freerun, name)
+        for name in [
+            "custom_autogain",
+            "jump_autogain",
+            "wait_for_lia_to_settle",
+        ]
+    }
+    for name, func in original.items():
+        setattr(freerun, name, timed(func, phases[name]))
+    lia.auto_gain = timed(lia.auto_gain, phases["auto_gain"])
+    lia.measure_multiple = timed(lia.measure_multiple, phases["measure_multiple"])
+    writerow = timed(writer.writerow, phases["writerow"])
+
+    settle_cycles = []
+    settle_times = []
+    skipped = 0
+    try:
+        t_start = time.perf_counter()
+        for _ in range(points):
+            t_point = time.perf_counter()
+            diagnostics = {}
+            data = freerun.measure_all(
+                lia, setup, setup["settling_timeout"], diagnostics
+            )
+            writerow(data)
+            phases["point"].append(time.perf_counter() - t_point)
+            settle_cycles.append(diagnostics["settle_cycles"])
+            if "settle_time" in diagnostics:
+                settle_times.append(diagnostics["settle_time"])
+            skipped += diagnostics["autogain_skipped"]
+            time.sleep(interval)
+        elapsed = time.perf_counter() - t_start
+    finally:
+        for name, func in original.items():
+            setattr(freerun, name, func)
+        del lia.auto_gain
+        del lia.measure_multiple
+
+    return phases, settle_cycles, settle_times, skipped, elapsed
+
+
+def compare_transfer(lia, bins, repeats=10):
+    """Compare ASCII and binary buffer transfer times.
+
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    bins : int
+        Number of buffer points to read.
+    repeats : int
+        Number of reads with each transfer format.
+
+    Returns
+    -------
+    results : dict
+        Read and reduce times in s for each transfer format.
+    """
+    # fill the buffer
+    rate = lia.sample_rates[lia.sample_rate]
+    lia.reset_data_buffers()
+    lia.start()
+    time.sleep(bins / rate)
+    lia.pause()
+    bins = min(bins, lia.buffer_size)
+
+    results = {}
+    for transfer in ["ascii", "binary"]:
+        results[transfer] = []
+        for _ in range(repeats):
+            t_start = time.perf_counter()
+            freerun.read_buffer(lia, 1, 0, bins, transfer).mean()
+            results[transfer].append(time.perf_counter() - t_start)
+
+    return results
+
+
+def check_settle_step(
+    slopes=(0, 1, 3), time_constant=8, initial=1e-6, final=5e-6, rel_tol=0.01
+):
+    """Check that adaptive settling waits for a step in R to settle.
+
+    For each filter slope the simulated signal steps up and `freerun.adaptive_settle`
+    is called straight away, so it starts in the middle of the step response.
+
+    Parameters
+    ----------
+    slopes : list of int
+        Low-pass filter slope settings to check.
+    time_constant : int
+        Time constant setting.
+    initial : float
+        Signal amplitude before the step in V.
+    final : float
+        Signal amplitude after the step in V.
+    rel_tol : float
+        Relative tolerance passed to `freerun.adaptive_settle`.
+
+    Returns
+    -------
+    results : dict
+        Settled R as a fraction of the final value and the time taken to settle in
+        s for each slope in dB/oct.
+
+    Raises
+    ------
+    AssertionError
+        If the settled R isn't within `rel_tol` of the final value.
+    """
+    step_time = 0.2
+    results = {}
+    for slope in slopes:
+        with sim_sr830.sr830(
+            signal=initial, steps=[(step_time, final)], noise=0.001, seed=0
+        ) as sim:
+            sim.connect()
+            sim.time_constant = time_constant
+            sim.lowpass_filter_slope = slope
+            # smallest range above the final value
+            sim.sensitivity = next(
+                ix for ix, va in enumerate(sim.sensitivities) if final < 0.8 * va
+            )
+            sim.sample_rate = 13
+            time.sleep(max(sim._t0 + step_time - time.time(), 0))
+
+            R, settle_time = freerun.adaptive_settle(sim, 10, rel_tol=rel_tol)
+
+        db_per_oct = sim.lowpass_filter_slopes[slope]
+        results[db_per_oct] = (R / final, settle_time)
+        assert math.isclose(R, final, rel_tol=rel_tol), (
+            f"Settled R is {R / final:.3f} of the final value at {db_per_oct} dB/oct "
+            + f"after {settle_time:.2f} s."
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c",
+        "--config-path",
+        default="example_config.yaml",
+        help="Path to configuration file (yaml format).",
+    )
+    parser.add_argument(
+        "-n", "--points", type=int, default=20, help="Number of points to measure."
+    )
+    parser.add_argument(
+        "--signal", type=float, default=1e-6, help="Initial signal amplitude in V."
+    )
+    parser.add_argument(
+        "--noise", type=float, default=0.01, help="Relative RMS noise on the signal."
+    )
+    parser.add_argument(
+        "--step-every",
+        type=float,
+        default=None,
+        help="Change the signal to a random amplitude every STEP_EVERY seconds.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.002,
+        help="Bus latency per command in s.",
+    )
+    parser.add_argument(
+        "--time-constant",
+        type=int,
+        default=None,
+        help="Override the time constant setting in the configuration file.",
+    )
+    parser.add_argument(
+        "--auto-gain-method",
+        default=None,
+        help="Override the auto-gain method in the configuration file.",
+    )
+    parser.add_argument(
+        "--auto-gain-band",
+        type=float,
+        nargs=2,
+        default=None,
+        metavar=("LOW", "HIGH"),
+        help="Skip autogain while R is within this band, as fractions of full scale.",
+    )
+    parser.add_argument(
+        "--settling-method",
+        default=None,
+        help="Override the settling method in the configuration file.",
+    )
+    parser.add_argument(
+        "--buffer-transfer",
+        default=None,
+        help="Override the buffer transfer format in the configuration file.",
+    )
+    parser.add_argument(
+        "--compare-transfer",
+        type=int,
+        default=None,
+        metavar="BINS",
+        help="Compare ASCII and binary transfer of BINS buffer points and exit.",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Cache instrument settings to skip redundant bus transactions.",
+    )
+    parser.add_argument(
+        "--check-settle",
+        action="store_true",
+        help="Check adaptive settling against a simulated step in R and exit.",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Noise seed.")
+    args = parser.parse_args()
+
+    if args.check_settle:
+        for slope, (fraction, settle_time) in check_settle_step().items():
+            print(
+                f"{slope} dB/oct: R settled to {fraction:.4f} of the final value in "
+                + f"{settle_time:.2f} s"
+            )
+        raise SystemExit
+
+    with open(args.config_path, "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    setup = config["lia"]["setup"]
+    if args.time_constant is not None:
+        setup["time_constant"] = args.time_constant
+    if args.auto_gain_method is not None:
+        setup["auto_gain_method"] = args.auto_gain_method
+    if args.auto_gain_band is not None:
+        setup["auto_gain_band"] = args.auto_gain_band
+    if args.settling_method is not None:
+        setup["settling_method"] = args.settling_method
+    if args.buffer_transfer is not None:
+        setup["buffer_transfer"] = args.buffer_transfer
+
+    with sim_sr830.sr830(
+        signal=args.signal,
+        noise=args.noise,
+        step_every=args.step_every,
+        latency=args.latency,
+        seed=args.seed,
+    ) as sim:
+        lia = CachedInstrument(sim) if args.cache else sim
+        lia.connect(output_interface=setup["output_interface"])
+        freerun.setup_lia(lia, setup)
+
+        if args.compare_transfer is not None:
+            results = compare_transfer(lia, args.compare_transfer)
+            for transfer, samples in results.items():
+                print(f"{transfer} transfer: {summarise(samples)}")
+            raise SystemExit
+
+        with tempfile.TemporaryDirectory() as folder:
+            save_path = pathlib.Path(folder).joinpath("benchmark")
+            freerun.init_save_file(save_path, config.get("output_format", "tsv"))
+            transactions = sim.transactions
+            with freerun.open_writer(save_path, config) as writer:
+                phases, settle_cycles, settle_times, skipped, elapsed = run(
+                    lia, setup, args.points, writer
+                )
+
+        print(f"Measured {args.points} points in {elapsed:.2f} s")
+        print(f"Throughput: {args.points / elapsed:.3f} points/s")
+        transactions = sim.transactions - transactions
+        print(f"Bus transactions: {transactions / args.points:.1f} per point")
+        if args.cache:
+            print(f"Saved by settings cache: {lia.saved / args.points:.1f} per point")
+        print(
+            f"Settle cycles per point: mean={statistics.mean(settle_cycles):.2f}, "
+            + f"max={max(settle_cycles)}"
+        )
+        print(f"Settle time: {summarise(settle_times)}")
+        print(f"Autogain skipped: {skipped} points ({skipped / args.points:.0%})")
+        for name, samples in phases.items():
+            print(f"{name}: {summarise(samples)}")
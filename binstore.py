@@ -0,0 +1,285 @@
+"""Append-only binary storage format for freerun data.
+
+A binary save is a folder of chunk files named `chunk_000000.bin`,
+`chunk_000001.bin`, etc. Each chunk starts with a header:
+
+- 8 byte magic string, `MAGIC`.
+- 4 byte little-endian unsigned int giving the length of the rest of the header.
+- UTF-8 JSON object describing the data, e.g. `{"columns": [...], "dtype": "<f8"}`,
+  padded with spaces so the data starts on a multiple of `ALIGNMENT` bytes.
+
+The header is followed by fixed-width records of one little-endian float64 per
+column. The number of records is given by the file size, so chunks can be appended
+to without rewriting the header and a partly written record at the end of a chunk
+is ignored. Chunks can be read without copying using `numpy.memmap`.
+
+Run this module as a script to convert between tsv and binary saves.
+"""
+import argparse
+import csv
+import json
+import os
+import pathlib
+import struct
+
+import numpy as np
+
+import tsvload
+from storage import COLUMNS, BufferedWriter
+
+MAGIC = b"SR830FR1"
+
+# data offset alignment in bytes
+ALIGNMENT = 64
+
+DTYPE = "<f8"
+
+# default maximum number of records in a chunk
+CHUNK_ROWS = 1_000_000
+
+
+def _chunk_path(path, index):
+    return pathlib.Path(path).joinpath(f"chunk_{index:06d}.bin")
+
+
+def chunk_paths(path):
+    """Get the chunk files of a binary save in order.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to binary save folder.
+
+    Returns
+    -------
+    paths : list of pathlib.Path
+        Paths to chunk files.
+    """
+    return sorted(pathlib.Path(path).glob("chunk_*.bin"))
+
+
+def make_header(columns):
+    """Make a chunk header.
+
+    Parameters
+    ----------
+    columns : list of str
+        Column names.
+
+    Returns
+    -------
+    header : bytes
+        Chunk header.
+    """
+    meta = json.dumps({"columns": list(columns), "dtype": DTYPE}).encode("utf-8")
+    length = len(MAGIC) + 4 + len(meta)
+    meta += b" " * (-length % ALIGNMENT)
+    return MAGIC + struct.pack("<I", len(meta)) + meta
+
+
+def read_header(path):
+    """Read a chunk header.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to chunk file.
+
+    Returns
+    -------
+    meta : dict
+        Header metadata including the column names.
+    offset : int
+        Offset of the first record in bytes.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a freerun binary chunk.")
+        (length,) = struct.unpack("<I", f.read(4))
+        meta = json.loads(f.read(length).decode("utf-8"))
+
+    return meta, len(MAGIC) + 4 + length
+
+
+def open_chunk(path):
+    """Open a chunk file as a read-only memory map.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to chunk file.
+
+    Returns
+    -------
+    data : numpy.memmap or numpy.ndarray
+        Records as a 2D array with one column per save file column.
+    columns : list of str
+        Column names.
+    """
+    meta, offset = read_header(path)
+    ncols = len(meta["columns"])
+    itemsize = np.dtype(meta["dtype"]).itemsize
+    nrows = (os.path.getsize(path) - offset) // (itemsize * ncols)
+    if nrows == 0:
+        # memmap can't map zero bytes
+        return np.empty((0, ncols), dtype=meta["dtype"]), meta["columns"]
+
+    data = np.memmap(
+        path, dtype=meta["dtype"], mode="r", offset=offset, shape=(nrows, ncols)
+    )
+    return data, meta["columns"]
+
+
+def load(path):
+    """Load all records in a binary save.
+
+    A save with one chunk is returned as a memory map without copying. Multiple
+    chunks are concatenated into a new array.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to binary save folder.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Records as a 2D array with one column per save file column.
+    columns : list of str
+        Column names.
+    """
+    chunks = [open_chunk(p) for p in chunk_paths(path)]
+    if len(chunks) == 0:
+        return np.empty((0, len(COLUMNS))), list(COLUMNS)
+    elif len(chunks) == 1:
+        return chunks[0]
+    else:
+        return np.concatenate([data for data, _ in chunks]), chunks[0][1]
+
+
+class BinaryWriter(BufferedWriter):
+    """Append rows to a binary save.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to binary save folder. It's created if it doesn't exist. If it already
+        contains chunks, rows are appended to the last one.
+    columns : list of str
+        Column names.
+    chunk_rows : int
+        Maximum number of records in a chunk before starting a new one.
+    **kwargs
+        Durability policy, see `storage.BufferedWriter`.
+    """
+
+    def __init__(self, path, columns=COLUMNS, chunk_rows=CHUNK_ROWS, **kwargs):
+        super().__init__(**kwargs)
+        self.path = pathlib.Path(path)
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+        self._record_size = np.dtype(DTYPE).itemsize * len(self.columns)
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        paths = chunk_paths(self.path)
+        if len(paths) > 0:
+            meta, offset = read_header(paths[-1])
+            if meta["columns"] != self.columns:
+                raise ValueError(
+                    f"Columns of {paths[-1]} don't match: {meta['columns']}."
+                )
+            self._index = len(paths) - 1
+            # drop any partly written record
+            size = os.path.getsize(paths[-1])
+            self._chunk_count = (size - offset) // self._record_size
+            self._f = open(paths[-1], "r+b")
+            self._f.truncate(offset + self._chunk_count * self._record_size)
+            self._f.seek(0, os.SEEK_END)
+        else:
+            self._index = -1
+            self._f = None
+            self._new_chunk()
+
+    def _new_chunk(self):
+        if self._f is not None:
+            self._flush_file()
+            self._f.close()
+        self._index += 1
+        self._chunk_count = 0
+        self._f = open(_chunk_path(self.path, self._index), "wb")
+        self._f.write(make_header(self.columns))
+
+    def _write_rows(self, rows):
+        data = np.asarray(rows, dtype=DTYPE).reshape(-1, len(self.columns))
+        while len(data) > 0:
+            if self._chunk_count >= self.chunk_rows:
+                self._new_chunk()
+            n = self.chunk_rows - self._chunk_count
+            self._f.write(data[:n].tobytes())
+            self._chunk_count += len(data[:n])
+            data = data[n:]
+
+    def _flush_file(self):
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+    def _close_file(self):
+        self._f.close()
+
+
+def tsv_to_binary(tsv_path, binary_path, block_rows=10000, **kwargs):
+    """Convert a tsv save file to a binary save.
+
+    Parameters
+    ----------
+    tsv_path : str or pathlib.Path
+        Path to tsv save file.
+    binary_path : str or pathlib.Path
+        Path to binary save folder.
+    block_rows : int
+        Number of rows to convert at a time.
+    **kwargs
+        Keyword arguments passed to `BinaryWriter`.
+    """
+    columns, _ = tsvload.read_columns(tsv_path)
+    with BinaryWriter(
+        binary_path, columns=columns, flush_rows=block_rows, **kwargs
+    ) as writer:
+        for block in tsvload.read_blocks(tsv_path):
+            writer.writerows(block)
+
+
+def binary_to_tsv(binary_path, tsv_path):
+    """Convert a binary save to a tsv save file.
+
+    Parameters
+    ----------
+    binary_path : str or pathlib.Path
+        Path to binary save folder.
+    tsv_path : str or pathlib.Path
+        Path to tsv save file.
+    """
+    with open(tsv_path, "w", newline="\n") as f:
+        writer = csv.writer(f, delimiter="\t")
+        for i, path in enumerate(chunk_paths(binary_path)):
+            data, columns = open_chunk(path)
+            if i == 0:
+                writer.writerow(columns)
+            writer.writerows(data.tolist())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert between tsv and binary freerun saves."
+    )
+    parser.add_argument("direction", choices=["to-binary", "to-tsv"])
+    parser.add_argument("source", help="Path to the save to convert.")
+    parser.add_argument("destination", help="Path for the converted save.")
+    args = parser.parse_args()
+
+    if args.direction == "to-binary":
+        tsv_to_binary(args.source, args.destination)
+    else:
+        binary_to_tsv(args.source, args.destination)
@@ -0,0 +1,117 @@
+"""Coordinate access to instruments sharing a bus."""
+import contextlib
+import threading
+
+# locks for each bus, keyed by bus name
+_bus_locks = {}
+_registry_lock = threading.Lock()
+
+
+def bus_name(resource_name):
+    """Get the name of the bus an instrument is connected to.
+
+    Parameters
+    ----------
+    resource_name : str
+        VISA resource name, e.g. "GPIB0::5::INSTR".
+
+    Returns
+    -------
+    name : str
+        Bus name, e.g. "GPIB0". Resources with no board prefix share one bus.
+    """
+    return resource_name.split("::")[0].upper()
+
+
+def get_bus_lock(resource_name):
+    """Get the lock shared by all instruments on the same bus.
+
+    Parameters
+    ----------
+    resource_name : str
+        VISA resource name.
+
+    Returns
+    -------
+    lock : threading.RLock
+        Bus lock.
+    """
+    name = bus_name(resource_name)
+    with _registry_lock:
+        if name not in _bus_locks:
+            _bus_locks[name] = threading.RLock()
+        return _bus_locks[name]
+
+
+class LockedInstrument:
+    """Proxy for an instrument that holds a bus lock during every transaction.
+
+    Attribute reads and writes, e.g. instrument settings, and method calls are each
+    made while holding the lock. The lock is released between calls, so other
+    instruments on the bus can be used while this one is idle, e.g. while waiting
+    for it to settle. Attributes that are themselves objects with methods, such as
+    the raw VISA resource, are wrapped too. Use `transaction` to hold the lock across
+    several calls, e.g. a raw query and reading its response.
+
+    Parameters
+    ----------
+    instrument : object
+        Instrument object.
+    lock : threading.RLock
+        Bus lock.
+    """
+
+    def __init__(self, instrument, lock):
+        object.__setattr__(self, "_instrument", instrument)
+        object.__setattr__(self, "_lock", lock)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Hold the bus lock for the duration of the context."""
+        with self._lock:
+            yield
+
+    def __getattr__(self, name):
+        """Get an attribute of the instrument while holding the bus lock."""
+        with self._lock:
+            value = getattr(self._instrument, name)
+
+        if callable(value):
+
+            def locked(*args, **kwargs):
+                with self._lock:
+                    return value(*args, **kwargs)
+
+            return locked
+        elif hasattr(value, "write"):
+            # raw resource
+            return LockedInstrument(value, self._lock)
+        else:
+            return value
+
+    def __setattr__(self, name, value):
+        """Set an attribute of the instrument while holding the bus lock."""
+        with self._lock:
+            setattr(self._instrument, name, value)
+
+    def __delattr__(self, name):
+        """Delete an attribute of the instrument."""
+        delattr(self._instrument, name)
+
+
+def transaction(instrument):
+    """Hold an instrument's bus lock, if it has one, for the duration of a context.
+
+    Parameters
+    ----------
+    instrument : object
+        Instrument object, which may be wrapped in a `LockedInstrument`.
+
+    Returns
+    -------
+    context : context manager
+        Context that holds the bus lock, or does nothing if the instrument isn't
+        locked.
+    """
+    locked = getattr(instrument, "transaction", None)
+    return contextlib.nullcontext() if locked is None else locked()
@@ -0,0 +1,238 @@
+"""Compress measured traces by storing only the rows needed to reconstruct them."""
+import math
+
+from storage import COLUMNS
+
+
+def column_tolerances(tolerances, columns=COLUMNS):
+    """Map column names to column indices in a dictionary of tolerances.
+
+    Parameters
+    ----------
+    tolerances : dict
+        Absolute tolerances keyed by column name.
+    columns : list of str
+        Column names of the rows.
+
+    Returns
+    -------
+    tolerances : dict
+        Absolute tolerances keyed by column index.
+    """
+    indices = {}
+    for name, tolerance in tolerances.items():
+        if name not in columns:
+            raise ValueError(f"Invalid column: {name}. Must be one of {columns}.")
+        if tolerance <= 0:
+            raise ValueError(
+                f"Invalid tolerance for {name}: {tolerance}. Must be greater than 0."
+            )
+        indices[columns.index(name)] = tolerance
+    return indices
+
+
+class Compressor:
+    """Base class for compressors that decide which rows to store.
+
+    Rows are passed to `add` in time order, which returns the rows to store, possibly
+    including earlier rows held back until a later row showed they're needed. Rows
+    still held when the trace ends are returned by `finish`. Subclasses implement
+    `_add`.
+
+    Parameters
+    ----------
+    tolerances : dict
+        Absolute tolerances keyed by column index. Columns without a tolerance are
+        ignored when deciding which rows to store. Column 0 must be the timestamp.
+    """
+
+    def __init__(self, tolerances):
+        self.tolerances = tolerances
+        # number of rows added and stored
+        self.rows_in = 0
+        self.rows_out = 0
+        self._held = None
+
+    @property
+    def ratio(self):
+        """Compression ratio, i.e. rows added per row stored."""
+        return self.rows_in / self.rows_out if self.rows_out > 0 else math.nan
+
+    def add(self, row):
+        """Add a row.
+
+        Parameters
+        ----------
+        row : list
+            Row of data.
+
+        Returns
+        -------
+        rows : list of list
+            Rows to store.
+        """
+        self.rows_in += 1
+        rows = self._add(row)
+        self.rows_out += len(rows)
+        return rows
+
+    def finish(self):
+        """End the trace.
+
+        Returns
+        -------
+        rows : list of list
+            The last row, if it hasn't been stored, so the end of the trace is kept.
+        """
+        rows = [] if self._held is None else [self._held]
+        self._held = None
+        self.rows_out += len(rows)
+        return rows
+
+    def summary(self):
+        """Summarise the compression achieved.
+
+        Returns
+        -------
+        summary : str
+            Numbers of rows added and stored and the compression ratio.
+        """
+        return (
+            f"Stored {self.rows_out} of {self.rows_in} rows, compression ratio "
+            + f"{self.ratio:.1f}:1"
+        )
+
+    def _add(self, row):
+        raise NotImplementedError
+
+
+class DeadbandCompressor(Compressor):
+    """Store a row when any column moves outside a deadband around the last stored row.
+
+    Parameters
+    ----------
+    tolerances : dict
+        Half-widths of the deadbands keyed by column index.
+    """
+
+    def __init__(self, tolerances):
+        super().__init__(tolerances)
+        self._stored = None
+
+    def _add(self, row):
+        if (self._stored is None) or any(
+            abs(row[i] - self._stored[i]) > tolerance
+            for i, tolerance in self.tolerances.items()
+        ):
+            self._stored = row
+            self._held = None
+            return [row]
+
+        self._held = row
+        return []
+
+
+class SwingingDoorCompressor(Compressor):
+    """Store only the rows needed to reconstruct each column by linear interpolation.
+
+    This is a variant of the swinging door algorithm. Each row skipped since the last
+    stored row, the pivot, limits the slopes of lines from the pivot that pass within
+    the tolerance of it, like a pair of doors hinged at the pivot. A row is skipped
+    while the line from the pivot to it, in every column, stays between the doors of
+    the rows skipped before it. Otherwise the previous row is stored and becomes the
+    new pivot. Interpolating linearly between stored rows then reproduces every row
+    within the tolerance of each column. Rows are stored one row late, once the next
+    row shows they're needed.
+
+    Parameters
+    ----------
+    tolerances : dict
+        Absolute tolerances keyed by column index.
+    """
+
+    def __init__(self, tolerances):
+        super().__init__(tolerances)
+        self._pivot = None
+        self._open_doors()
+
+    def _open_doors(self):
+        """Open the doors fully, i.e. no rows have been skipped since the pivot."""
+        self._upper = {i: -math.inf for i in self.tolerances}
+        self._lower = {i: math.inf for i in self.tolerances}
+
+    def _add(self, row):
+        if self._pivot is None:
+            # the first row
+            self._pivot = row
+            return [row]
+
+        last = self._pivot if self._held is None else self._held
+        if row[0] <= last[0]:
+            # timestamps went backwards, e.g. the clock was adjusted, so store the
+            # held row to keep the trace before it and start again from here
+            rows = [] if self._held is None else [self._held]
+            self._pivot = row
+            self._held = None
+            self._open_doors()
+            return rows + [row]
+
+        if self._held is None:
+            self._held = row
+            return []
+
+        # narrow the doors to include the held row, which is skipped if this row is
+        held = self._held
+        dt_held = held[0] - self._pivot[0]
+        dt = row[0] - self._pivot[0]
+        upper = {}
+        lower = {}
+        closed = False
+        for i, tolerance in self.tolerances.items():
+            change = held[i] - self._pivot[i]
+            upper[i] = max(self._upper[i], (change - tolerance) / dt_held)
+            lower[i] = min(self._lower[i], (change + tolerance) / dt_held)
+            slope = (row[i] - self._pivot[i]) / dt
+            closed = closed or (slope < upper[i]) or (slope > lower[i])
+
+        if closed:
+            # the held row is needed, so store it and pivot on it
+            self._pivot = held
+            self._open_doors()
+            self._held = row
+            return [held]
+
+        self._upper = upper
+        self._lower = lower
+        self._held = row
+        return []
+
+
+# available compression methods
+COMPRESSORS = {"deadband": DeadbandCompressor, "swinging_door": SwingingDoorCompressor}
+
+
+def make_compressor(method, tolerances, columns=COLUMNS):
+    """Make a compressor.
+
+    Parameters
+    ----------
+    method : str
+        Compression method, "deadband" or "swinging_door".
+    tolerances : dict
+        Absolute tolerances keyed by column name.
+    columns : list of str
+        Column names of the rows.
+
+    Returns
+    -------
+    compressor : Compressor
+        Compressor.
+    """
+    try:
+        compressor_class = COMPRESSORS[method]
+    except KeyError:
+        raise ValueError(
+            f"Invalid compression method: {method}. Must be one of "
+            + f"{list(COMPRESSORS)}."
+        )
+    return compressor_class(column_tolerances(tolerances, columns))
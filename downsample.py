@@ -0,0 +1,142 @@
+"""Reduce the number of points in a trace for plotting while keeping its shape."""
+import numpy as np
+
+
+def minmax(x, y, n_out):
+    """Downsample a trace by keeping the min and max of each bucket.
+
+    Points are split into `n_out` / 2 buckets of equal size and the minimum and
+    maximum points of each bucket are kept in time order, so peaks and glitches
+    survive.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        x values, sorted.
+    y : numpy.ndarray
+        y values.
+    n_out : int
+        Target number of points.
+
+    Returns
+    -------
+    x : numpy.ndarray
+        Downsampled x values.
+    y : numpy.ndarray
+        Downsampled y values.
+    """
+    n = len(x)
+    buckets = n_out // 2
+    if (n <= n_out) or (buckets < 1):
+        return x, y
+
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    # the last bucket may be all padding if n is only just over a multiple of size
+    valid = ~np.all(np.isnan(padded), axis=1)
+    padded = padded[valid]
+
+    offsets = np.arange(buckets)[valid] * size
+    i_min = np.nanargmin(padded, axis=1) + offsets
+    i_max = np.nanargmax(padded, axis=1) + offsets
+    idx = np.sort(np.concatenate((i_min, i_max)))
+    idx = idx[np.concatenate(([True], idx[1:] != idx[:-1]))]
+
+    return x[idx], y[idx]
+
+
+def lttb(x, y, n_out):
+    """Downsample a trace with the largest-triangle-three-buckets algorithm.
+
+    The first and last points are kept and the rest are split into `n_out` - 2
+    buckets. From each bucket the point forming the largest triangle with the point
+    kept from the previous bucket and the mean of the next bucket is kept.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        x values, sorted.
+    y : numpy.ndarray
+        y values.
+    n_out : int
+        Target number of points.
+
+    Returns
+    -------
+    x : numpy.ndarray
+        Downsampled x values.
+    y : numpy.ndarray
+        Downsampled y values.
+    """
+    n = len(x)
+    if (n <= n_out) or (n_out < 3):
+        return x, y
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # bucket edges for points between the first and last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    # bucket means from cumulative sums
+    cx = np.concatenate(([0], np.cumsum(x)))
+    cy = np.concatenate(([0], np.cumsum(y)))
+    counts = edges[1:] - edges[:-1]
+    mean_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    mean_y = (cy[edges[1:]] - cy[edges[:-1]]) / counts
+    # the last point acts as the next bucket of the last bucket
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    idx = np.empty(n_out, dtype=int)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - mean_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (mean_y[i] - y[a])
+        )
+        a = lo + np.argmax(area)
+        idx[i + 1] = a
+
+    return x[idx], y[idx]
+
+
+# available downsampling methods
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def downsample(x, y, n_out, method="lttb"):
+    """Downsample a trace.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        x values, sorted.
+    y : numpy.ndarray
+        y values.
+    n_out : int or None
+        Target number of points. If None, the trace is returned unchanged.
+    method : str
+        Downsampling method, "lttb" or "minmax".
+
+    Returns
+    -------
+    x : numpy.ndarray
+        Downsampled x values.
+    y : numpy.ndarray
+        Downsampled y values.
+    """
+    if n_out is None:
+        return x, y
+
+    try:
+        return METHODS[method](x, y, n_out)
+    except KeyError:
+        raise ValueError(
+            f"Invalid downsampling method: {method}. Must be one of {list(METHODS)}."
+        )
@@ -1,29 +1,113 @@
 """Perform free-running measurements with an SRS SR830 lock-in amplifier."""
 import argparse
-import csv
 import math
 import pathlib
-import statistics
+import threading
 import time
 
-import sr830
+import numpy as np
 import yaml
 
-parser = argparse.ArgumentParser()
-parser.add_argument(
-    "-c",
-    "--config-path",
-    default="example_config.yaml",
-    help="Path to configuration file (yaml format).",
-)
-parser.add_argument(
-    "-s", "--save-path", default="temp.tsv", help="Path for save file (tsv format).",
-)
-args = parser.parse_args()
+from binstore import BinaryWriter
+from buslock import LockedInstrument, get_bus_lock, transaction
+from compression import column_tolerances, make_compressor
+from metrics import NULL_METRICS, Metrics, MetricsExporter, metrics_path
+from onlinestats import RunningStats
+from rollups import Rollups
+from scheduler import AdaptiveInterval, DeadlineScheduler
+from settingscache import CachedInstrument
+from storage import COLUMNS, STREAM_COLUMNS, QueuedWriter, TSVWriter
 
+# number of time constants needed to settle to within 1 % of a step for each low-pass
+# filter slope in dB/oct (see instrument manual)
+SETTLE_TIME_CONSTANTS = {6: 5, 12: 7, 18: 9, 24: 10}
 
-def wait_for_lia_to_settle(lockin, timeout):
-    """Wait for lock-in amplifier to settle.
+# number of points a data buffer can hold
+BUFFER_LENGTH = 16383
+
+# minimum number of points in each block of samples when settling adaptively
+MIN_BLOCK_SAMPLES = 8
+
+# fraction of the filter's expected settle time that must pass before consecutive
+# blocks are compared when settling adaptively, since blocks taken early in the step
+# response can agree by chance
+MIN_SETTLE_FRACTION = 0.5
+
+# bits of the LIA status byte set by an input, time constant filter, or output
+# overload (see instrument manual)
+OVERLOAD_BITS = 0b111
+
+
+def read_buffer(lockin, channel, start_bin, bins, transfer="ascii"):
+    """Read points stored in a lock-in amplifier data buffer.
+
+    Parameters
+    ----------
+    lockin : lock-in amplifier object
+        Lock-in amplifier object.
+    channel : int
+        Channel buffer to read, 1 or 2.
+    start_bin : int
+        Index of first point to read.
+    bins : int
+        Number of points to read.
+    transfer : str
+        Transfer format. "ascii" reads the buffer with `get_ascii_buffer_data` (TRCA).
+        "binary" reads IEEE floats (TRCB), which are 4 bytes per point instead of ~15
+        and need no parsing.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Buffer data.
+    """
+    if transfer == "ascii":
+        return np.asarray(
+            lockin.get_ascii_buffer_data(channel, start_bin, bins), dtype=float
+        )
+    elif transfer == "binary":
+        if bins == 0:
+            return np.empty(0)
+        # TRCB sends little-endian IEEE floats with no header or terminator. The bus
+        # is held until the response is read so another instrument can't be
+        # addressed in between.
+        with transaction(lockin):
+            lockin.instr.write(f"TRCB?{channel},{start_bin},{bins}")
+            raw = lockin.instr.read_bytes(4 * bins)
+        return np.frombuffer(raw, dtype="<f4").astype(float)
+    else:
+        raise ValueError(
+            f"Invalid buffer transfer format: {transfer}. Must be 'ascii' or 'binary'."
+        )
+
+
+def sample_R(lockin, duration=0.1, transfer="ascii"):
+    """Sample R into the data buffer and return the mean.
+
+    Parameters
+    ----------
+    lockin : lock-in amplifier object
+        Lock-in amplifier object.
+    duration : float
+        Time to sample for in s.
+    transfer : str
+        Buffer transfer format, see `read_buffer`.
+
+    Returns
+    -------
+    R : float
+        Mean sampled R value.
+    """
+    lockin.reset_data_buffers()
+    lockin.start()
+    time.sleep(duration)
+    lockin.pause()
+    R = read_buffer(lockin, 1, 0, lockin.buffer_size, transfer)
+    return R.mean()
+
+
+def fixed_settle(lockin, timeout, transfer="ascii", metrics=NULL_METRICS):
+    """Wait for lock-in amplifier to settle by comparing consecutive 0.1 s samples.
 
     Parameters
     ----------
@@ -31,6 +115,10 @@ def wait_for_lia_to_settle(lockin, timeout):
         Lock-in amplifier object.
     timeout : float
         Maximum time to wait for lock-in to settle before moving on.
+    transfer : str
+        Buffer transfer format, see `read_buffer`.
+    metrics : metrics.Metrics, optional
+        Metrics registry that settle iterations and timeouts are counted in.
 
     Returns
     -------
@@ -38,28 +126,20 @@ def wait_for_lia_to_settle(lockin, timeout):
         Mean sampled R value after settling. Taking the mean of a sample reduces
         influence of noise.
     """
-    lockin.reset_data_buffers()
-    lockin.start()
-    time.sleep(0.1)
-    lockin.pause()
-    R = lockin.get_ascii_buffer_data(1, 0, lockin.buffer_size)
-    old_mean_R = statistics.mean(R)
+    old_mean_R = sample_R(lockin, transfer=transfer)
     # if first measurement is way below the range, don't wait to settle
     if old_mean_R * 100 > lockin.sensitivities[lockin.sensitivity]:
         t_start = time.time()
         while True:
             if time.time() - t_start > timeout:
                 print("Timed out waiting for signal to settle.")
+                metrics.inc("settle_timeouts")
                 # init new_mean_R in case timeout is 0
                 new_mean_R = old_mean_R
                 break
             else:
-                lockin.reset_data_buffers()
-                lockin.start()
-                time.sleep(0.1)
-                lockin.pause()
-                R = lockin.get_ascii_buffer_data(1, 0, lockin.buffer_size)
-                new_mean_R = statistics.mean(R)
+                new_mean_R = sample_R(lockin, transfer=transfer)
+                metrics.inc("settle_iterations")
                 if math.isclose(old_mean_R, new_mean_R, rel_tol=0.1):
                     break
                 old_mean_R = new_mean_R
@@ -69,7 +149,197 @@ def wait_for_lia_to_settle(lockin, timeout):
     return new_mean_R
 
 
-def custom_autogain(lia, timeout):
+def expected_settle_time(lockin):
+    """Calculate the time taken for the lock-in output to settle after a step.
+
+    Parameters
+    ----------
+    lockin : lock-in amplifier object
+        Lock-in amplifier object.
+
+    Returns
+    -------
+    settle_time : float
+        Time for the output to settle to within 1 % of its final value in s.
+    """
+    time_constant = lockin.time_constants[lockin.time_constant]
+    slope = lockin.lowpass_filter_slopes[lockin.lowpass_filter_slope]
+    return SETTLE_TIME_CONSTANTS[slope] * time_constant
+
+
+def detrended_variance(values):
+    """Calculate the variance of samples about their least-squares straight line.
+
+    A signal that's still settling ramps across a block of samples, which would
+    otherwise inflate the variance and make blocks look noisier than they are.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Samples in time order.
+
+    Returns
+    -------
+    variance : float
+        Variance of the residuals from the straight line.
+    """
+    n = len(values)
+    if n < 3:
+        return 0.0
+    x = np.arange(n)
+    residuals = values - np.polyval(np.polyfit(x, values, 1), x)
+    return (residuals ** 2).sum() / (n - 2)
+
+
+def adaptive_settle(
+    lockin, timeout, transfer="ascii", z=3, rel_tol=0.01, metrics=NULL_METRICS
+):
+    """Wait for lock-in amplifier to settle using the low-pass filter settings.
+
+    R streams continuously into the data buffer and is read out in blocks lasting one
+    time constant (or long enough to hold `MIN_BLOCK_SAMPLES` points). Each block is
+    reduced with `RunningStats`. Once `MIN_SETTLE_FRACTION` of the filter's expected
+    settle time has passed, the signal is considered settled as soon as the means of
+    consecutive blocks agree within `z` standard errors of the noise, i.e. the
+    variance about each block's trend, or within a tolerance that leaves R within
+    `rel_tol` of its final value as the filter response decays. Otherwise it's
+    considered settled once a whole block has been taken after the expected settle
+    time.
+
+    Parameters
+    ----------
+    lockin : lock-in amplifier object
+        Lock-in amplifier object.
+    timeout : float
+        Maximum time to wait for lock-in to settle before moving on.
+    transfer : str
+        Buffer transfer format, see `read_buffer`.
+    z : float
+        Number of standard errors within which consecutive block means must agree.
+    rel_tol : float
+        Relative tolerance within which consecutive block means must agree.
+    metrics : metrics.Metrics, optional
+        Metrics registry that settle iterations and timeouts are counted in.
+
+    Returns
+    -------
+    R : float
+        Mean R value of the last block.
+    settle_time : float
+        Time taken to settle in s.
+    """
+    time_constant = lockin.time_constants[lockin.time_constant]
+    rate = lockin.sample_rates[lockin.sample_rate]
+    block_time = max(time_constant, MIN_BLOCK_SAMPLES / rate)
+    min_settle_time = MIN_SETTLE_FRACTION * expected_settle_time(lockin)
+    # the last block lies wholly after the expected settle time
+    max_settle_time = expected_settle_time(lockin) + block_time
+    # the remaining error shrinks by at least this fraction from one block to the next
+    # in the tail of the step response, so the difference between consecutive block
+    # means bounds the error of the last one
+    tol = rel_tol * (1 - math.exp(-block_time / time_constant))
+
+    t_start = time.time()
+    lockin.reset_data_buffers()
+    lockin.start()
+    try:
+        read = 0
+        old = None
+        while True:
+            time.sleep(block_time)
+            stored = lockin.buffer_size
+            block = read_buffer(lockin, 1, read, stored - read, transfer)
+            new = RunningStats()
+            new.update_many(block)
+            new_variance = detrended_variance(block)
+            read = stored
+            settle_time = time.time() - t_start
+            metrics.inc("settle_iterations")
+
+            if read + 2 * block_time * rate > BUFFER_LENGTH:
+                # start again before the buffer fills up
+                lockin.reset_data_buffers()
+                lockin.start()
+                read = 0
+
+            if (
+                (settle_time >= min_settle_time)
+                and (old is not None)
+                and (old.n > 0)
+                and (new.n > 0)
+            ):
+                standard_error = math.sqrt(old_variance / old.n + new_variance / new.n)
+                if abs(new.mean - old.mean) <= max(
+                    z * standard_error, tol * abs(new.mean)
+                ):
+                    break
+
+            if settle_time >= max_settle_time:
+                break
+            elif settle_time > timeout:
+                print("Timed out waiting for signal to settle.")
+                metrics.inc("settle_timeouts")
+                break
+
+            old = new
+            old_variance = new_variance
+    finally:
+        lockin.pause()
+
+    return new.mean, settle_time
+
+
+def wait_for_lia_to_settle(
+    lockin,
+    timeout,
+    transfer="ascii",
+    method="fixed",
+    diagnostics=None,
+    metrics=NULL_METRICS,
+):
+    """Wait for lock-in amplifier to settle.
+
+    Parameters
+    ----------
+    lockin : lock-in amplifier object
+        Lock-in amplifier object.
+    timeout : float
+        Maximum time to wait for lock-in to settle before moving on.
+    transfer : str
+        Buffer transfer format, see `read_buffer`.
+    method : str
+        Settling method. "fixed" uses `fixed_settle`, "adaptive" uses
+        `adaptive_settle`.
+    diagnostics : dict, optional
+        If given, the time taken to settle in s is stored under "settle_time".
+    metrics : metrics.Metrics, optional
+        Metrics registry that the time taken to settle is recorded in.
+
+    Returns
+    -------
+    R : float
+        Mean sampled R value after settling. Taking the mean of a sample reduces
+        influence of noise.
+    """
+    t_start = time.time()
+    with metrics.time("settle"):
+        if method == "fixed":
+            R = fixed_settle(lockin, timeout, transfer, metrics=metrics)
+            settle_time = time.time() - t_start
+        elif method == "adaptive":
+            R, settle_time = adaptive_settle(lockin, timeout, transfer, metrics=metrics)
+        else:
+            raise ValueError(
+                f"Invalid settling method: {method}. Must be 'fixed' or 'adaptive'."
+            )
+
+    if diagnostics is not None:
+        diagnostics["settle_time"] = settle_time
+
+    return R
+
+
+def custom_autogain(lia, timeout, **settle_kwargs):
     """Find optimal gain setting.
 
     Parameters
@@ -78,7 +348,15 @@ def custom_autogain(lia, timeout):
         Lock-in amplifier object.
     timeout : float
         Maximum time to wait for lock-in to settle before moving on.
+    **settle_kwargs
+        Keyword arguments passed to `wait_for_lia_to_settle`.
+
+    Returns
+    -------
+    settle_cycles : int
+        Number of times the lock-in was left to settle.
     """
+    settle_cycles = 0
     while True:
         # get current sensitivity (both int and V/A)
         old_sensitivity = lia.sensitivity
@@ -86,7 +364,8 @@ def custom_autogain(lia, timeout):
 
         # adjust sensitivity if R is not within 20 - 80 % of current range and not at
         # one high or low limit
-        R = wait_for_lia_to_settle(lia, timeout)
+        R = wait_for_lia_to_settle(lia, timeout, **settle_kwargs)
+        settle_cycles += 1
         if (R >= old_sensitivity_va * 0.8) and (old_sensitivity < 26):
             new_sensitivity = old_sensitivity + 1
         elif (R <= 0.2 * old_sensitivity_va) and (old_sensitivity > 0):
@@ -98,66 +377,271 @@ def custom_autogain(lia, timeout):
 
         # update sensitivity
         lia.sensitivity = new_sensitivity
+        settle_kwargs.get("metrics", NULL_METRICS).inc("sensitivity_changes")
+
+    return settle_cycles
+
+
+def jump_autogain(lia, timeout, **settle_kwargs):
+    """Find optimal gain setting by jumping directly to the best range.
+
+    The settled R value is used to look up the sensitivity that puts R within 20 - 80
+    % of full scale, so most points need only one or two settle cycles. If R is at
+    full scale or the LIA status byte reports an overload, e.g. of the dynamic
+    reserve, R can't be trusted, so the sensitivity is stepped up a decade at a time
+    until the overload clears, or bisected between the overloaded setting and the
+    last setting known not to overload.
+
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    timeout : float
+        Maximum time to wait for lock-in to settle before moving on.
+    **settle_kwargs
+        Keyword arguments passed to `wait_for_lia_to_settle`.
 
+    Returns
+    -------
+    settle_cycles : int
+        Number of times the lock-in was left to settle.
+    """
+    max_sensitivity = len(lia.sensitivities) - 1
+    sensitivity = lia.sensitivity
+    # highest setting known to overload and lowest setting known not to
+    overloaded = -1
+    not_overloaded = None
+
+    settle_cycles = 0
+    # the search can't visit more settings than there are
+    for _ in range(max_sensitivity + 1):
+        full_scale = lia.sensitivities[sensitivity]
+        R = wait_for_lia_to_settle(lia, timeout, **settle_kwargs)
+        settle_cycles += 1
+        # discard overloads latched while changing range and settling, so only
+        # current ones are reported
+        read_overload(lia)
 
-def measure_all(lia, config, timeout):
+        if (R >= full_scale) or read_overload(lia):
+            overloaded = sensitivity
+            if sensitivity == max_sensitivity:
+                break
+            elif not_overloaded is None:
+                # bracket upwards by a decade
+                new_sensitivity = min(sensitivity + 3, max_sensitivity)
+            else:
+                # bisect
+                new_sensitivity = (overloaded + not_overloaded + 1) // 2
+        else:
+            not_overloaded = sensitivity
+            if 0.2 * full_scale < R < 0.8 * full_scale:
+                break
+
+            # lowest range with R below 80 % of full scale, which is always above 20
+            # % because consecutive ranges differ by no more than a factor of 2.5
+            new_sensitivity = next(
+                (ix for ix, va in enumerate(lia.sensitivities) if R < 0.8 * va),
+                max_sensitivity,
+            )
+            # don't go back to a setting known to overload
+            new_sensitivity = max(new_sensitivity, overloaded + 1)
+
+        if new_sensitivity == sensitivity:
+            break
+
+        lia.sensitivity = new_sensitivity
+        settle_kwargs.get("metrics", NULL_METRICS).inc("sensitivity_changes")
+        sensitivity = new_sensitivity
+
+    return settle_cycles
+
+
+def autogain(lia, auto_gain_method, timeout, **settle_kwargs):
+    """Set the gain with an auto-gain method.
+
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    auto_gain_method : str
+        Auto-gain method: "instrument" uses the instrument's auto-gain function,
+        "custom" uses `custom_autogain`, and "jump" uses `jump_autogain`.
+    timeout : float
+        Maximum time to wait for lock-in to settle before moving on.
+    **settle_kwargs
+        Keyword arguments passed to `wait_for_lia_to_settle`.
+
+    Returns
+    -------
+    settle_cycles : int
+        Number of times the lock-in was left to settle.
+    """
+    if auto_gain_method == "instrument":
+        lia.auto_gain()
+        wait_for_lia_to_settle(lia, timeout, **settle_kwargs)
+        return 1
+    elif auto_gain_method == "custom":
+        return custom_autogain(lia, timeout, **settle_kwargs)
+    elif auto_gain_method == "jump":
+        return jump_autogain(lia, timeout, **settle_kwargs)
+    else:
+        raise ValueError(
+            f"Invalid auto-gain method: {auto_gain_method}. Must be 'instrument', "
+            + "'custom', or 'jump'."
+        )
+
+
+def read_overload(lockin):
+    """Read and clear the overload bits of the LIA status byte.
+
+    The instrument latches the bits until the status byte is read, so overloads since
+    the last read are reported even if they've cleared.
+
+    Parameters
+    ----------
+    lockin : sr830 object
+        Lock-in amplifier object.
+
+    Returns
+    -------
+    overload : bool
+        True if an input, filter, or output overload has occurred.
+    """
+    return int(lockin.instr.query("LIAS?")) & OVERLOAD_BITS != 0
+
+
+def in_gain_band(lia, band):
+    """Check whether R is still within a band of the current sensitivity range.
+
+    R is read once rather than waiting for the lock-in to settle, so this is much
+    quicker than autogain. The instrument's overload status is read as well, since a
+    saturated R can look in range, e.g. when the dynamic reserve is exceeded. The
+    current sensitivity is cached by `CachedInstrument`.
+
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    band : list of float
+        Lower and upper limits of the band as fractions of full scale. The lower
+        limit is ignored at the most sensitive setting and the upper limit at the
+        least sensitive one.
+
+    Returns
+    -------
+    in_band : bool
+        True if R is within the band and the input isn't overloaded.
+    """
+    low, high = band
+    if not 0 <= low < high <= 1:
+        raise ValueError(
+            f"Invalid auto-gain band: {band}. Must be two fractions of full scale "
+            + "between 0 and 1 in increasing order."
+        )
+
+    sensitivity = lia.sensitivity
+    full_scale = lia.sensitivities[sensitivity]
+    R, _ = lia.measure_multiple([3, 4])
+
+    if (R >= full_scale) or read_overload(lia):
+        return False
+    elif sensitivity == 0:
+        return R <= high * full_scale
+    elif sensitivity == len(lia.sensitivities) - 1:
+        return R >= low * full_scale
+    else:
+        return low * full_scale <= R <= high * full_scale
+
+
+def measure_all(lia, setup, timeout, diagnostics=None, wait=None, metrics=NULL_METRICS):
     """Measure all lock-in parameters.
 
     Parameters
     ----------
     lia : sr830 object
         Lock-in amplifier object.
-    config : dict
-        Configuration dictionary.
+    setup : dict
+        Instrument setup configuration dictionary.
     timeout : float
         Maximum time to wait for lock-in to settle before moving on.
+    diagnostics : dict, optional
+        If given, diagnostic information about the measurement is added to this
+        dictionary: the number of settle cycles needed, the time taken by the last
+        settle, whether autogain was skipped, and the time taken to set the gain.
+    wait : callable, optional
+        Called after setting the gain and before measuring, e.g. to wait for the next
+        scheduled measurement time.
+    metrics : metrics.Metrics, optional
+        Metrics registry that the time taken by each phase of the measurement is
+        recorded in.
 
     Returns
     -------
     data : list
         List of measured parameters
     """
-    # set gain if required
-    if config["auto_gain"] is True:
-        if config["auto_gain_method"] == "instrument":
-            lia.auto_gain()
-            wait_for_lia_to_settle(lia, timeout)
-        elif config["auto_gain_method"] == "custom":
-            custom_autogain(lia)
-        else:
-            raise ValueError(
-                f"Invalid auto-gain method: {config['auto_gain_method']}. Must be "
-                + "'instrument' or 'custom'."
+    settle_kwargs = {
+        "transfer": setup.get("buffer_transfer", "ascii"),
+        "method": setup.get("settling_method", "fixed"),
+        "diagnostics": diagnostics,
+        "metrics": metrics,
+    }
+
+    # set gain if required, unless R is still comfortably within the current range
+    settle_cycles = 0
+    skipped = False
+    t_start = time.perf_counter()
+    if (setup["auto_gain"] is True) and (setup.get("auto_gain_band") is not None):
+        skipped = in_gain_band(lia, setup["auto_gain_band"])
+        if skipped:
+            metrics.inc("autogain_skips")
+    if (setup["auto_gain"] is True) and (not skipped):
+        with metrics.time("autogain"):
+            settle_cycles = autogain(
+                lia, setup["auto_gain_method"], timeout, **settle_kwargs
             )
+        if setup.get("auto_gain_band") is not None:
+            # clear overloads latched while changing range so the next check only
+            # sees new ones
+            read_overload(lia)
+
+    if diagnostics is not None:
+        if skipped:
+            # left over from the last point that ran autogain
+            diagnostics.pop("settle_time", None)
+        diagnostics["settle_cycles"] = settle_cycles
+        diagnostics["autogain_skipped"] = skipped
+        diagnostics["autogain_time"] = time.perf_counter() - t_start
+
+    if wait is not None:
+        wait()
 
     # measure all available lock-in paramteres
     data0 = [time.time()]
-    data1 = list(lia.measure_multiple([1, 2, 5, 6, 7, 8]))
-    data2 = list(lia.measure_multiple([3, 4, 9, 10, 11]))
+    with metrics.time("measure_multiple"):
+        data1 = list(lia.measure_multiple([1, 2, 5, 6, 7, 8]))
+    with metrics.time("measure_multiple"):
+        data2 = list(lia.measure_multiple([3, 4, 9, 10, 11]))
 
     return data0 + data1 + data2
 
 
-# load the configuration file
-with open(args.config, "r") as f:
-    config = yaml.load(f, Loader=yaml.FullLoader)
+def setup_lia(lia, setup):
+    """Apply setup configuration to the lock-in amplifier.
 
-
-# run lock-in amplifier in context manager so it gets cleaned up properly if an error
-# occurs
-with sr830.sr830() as lia:
-    setup = config["lia"]["setup"]
-
-    # connect to the instrument
-    lia.connect(output_interface=setup["output_interface"], **config["lia"]["visa"])
-
-    # setup the instrument
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    setup : dict
+        Instrument setup configuration dictionary.
+    """
     lia.input_configuration = setup["input_configuration"]
     lia.input_coupling = setup["input_coupling"]
     lia.input_shield_grounding = setup["input_shield_grounding"]
     lia.line_notch_filter_status = setup["line_notch_filter_status"]
     lia.reference_source = setup["reference_source"]
-    if config["reference_source"] == 1:
+    if setup["reference_source"] == 1:
         # set frequency if using internal reference source
         lia.reference_frequency = setup["reference_frequency"]
     lia.reference_trigger = setup["reference_trigger"]
@@ -167,6 +651,8 @@ with sr830.sr830() as lia:
     lia.reserve_mode = setup["reserve_mode"]
     lia.time_constant = setup["time_constant"]
     lia.lowpass_filter_slope = setup["lowpass_filter_slope"]
+    if setup.get("sample_rate") is not None:
+        lia.sample_rate = setup["sample_rate"]
     lia.set_display(1, setup["ch1_display"], setup["ch1_ratio"])
     lia.set_display(2, setup["ch2_display"], setup["ch2_ratio"])
 
@@ -177,14 +663,26 @@ with sr830.sr830() as lia:
         # set sensitivity/gain to lowest setting to prevent overload before autogain
         lia.sensitivity = 26
 
-    # init save file
-    header = (
-        "timestamp (s)\tX (V)\tY (V)\tAux In 1 (V)\tAux In 2 (V)\tAux In 3 (V)\t"
-        + "Aux In 4 (V)\tR (V)\tPhase (deg)\tFreq (Hz)\tCh1 display\tCh2 display\n"
-    )
 
-    save_path = pathlib.Path(args.save_path)
+def init_save_file(save_path, output_format="tsv", columns=COLUMNS, interactive=True):
+    """Create a new save file with a header or confirm appending to an existing one.
+
+    Parameters
+    ----------
+    save_path : pathlib.Path
+        Path to save file.
+    output_format : str
+        Save file format, "tsv" or "binary". Binary saves describe their columns in
+        each chunk so are created by the writer instead.
+    columns : list of str
+        Column names.
+    interactive : bool
+        Ask whether to append to an existing file. If False, e.g. in a process with
+        no stdin, an existing file raises an error instead.
+    """
     if save_path.exists():
+        if not interactive:
+            raise FileExistsError(f"Save file already exists: {save_path}.")
         i = (
             input(f"{save_path} already exists. Do you want to append to it? [y/n] ")
             or "y"
@@ -194,17 +692,545 @@ with sr830.sr830() as lia:
             print("Appending to file...")
         elif i != "n":
             raise ValueError(f"Invalid input: '{i}'.")
-    else:
+    elif output_format == "tsv":
         with open(save_path, "w", newline="\n") as f:
-            f.writelines(header)
+            f.writelines("\t".join(columns) + "\n")
 
-    # perform measurements and save data to file forever
-    while True:
-        data = measure_all(lia, config, setup["settling_timeout"])
 
-        # append new data to save file
-        with open(save_path, "a", newline="\n") as f:
-            writer = csv.writer(f, delimiter="\t")
-            writer.writerow(data)
+def save_columns(config):
+    """Get the columns of the save file for the configured acquisition mode.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary.
+
+    Returns
+    -------
+    columns : list of str
+        Column names.
+    """
+    if config.get("mode", "poll") == "stream":
+        return STREAM_COLUMNS
+    else:
+        return COLUMNS
+
+
+def open_writer(save_path, config, columns=COLUMNS):
+    """Open a writer for the save file in the configured output format.
+
+    Parameters
+    ----------
+    save_path : pathlib.Path
+        Path to save file.
+    config : dict
+        Configuration dictionary.
+    columns : list of str
+        Column names.
+
+    Returns
+    -------
+    writer : storage.BufferedWriter or storage.QueuedWriter
+        Save file writer. If a queue size is configured, rows are written in a
+        background thread.
+    """
+    writer_config = dict(config.get("writer", {}))
+    queue_size = writer_config.pop("queue_size", None)
+    backpressure = writer_config.pop("backpressure", "block")
+
+    output_format = config.get("output_format", "tsv")
+    if output_format == "tsv":
+        writer = TSVWriter(save_path, **writer_config)
+    elif output_format == "binary":
+        writer = BinaryWriter(save_path, columns, **writer_config)
+    else:
+        raise ValueError(
+            f"Invalid output format: {output_format}. Must be 'tsv' or 'binary'."
+        )
+
+    if queue_size is not None:
+        writer = QueuedWriter(writer, queue_size, backpressure)
+
+    return writer
+
+
+def instrument_configs(config):
+    """Get the configuration of each instrument.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary. Its "lia" entry is either a single instrument
+        configuration or a list of them.
+
+    Returns
+    -------
+    lia_configs : list of dict
+        Instrument configurations, each with a "device_id". Instruments without one
+        use the top-level device_id.
+    """
+    lia_configs = config["lia"]
+    if isinstance(lia_configs, dict):
+        lia_configs = [lia_configs]
+
+    lia_configs = [
+        {"device_id": config.get("device_id"), **lia_config}
+        for lia_config in lia_configs
+    ]
+
+    device_ids = [lia_config["device_id"] for lia_config in lia_configs]
+    if len(set(device_ids)) != len(device_ids):
+        raise ValueError(f"Device IDs must be unique: {device_ids}.")
+
+    return lia_configs
+
+
+def instrument_save_path(save_path, device_id, n_instruments):
+    """Get the save path for one of several instruments.
+
+    Parameters
+    ----------
+    save_path : pathlib.Path
+        Save path given by the user.
+    device_id : str
+        Device ID of the instrument.
+    n_instruments : int
+        Number of instruments being run.
+
+    Returns
+    -------
+    save_path : pathlib.Path
+        Save path for the instrument. With more than one instrument, the device ID is
+        appended to the name given by the user.
+    """
+    if n_instruments == 1:
+        return save_path
+    else:
+        return save_path.with_name(f"{save_path.stem}_{device_id}{save_path.suffix}")
+
+
+def stream(lia, config, writer, stop=None):
+    """Stream data from the instrument's buffers at its internal sample rate.
+
+    The buffers keep filling while completed chunks are read out, so no samples are
+    missed between reads. Timestamps are reconstructed from the sample rate and the
+    time storage started. The buffers only hold `BUFFER_LENGTH` points, so before
+    they fill up storage is restarted and the timestamps are re-anchored, leaving a
+    gap of a few bus transactions.
+
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    config : dict
+        Configuration dictionary.
+    writer : storage.BufferedWriter or storage.QueuedWriter
+        Save file writer.
+    stop : threading.Event, optional
+        Event that stops streaming when set. If None, streaming runs forever.
+    """
+    stream_config = config.get("stream", {})
+    chunk_time = stream_config.get("chunk_time", 0.5)
+    transfer = stream_config.get("buffer_transfer", "binary")
+
+    lia.sample_rate = stream_config.get("sample_rate", 13)
+    rate = lia.sample_rates[lia.sample_rate]
+    # store in 1 shot mode so a full buffer stops rather than overwriting data
+    lia.end_of_buffer_mode = 0
+    # restart before the buffer can fill up during a chunk
+    restart_at = BUFFER_LENGTH - 2 * chunk_time * rate
+    if restart_at < rate * chunk_time:
+        raise ValueError("Streaming chunk time is too long for the buffer length.")
+
+    def drain(read, t_start):
+        """Read and save points stored since the last read."""
+        stored = lia.buffer_size
+        if stored > read:
+            ch1 = read_buffer(lia, 1, read, stored - read, transfer)
+            ch2 = read_buffer(lia, 2, read, stored - read, transfer)
+            n = min(len(ch1), len(ch2))
+            timestamps = t_start + (read + np.arange(n)) / rate
+            writer.writerows(np.column_stack((timestamps, ch1[:n], ch2[:n])).tolist())
+            read += n
+        return read
+
+    lia.reset_data_buffers()
+    t_start = time.time()
+    lia.start()
+    read = 0
+    try:
+        while (stop is None) or (not stop.is_set()):
+            time.sleep(chunk_time)
+            read = drain(read, t_start)
+            if read >= restart_at:
+                lia.pause()
+                read = drain(read, t_start)
+                lia.reset_data_buffers()
+                t_start = time.time()
+                lia.start()
+                read = 0
+    finally:
+        lia.pause()
+        drain(read, t_start)
+
+
+def gain_skip_summary(gain_times, elapsed):
+    """Summarise the time saved by skipping autogain while R stayed in range.
+
+    Parameters
+    ----------
+    gain_times : dict of onlinestats.RunningStats
+        Time taken to set the gain for points where autogain was skipped (key True)
+        and run (key False) in s.
+    elapsed : float
+        Duration of the run in s.
+
+    Returns
+    -------
+    summary : str
+        Skip rate and measurement rate with and without skipping.
+    """
+    skipped = gain_times[True]
+    run = gain_times[False]
+    points = skipped.n + run.n
+    if points == 0:
+        return "Autogain skipped for 0 points"
+
+    summary = f"Autogain skipped for {skipped.n} of {points} points"
+    summary += f" ({skipped.n / points:.0%})"
+    if (skipped.n > 0) and (run.n > 0) and (elapsed > 0):
+        # time each skipped point would have spent in autogain instead
+        saved = skipped.n * max(run.mean - skipped.mean, 0)
+        summary += (
+            f", saving ~{saved:.1f} s: {points / elapsed * 3600:.0f} points/h "
+            + f"instead of ~{points / (elapsed + saved) * 3600:.0f} points/h"
+        )
+    return summary
+
+
+def record_queue_stats(writer, metrics):
+    """Copy the queue statistics of a writer to metrics.
+
+    The numbers of dropped and spilled rows are counters, each incremented by the
+    change since the last copy so the exported value matches the writer's. The max
+    queue depth is a gauge.
+
+    Parameters
+    ----------
+    writer : storage.QueuedWriter
+        Queued save file writer.
+    metrics : metrics.Metrics
+        Metrics registry.
+    """
+    for name in ["dropped", "spilled"]:
+        counter = f"writer_{name}"
+        metrics.inc(counter, getattr(writer, name) - metrics.counters.get(counter, 0))
+    metrics.set_gauge("writer_max_depth", writer.max_depth)
+
+
+def run(lia, config, lia_config, save_path, stop=None, live=None):
+    """Set up an instrument then measure and save data until stopped.
+
+    Parameters
+    ----------
+    lia : sr830 object
+        Lock-in amplifier object.
+    config : dict
+        Configuration dictionary.
+    lia_config : dict
+        Instrument configuration dictionary.
+    save_path : pathlib.Path
+        Path to save file.
+    stop : threading.Event, optional
+        Event that stops the measurements when set. If None, measurements run
+        forever.
+    live : shmring.SharedRingBuffer, optional
+        Shared memory buffer that each measured row is also added to, for live
+        plotting. Not used in streaming mode.
+    """
+    setup = lia_config["setup"]
+
+    # check the config before connecting, since adaptive sampling and compression
+    # can't work without tolerances
+    tolerance_config = config.get("tolerances") or {}
+    adaptive_config = config.get("adaptive_interval", {})
+    if (len(tolerance_config) == 0) and (
+        adaptive_config.get("enabled", False) or (config.get("compression") is not None)
+    ):
+        raise ValueError(
+            f"Invalid tolerances: {config.get('tolerances')}. Must give the tolerance "
+            + "of at least one column when adaptive sampling or compression is "
+            + "enabled."
+        )
+
+    cache_config = config.get("settings_cache", {})
+    if cache_config.get("enabled", False):
+        # skip redundant reads and writes of instrument settings
+        lia = CachedInstrument(lia, cache_config.get("max_age"))
+
+    # connect to the instrument
+    lia.connect(output_interface=setup["output_interface"], **lia_config["visa"])
+
+    # setup the instrument
+    setup_lia(lia, setup)
+
+    if config.get("mode", "poll") == "stream":
+        if setup["auto_gain"] is True:
+            # the gain is fixed while streaming, so set it once for the current signal
+            # rather than leaving it on the least sensitive range
+            autogain(
+                lia,
+                setup["auto_gain_method"],
+                setup["settling_timeout"],
+                transfer=setup.get("buffer_transfer", "ascii"),
+                method=setup.get("settling_method", "fixed"),
+            )
+            print(f"Streaming with sensitivity {lia.sensitivity}.")
+        with open_writer(save_path, config, STREAM_COLUMNS) as writer:
+            stream(lia, config, writer, stop)
+        return
+
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("enabled", False):
+        metrics = Metrics(labels={"device": lia_config["device_id"]})
+        exporter = MetricsExporter(
+            metrics,
+            metrics_config.get("path") or metrics_path(save_path),
+            metrics_config.get("export_interval", 10),
+        )
+    else:
+        metrics = NULL_METRICS
+        exporter = None
+
+    # perform measurements and save data to file, the writer flushes held rows if the
+    # loop is interrupted
+    # measure at regular deadlines, after setting the gain for each point, so
+    # timestamps are evenly spaced
+    scheduler = DeadlineScheduler(config["interval"], **config.get("schedule", {}))
+
+    def wait():
+        metrics.observe("jitter", scheduler.wait())
+
+    tolerances = column_tolerances(tolerance_config)
+    if adaptive_config.get("enabled", False):
+        # measure less often while the signal is flat
+        adaptive = AdaptiveInterval(
+            config["interval"],
+            adaptive_config["min_interval"],
+            adaptive_config["max_interval"],
+            tolerances,
+        )
+        scheduler.set_interval(adaptive.interval)
+    else:
+        adaptive = None
+
+    if config.get("compression") is not None:
+        # only store the rows needed to reconstruct the trace within the tolerances
+        compressor = make_compressor(config["compression"], tolerance_config)
+    else:
+        compressor = None
+
+    rollups_config = config.get("rollups", {})
+    if rollups_config.get("enabled", False):
+        # summarise every measured row, before compression, over fixed windows
+        # windows and columns that aren't given keep the defaults
+        options = {
+            key: rollups_config[key]
+            for key in ["windows", "columns"]
+            if rollups_config.get(key) is not None
+        }
+        rollups = Rollups(save_path, **options)
+    else:
+        rollups = None
+
+    # time taken to set the gain for points where autogain was skipped and run
+    gain_times = {True: RunningStats(), False: RunningStats()}
+    diagnostics = {}
+    t_start = time.monotonic()
+
+    writer = None
+    try:
+        with open_writer(save_path, config) as writer:
+            try:
+                while (stop is None) or (not stop.is_set()):
+                    data = measure_all(
+                        lia,
+                        setup,
+                        setup["settling_timeout"],
+                        diagnostics,
+                        wait=wait,
+                        metrics=metrics,
+                    )
+                    gain_times[diagnostics["autogain_skipped"]].update(
+                        diagnostics["autogain_time"]
+                    )
+
+                    # append new data to save file
+                    with metrics.time("write"):
+                        if compressor is None:
+                            writer.writerow(data)
+                        else:
+                            rows = compressor.add(data)
+                            writer.writerows(rows)
+                            metrics.inc("rows_stored", len(rows))
+                        if live is not None:
+                            live.extend([data])
+                        if rollups is not None:
+                            rollups.add(data)
+                    metrics.inc("points")
+
+                    if adaptive is not None:
+                        scheduler.set_interval(adaptive.update(data))
+
+                    if exporter is not None:
+                        if isinstance(writer, QueuedWriter):
+                            record_queue_stats(writer, metrics)
+                        exporter.maybe_export()
+            finally:
+                if compressor is not None:
+                    # keep the end of the trace
+                    writer.writerows(compressor.finish())
+    finally:
+        if rollups is not None:
+            # write the windows in progress
+            rollups.close()
+        if setup.get("auto_gain_band") is not None:
+            print(gain_skip_summary(gain_times, time.monotonic() - t_start))
+        if compressor is not None:
+            print(compressor.summary())
+        if isinstance(writer, QueuedWriter):
+            print(
+                f"Write queue: max depth {writer.max_depth} of {writer.maxsize} rows, "
+                + f"{writer.dropped} rows dropped, {writer.spilled} rows spilled."
+            )
+        if exporter is not None:
+            if isinstance(writer, QueuedWriter):
+                record_queue_stats(writer, metrics)
+            exporter.export()
+        if isinstance(lia, CachedInstrument) and (scheduler.points > 0):
+            print(
+                f"Settings cache saved {lia.saved} bus transactions, "
+                + f"{lia.saved / scheduler.points:.1f} per point."
+            )
+
+
+def run_instrument(sr830, config, lia_config, save_path, stop, errors):
+    """Run one of several instruments in a worker thread.
+
+    Bus access is coordinated with other instruments on the same bus. If an error
+    occurs, all instruments are stopped.
+
+    Parameters
+    ----------
+    sr830 : module
+        Module providing the lock-in amplifier class.
+    config : dict
+        Configuration dictionary.
+    lia_config : dict
+        Instrument configuration dictionary.
+    save_path : pathlib.Path
+        Path to save file.
+    stop : threading.Event
+        Event that stops the measurements when set.
+    errors : list
+        List that errors raised by the worker are appended to.
+    """
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("path") is not None:
+        # give each instrument its own metrics files
+        path = pathlib.Path(metrics_config["path"])
+        path = path.with_name(f"{path.stem}_{lia_config['device_id']}{path.suffix}")
+        config = dict(config, metrics=dict(metrics_config, path=path))
+
+    try:
+        # run lock-in amplifier in context manager so it gets cleaned up properly if
+        # an error occurs
+        with sr830.sr830() as lia:
+            lock = get_bus_lock(lia_config["visa"]["resource_name"])
+            run(LockedInstrument(lia, lock), config, lia_config, save_path, stop)
+    except Exception as err:
+        errors.append(err)
+        stop.set()
+        raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c",
+        "--config-path",
+        default="example_config.yaml",
+        help="Path to configuration file (yaml format).",
+    )
+    parser.add_argument(
+        "-s",
+        "--save-path",
+        default="temp.tsv",
+        help=(
+            "Path for save file (tsv file or binary save folder). With several "
+            + "instruments, each device ID is appended to the name."
+        ),
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="Use a simulated lock-in amplifier instead of a real instrument.",
+    )
+    args = parser.parse_args()
+
+    if args.simulate:
+        import sim_sr830 as sr830
+    else:
+        import sr830
+
+    # load the configuration file
+    with open(args.config_path, "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    lia_configs = instrument_configs(config)
+
+    # init save files
+    save_paths = [
+        instrument_save_path(
+            pathlib.Path(args.save_path), lia_config["device_id"], len(lia_configs)
+        )
+        for lia_config in lia_configs
+    ]
+    for save_path in save_paths:
+        init_save_file(
+            save_path, config.get("output_format", "tsv"), save_columns(config)
+        )
+
+    if len(lia_configs) == 1:
+        # run lock-in amplifier in context manager so it gets cleaned up properly if
+        # an error occurs
+        with sr830.sr830() as lia:
+            run(lia, config, lia_configs[0], save_paths[0])
+    else:
+        # run each instrument in its own thread, threads wait on the bus lock and
+        # while instruments settle so the bus is shared efficiently
+        stop = threading.Event()
+        errors = []
+        threads = [
+            threading.Thread(
+                target=run_instrument,
+                args=(sr830, config, lia_config, save_path, stop, errors),
+                name=str(lia_config["device_id"]),
+            )
+            for lia_config, save_path in zip(lia_configs, save_paths)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            print("Stopping...")
+            stop.set()
+            for thread in threads:
+                thread.join()
 
-        time.sleep(config["interval"])
+        if len(errors) > 0:
+            raise errors[0]
@@ -1,12 +1,59 @@
 """Setup and monitor SRS SR830 freerun."""
 
+import argparse
+import atexit
+
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 
 from app import app
-from apps import experiment, lia, livedata
+from apps import experiment, lia, livedata, metrics
+from livepush import LiveNotifier
+from worker import AcquisitionWorker, build_config, load_base_config, new_save_path
+
+# configuration file providing settings that aren't set in the GUI
+CONFIG_PATH = "example_config.yaml"
+
+# acquisition runs in its own process, started and stopped by the buttons. Both are
+# created by `setup_acquisition` when the server starts rather than on import, since
+# the spawned acquisition process re-imports this module.
+acquisition = None
+
+# push notifications of new rows measured by the acquisition process to browsers
+notifier = None
+
+
+def setup_acquisition(simulate=False, replay_source=None, replay_speed=1.0):
+    """Create the acquisition worker and the notifier of its new data.
+
+    Parameters
+    ----------
+    simulate : bool
+        Use a simulated lock-in amplifier instead of a real instrument.
+    replay_source : str or None
+        Path to a tsv save file to replay instead of measuring.
+    replay_speed : float
+        Replay speed-up factor.
+    """
+    global acquisition, notifier
+
+    acquisition = AcquisitionWorker(
+        simulate=simulate, replay_source=replay_source, replay_speed=replay_speed
+    )
+    # let acquisition finish its current measurement and save held rows on exit
+    atexit.register(acquisition.close)
+
+    notifier = LiveNotifier()
+    notifier.watch(acquisition.new_data)
+
+
+@app.server.route("/live-events")
+def live_events():
+    """Stream Server-Sent Events of new live data and acquisition status changes."""
+    return notifier.response()
+
 
 # the style arguments for the sidebar. We use position:fixed and a fixed width
 SIDEBAR_STYLE = {
@@ -71,6 +118,12 @@ sidebar = html.Div(
                     id="livedata",
                     style={"font-size": "18pt"},
                 ),
+                dbc.NavLink(
+                    "Metrics",
+                    href="metrics",
+                    id="metrics",
+                    style={"font-size": "18pt"},
+                ),
             ],
             vertical=True,
             pills=True,
@@ -104,6 +157,7 @@ button_bar = html.Div(
                 ),
             ]
         ),
+        html.Small(id="acquisition-status", className="text-muted"),
         html.Hr(),
     ],
     style=BUTTONBAR_STYLE,
@@ -116,7 +170,19 @@ app.layout = dbc.Container(
         dcc.Location(id="url", refresh=False),
         # dcc.Store(id="session", data={"save_folder": ""}, storage_type="memory"),
         html.Div(id="save_path", children="", hidden=True),
-        dcc.Interval(id="interval-component", interval=1 * 2000, n_intervals=0,),
+        # name of the shared memory buffer of live data
+        html.Div(id="live_buffer", children="", hidden=True),
+        # page settings, kept when the pages aren't displayed
+        dcc.Store(id="experiment-settings", storage_type="session"),
+        dcc.Store(id="lia-settings", storage_type="session"),
+        # polls the acquisition status, only while acquisition is running so idle
+        # browsers don't load the server
+        dcc.Interval(
+            id="interval-component", interval=1 * 2000, n_intervals=0, disabled=True
+        ),
+        # clicked by assets/live_push.js when acquisition is started or stopped from
+        # any browser
+        html.Button(id="status-push", n_clicks=0, style={"display": "none"}),
         sidebar,
         button_bar,
         page_content,
@@ -134,9 +200,11 @@ def display_page(pathname, save_path):
     if pathname in ["/", "/experiment"]:
         return experiment.layout
     elif pathname in ["/lia"]:
-        return lia.layout
+        return lia.layout()
     elif pathname == "/livedata":
-        return livedata.layout
+        return livedata.layout()
+    elif pathname == "/metrics":
+        return metrics.layout
     else:
         # If the user tries to reach a different page, return a 404 message
         return dbc.Jumbotron(
@@ -153,6 +221,7 @@ def display_page(pathname, save_path):
         dash.dependencies.Output("experiment", "active"),
         dash.dependencies.Output("lia", "active"),
         dash.dependencies.Output("livedata", "active"),
+        dash.dependencies.Output("metrics", "active"),
     ],
     [dash.dependencies.Input("url", "pathname")],
 )
@@ -160,13 +229,15 @@ def toggle_active_links(pathname):
     """Set the active state of navlinks."""
     if pathname in ["/", "/experiment"]:
         # Treat page 1 as the homepage / index
-        return True, False, False
+        return True, False, False, False
     elif pathname == "/lia":
-        return False, True, False
+        return False, True, False, False
     elif pathname == "/livedata":
-        return False, False, True
+        return False, False, True, False
+    elif pathname == "/metrics":
+        return False, False, False, True
     else:
-        return False, False, False
+        return False, False, False, False
 
 
 @app.callback(
@@ -175,31 +246,104 @@ def toggle_active_links(pathname):
         dash.dependencies.Output("stop", "disabled"),
         dash.dependencies.Output("start", "children"),
         dash.dependencies.Output("stop", "children"),
+        dash.dependencies.Output("save_path", "children"),
+        dash.dependencies.Output("live_buffer", "children"),
+        dash.dependencies.Output("acquisition-status", "children"),
+        dash.dependencies.Output("interval-component", "disabled"),
     ],
     [
         dash.dependencies.Input("start", "n_clicks"),
         dash.dependencies.Input("stop", "n_clicks"),
+        dash.dependencies.Input("interval-component", "n_intervals"),
+        dash.dependencies.Input("status-push", "n_clicks"),
     ],
     [
-        dash.dependencies.State("start", "disabled"),
-        dash.dependencies.State("stop", "disabled"),
-        dash.dependencies.State("start", "children"),
-        dash.dependencies.State("stop", "children"),
+        dash.dependencies.State("experiment-settings", "data"),
+        dash.dependencies.State("lia-settings", "data"),
     ],
 )
 def push_start_stop(
-    start_clicks, stop_clicks, start_disabled, stop_disabled, start_text, stop_text
+    start_clicks, stop_clicks, n, pushes, experiment_settings, lia_settings
 ):
-    """Perform start action and enable/disable buttons accordingly."""
+    """Start or stop acquisition and enable/disable buttons accordingly.
+
+    While acquisition is running the status is also polled on every interval, so the
+    buttons are reset if it finishes or fails on its own. Other browsers are notified
+    when acquisition is started or stopped, so idle browsers don't need to poll.
+    """
     changed_id = [p["prop_id"] for p in dash.callback_context.triggered][0]
-    if changed_id == ".":
-        return start_disabled, stop_disabled, start_text, stop_text
-    elif "start" in changed_id:
-        return True, False, "Measuring...", "Stop"
-    elif "stop" in changed_id:
-        return False, True, "Start", "Stopped"
+    save_path = dash.no_update
+    live_buffer = dash.no_update
+    if changed_id.startswith("start"):
+        experiment_settings = experiment_settings or {}
+        config = build_config(
+            load_base_config(CONFIG_PATH), experiment_settings, lia_settings
+        )
+        path = new_save_path(
+            experiment_settings.get("save_folder"),
+            config["lia"]["device_id"],
+            config.get("output_format", "tsv"),
+        )
+        timeout = experiment_settings.get("timeout")
+        duration = timeout if (timeout is not None) and (timeout >= 0) else None
+        try:
+            acquisition.start(config, path, duration)
+            save_path = str(path)
+            live_buffer = "" if acquisition.live is None else acquisition.live.name
+            notifier.notify_status()
+        except RuntimeError as err:
+            print(err)
+    elif changed_id.startswith("stop"):
+        acquisition.stop()
+        notifier.notify_status()
+
+    # the buttons follow the polled state rather than checking the process again,
+    # since another callback can start or stop acquisition in between
+    state, message = acquisition.poll()
+    if state in ["starting", "running", "stopping"]:
+        stop_text = "Stopping..." if state == "stopping" else "Stop"
+        return (
+            True,
+            False,
+            "Measuring...",
+            stop_text,
+            save_path,
+            live_buffer,
+            message,
+            False,
+        )
+    else:
+        return False, True, "Start", "Stopped", save_path, live_buffer, message, True
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c",
+        "--config-path",
+        default=CONFIG_PATH,
+        help="Path to configuration file providing settings not set in the GUI.",
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="Use a simulated lock-in amplifier instead of a real instrument.",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        help="Replay this tsv save file when started instead of measuring.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="Replay speed-up factor relative to the original timing, 0 for max speed.",
+    )
+    args = parser.parse_args()
+
+    CONFIG_PATH = args.config_path
+    setup_acquisition(args.simulate, args.replay, args.replay_speed)
+
     # start dash server
     app.run_server(host="127.0.0.1", port=8050, debug=False)
@@ -0,0 +1,115 @@
+"""Push live data and status notifications to browsers with Server-Sent Events."""
+import threading
+
+import flask
+
+# max time between messages on an idle stream in s, so proxies and browsers don't
+# drop the connection
+KEEPALIVE = 15
+
+
+class LiveNotifier:
+    """Wake waiting event streams when new data are available or the status changes.
+
+    Each notification increments a version number, one for data and one for the
+    acquisition status. Streams wait for a version to change, so a notification that
+    arrives while a stream is busy isn't lost and several notifications in quick
+    succession are sent as one.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.status_version = 0
+        self._condition = threading.Condition()
+
+    def notify(self):
+        """Notify all waiting streams of new data."""
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def notify_status(self):
+        """Notify all waiting streams that acquisition started or stopped."""
+        with self._condition:
+            self.status_version += 1
+            self._condition.notify_all()
+
+    def wait(self, versions, timeout=None):
+        """Wait for a notification.
+
+        Parameters
+        ----------
+        versions : tuple of int
+            Data and status version numbers last seen by the caller.
+        timeout : float or None
+            Max time to wait in s. If None, wait forever.
+
+        Returns
+        -------
+        versions : tuple of int
+            Current data and status version numbers, which equal `versions` if the
+            wait timed out.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: (self.version, self.status_version) != versions, timeout
+            )
+            return self.version, self.status_version
+
+    def watch(self, event):
+        """Notify streams whenever an event is set, in a background thread.
+
+        Parameters
+        ----------
+        event : multiprocessing.Event
+            Event set by another process when new data are available. It's cleared
+            before streams are notified, so rows added while they read aren't missed.
+        """
+
+        def watcher():
+            while True:
+                event.wait()
+                event.clear()
+                self.notify()
+
+        threading.Thread(target=watcher, name="live-notifier", daemon=True).start()
+
+    def stream(self):
+        """Generate Server-Sent Events messages as data become available.
+
+        Yields
+        ------
+        message : str
+            A "status" event with the status version number when acquisition starts
+            or stops, a data message with the version number when new data are
+            available, or a comment if neither arrived within `KEEPALIVE` s.
+        """
+        versions = (self.version, self.status_version)
+        while True:
+            new_versions = self.wait(versions, KEEPALIVE)
+            if new_versions == versions:
+                yield ": keepalive\n\n"
+                continue
+
+            version, status_version = new_versions
+            message = ""
+            if status_version != versions[1]:
+                message += f"event: status\ndata: {status_version}\n\n"
+            if version != versions[0]:
+                message += f"data: {version}\n\n"
+            versions = new_versions
+            yield message
+
+    def response(self):
+        """Make a streaming response for a Server-Sent Events request.
+
+        Returns
+        -------
+        response : flask.Response
+            Event stream response.
+        """
+        return flask.Response(
+            self.stream(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
@@ -0,0 +1,345 @@
+"""Lightweight timing and counter metrics for the acquisition loop."""
+import bisect
+import contextlib
+import json
+import math
+import os
+import pathlib
+import statistics
+import threading
+import time
+
+# upper bounds of histogram buckets in s
+BUCKETS = [
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+]
+
+
+def metrics_path(save_path):
+    """Get the default path of the metrics file for a save file.
+
+    Parameters
+    ----------
+    save_path : str or pathlib.Path
+        Path to save file.
+
+    Returns
+    -------
+    path : pathlib.Path
+        Path to metrics JSON file. A Prometheus text file is written alongside it
+        with a .prom extension.
+    """
+    save_path = pathlib.Path(save_path)
+    return save_path.with_name(save_path.name + ".metrics.json")
+
+
+def summarise(samples):
+    """Summarise a latency distribution.
+
+    Parameters
+    ----------
+    samples : list of float
+        Latency samples in s.
+
+    Returns
+    -------
+    summary : str
+        Summary of the distribution in ms.
+    """
+    if len(samples) == 0:
+        return "no calls"
+    elif len(samples) == 1:
+        return f"n=1, {samples[0] * 1000:.2f} ms"
+
+    pcs = statistics.quantiles(samples, n=100, method="inclusive")
+    return (
+        f"n={len(samples)}, mean={statistics.mean(samples) * 1000:.2f} ms, "
+        + f"p50={pcs[49] * 1000:.2f} ms, p90={pcs[89] * 1000:.2f} ms, "
+        + f"p99={pcs[98] * 1000:.2f} ms, max={max(samples) * 1000:.2f} ms"
+    )
+
+
+class Histogram:
+    """Histogram of observed values with fixed buckets.
+
+    Parameters
+    ----------
+    buckets : list of float
+        Sorted upper bounds of the buckets. Values above the last bound are counted
+        in an overflow bucket.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Add an observation.
+
+        Parameters
+        ----------
+        value : float
+            Observed value.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within buckets.
+
+        Parameters
+        ----------
+        q : float
+            Quantile between 0 and 1.
+
+        Returns
+        -------
+        value : float
+            Estimated quantile, or nan if there are no observations.
+        """
+        if self.count == 0:
+            return math.nan
+
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets + [self.max], self.counts):
+            if (count > 0) and (cumulative + count >= rank):
+                return min(
+                    lower + (upper - lower) * (rank - cumulative) / count, self.max
+                )
+            cumulative += count
+            lower = upper
+        return self.max
+
+    def to_dict(self):
+        """Get the histogram as a dictionary."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count > 0 else math.nan,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "buckets": self.buckets,
+            "counts": self.counts,
+        }
+
+
+class Metrics:
+    """Registry of counters, gauges, and timing histograms.
+
+    Parameters
+    ----------
+    labels : dict, optional
+        Labels attached to every exported metric, e.g. the device ID.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, n=1):
+        """Increment a counter.
+
+        Parameters
+        ----------
+        name : str
+            Counter name.
+        n : int
+            Amount to increment by.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_gauge(self, name, value):
+        """Set a gauge, a value that can go up or down, e.g. a high-water mark.
+
+        Parameters
+        ----------
+        name : str
+            Gauge name.
+        value : float
+            Current value.
+        """
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        """Add an observation to a histogram.
+
+        Parameters
+        ----------
+        name : str
+            Histogram name.
+        value : float
+            Observed value in s.
+        """
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    @contextlib.contextmanager
+    def time(self, name):
+        """Time a block of code and add the duration to a histogram.
+
+        Parameters
+        ----------
+        name : str
+            Histogram name.
+        """
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t_start)
+
+    def to_dict(self):
+        """Get all metrics as a dictionary."""
+        with self._lock:
+            return {
+                "time": time.time(),
+                "labels": self.labels,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    def to_prometheus(self, prefix="freerun"):
+        """Get all metrics in the Prometheus text exposition format.
+
+        Parameters
+        ----------
+        prefix : str
+            Prefix for metric names.
+
+        Returns
+        -------
+        text : str
+            Metrics text.
+        """
+
+        def format_labels(extra=None):
+            labels = {**self.labels, **(extra or {})}
+            if len(labels) == 0:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{format_labels()} {value}")
+
+            for name, value in sorted(self.gauges.items()):
+                metric = f"{prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric}{format_labels()} {value}")
+
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for upper, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    labels = format_labels({"le": upper})
+                    lines.append(f"{metric}_bucket{labels} {cumulative}")
+                labels = format_labels({"le": "+Inf"})
+                lines.append(f"{metric}_bucket{labels} {histogram.count}")
+                lines.append(f"{metric}_sum{format_labels()} {histogram.sum}")
+                lines.append(f"{metric}_count{format_labels()} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class _NullMetrics:
+    """Metrics registry that discards everything, used when metrics are disabled."""
+
+    def inc(self, name, n=1):
+        pass
+
+    def set_gauge(self, name, value):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def time(self, name):
+        return contextlib.nullcontext()
+
+
+NULL_METRICS = _NullMetrics()
+
+
+class MetricsExporter:
+    """Periodically rewrite metrics files.
+
+    The JSON file is written to `path` and a Prometheus text file alongside it with
+    a .prom extension. Files are replaced atomically so readers never see a partial
+    file.
+
+    Parameters
+    ----------
+    metrics : Metrics
+        Metrics registry to export.
+    path : str or pathlib.Path
+        Path to JSON metrics file.
+    interval : float
+        Minimum time between exports in s.
+    """
+
+    def __init__(self, metrics, path, interval=10):
+        self.metrics = metrics
+        self.path = pathlib.Path(path)
+        self.prom_path = self.path.with_suffix(".prom")
+        self.interval = interval
+        self._last_export = None
+
+    def maybe_export(self):
+        """Export the metrics if the export interval has passed."""
+        now = time.monotonic()
+        if (self._last_export is None) or (now - self._last_export >= self.interval):
+            self.export()
+
+    def export(self):
+        """Export the metrics."""
+        self._replace(self.path, json.dumps(self.metrics.to_dict(), indent=2))
+        self._replace(self.prom_path, self.metrics.to_prometheus())
+        self._last_export = time.monotonic()
+
+    @staticmethod
+    def _replace(path, text):
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
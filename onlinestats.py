@@ -0,0 +1,128 @@
+"""Incremental statistics that can be updated one sample or block at a time."""
+import math
+
+import numpy as np
+
+
+class RunningStats:
+    """Running count, mean, variance, minimum, and maximum of a stream of samples.
+
+    Uses Welford's algorithm for single samples and Chan et al.'s parallel variant to
+    merge blocks of samples, so memory use is constant however many samples are
+    seen.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # sum of squared differences from the mean
+        self._m2 = 0.0
+
+    def update(self, x):
+        """Add a sample.
+
+        Parameters
+        ----------
+        x : float
+            Sample value.
+        """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def update_many(self, values):
+        """Add a block of samples.
+
+        Parameters
+        ----------
+        values : array-like
+            Sample values.
+        """
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        if n == 0:
+            return
+
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        self._merge(n, mean, m2, values.min(), values.max())
+
+    def merge(self, other):
+        """Add all samples seen by another `RunningStats` object.
+
+        Parameters
+        ----------
+        other : RunningStats
+            Statistics to merge.
+        """
+        if other.n > 0:
+            self._merge(other.n, other.mean, other._m2, other.min, other.max)
+
+    def _merge(self, n, mean, m2, min_, max_):
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+        self.min = min(self.min, min_)
+        self.max = max(self.max, max_)
+
+    @property
+    def variance(self):
+        """Sample variance."""
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        """Sample standard deviation."""
+        return math.sqrt(self.variance)
+
+
+class AllanVariance:
+    """Running non-overlapping Allan variance of a stream of window averages.
+
+    Each average is compared with the one from the window before it, so memory use
+    is constant. Averages of windows that aren't adjacent, e.g. either side of a gap
+    in the data, aren't compared.
+    """
+
+    def __init__(self):
+        # number of differences between adjacent averages
+        self.n = 0
+        self._sum_sq = 0.0
+        self._last = None
+        self._last_index = None
+
+    def update(self, y, index=None):
+        """Add a window average.
+
+        Parameters
+        ----------
+        y : float
+            Average over the window.
+        index : int, optional
+            Index of the window. If given, the average is only compared with the
+            previous one if their indices are consecutive.
+        """
+        if (self._last is not None) and (
+            (index is None) or (index == self._last_index + 1)
+        ):
+            self._sum_sq += (y - self._last) ** 2
+            self.n += 1
+        self._last = y
+        self._last_index = index
+
+    @property
+    def variance(self):
+        """Allan variance, or nan if fewer than two adjacent averages were added."""
+        return 0.5 * self._sum_sq / self.n if self.n > 0 else math.nan
+
+    @property
+    def deviation(self):
+        """Allan deviation."""
+        return math.sqrt(self.variance)
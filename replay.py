@@ -0,0 +1,205 @@
+"""Replay a freerun save file through the normal writer path for load testing.
+
+Rows of an existing tsv save file are re-emitted at their original spacing divided
+by a speed-up factor, or as fast as possible, and saved by the same writers as a
+real run. Each row's timestamp is replaced with the time it was emitted, so anything
+reading the new save file, e.g. the live data page, sees a run in progress and the
+latency of each row can be measured from when it was emitted to when it became
+readable in the file.
+"""
+import argparse
+import pathlib
+import threading
+import time
+
+import yaml
+
+import freerun
+from metrics import summarise
+from storage import COLUMNS
+from tailreader import TailReader
+from tsvload import read_columns
+
+
+def read_rows(path):
+    """Read rows from a tsv save file one at a time.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to tsv save file.
+
+    Yields
+    ------
+    row : list of float
+        Row of data. The header and malformed rows are skipped.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                yield [float(x) for x in line.split("\t")]
+            except ValueError:
+                continue
+
+
+def replay(source, writer, speed=1.0, stop=None, live=None, columns=COLUMNS):
+    """Re-emit the rows of a save file to a writer.
+
+    Parameters
+    ----------
+    source : str or pathlib.Path
+        Path to tsv save file to replay.
+    writer : storage.BufferedWriter or storage.QueuedWriter
+        Save file writer.
+    speed : float or None
+        Speed-up factor relative to the original timestamps. If None or zero, rows
+        are emitted as fast as possible.
+    stop : threading.Event, optional
+        Event that stops the replay when set.
+    live : shmring.SharedRingBuffer, optional
+        Shared memory buffer that each row is also added to.
+    columns : list of str
+        Columns of the rows the writer saves, and `live` holds if given. The source
+        must have the same number of columns.
+
+    Returns
+    -------
+    rows : int
+        Number of rows emitted.
+    elapsed : float
+        Time taken in s.
+    max_lag : float
+        Longest time a row was emitted after it was due in s.
+    """
+    source_columns, _ = read_columns(source)
+    if len(source_columns) != len(columns):
+        raise ValueError(
+            f"Invalid replay source columns: {source_columns}. Must have "
+            + f"{len(columns)} columns to match the save file, e.g. a save file "
+            + "recorded in the same mode."
+        )
+
+    rows = 0
+    max_lag = 0.0
+    t0 = None
+    t_start = time.monotonic()
+    offset = time.time() - t_start
+    for row in read_rows(source):
+        if (stop is not None) and stop.is_set():
+            break
+
+        if t0 is None:
+            t0 = row[0]
+        if speed:
+            due = t_start + (row[0] - t0) / speed
+            remaining = due - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                max_lag = max(max_lag, -remaining)
+
+        # timestamp the row with the time it was emitted
+        row[0] = time.monotonic() + offset
+        writer.writerow(row)
+        if live is not None:
+            live.extend([row])
+        rows += 1
+
+    return rows, time.monotonic() - t_start, max_lag
+
+
+class LatencyProbe:
+    """Measure how long emitted rows take to become readable in a tsv save file.
+
+    The file is tailed in a background thread and the latency of each row is the
+    time it was read minus its timestamp.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to tsv save file.
+    poll_interval : float
+        Time between reads of the file in s.
+    """
+
+    def __init__(self, path, poll_interval=0.01):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.latencies = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="latency-probe")
+        # rows already in the file weren't emitted by this replay
+        self._reader = TailReader(path, usecols=[0])
+        self._reader.offset = pathlib.Path(path).stat().st_size
+
+    def _run(self):
+        while True:
+            # check the stop flag before reading so rows written before stopping are
+            # still read
+            stopping = self._stop.is_set()
+            data, _ = self._reader.read()
+            now = time.time()
+            self.latencies.extend((now - data[:, 0]).tolist())
+            if stopping:
+                break
+            time.sleep(self.poll_interval)
+
+    def start(self):
+        """Start tailing the file."""
+        self._thread.start()
+
+    def stop(self):
+        """Read any remaining rows and stop tailing the file."""
+        self._stop.set()
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="Path to tsv save file to replay.")
+    parser.add_argument(
+        "-c",
+        "--config-path",
+        default="example_config.yaml",
+        help="Path to configuration file (yaml format) with the writer settings.",
+    )
+    parser.add_argument(
+        "-s", "--save-path", default="replay.tsv", help="Path for new save file."
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Speed-up factor relative to the original timing, 0 for max speed.",
+    )
+    args = parser.parse_args()
+
+    with open(args.config_path, "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    save_path = pathlib.Path(args.save_path)
+    output_format = config.get("output_format", "tsv")
+    freerun.init_save_file(save_path, output_format)
+
+    probe = None
+    if output_format == "tsv":
+        probe = LatencyProbe(save_path)
+        probe.start()
+
+    try:
+        t_start = time.monotonic()
+        with freerun.open_writer(save_path, config) as writer:
+            rows, elapsed, max_lag = replay(args.source, writer, args.speed)
+        # include the time taken to write rows still held when the replay finished
+        elapsed_written = time.monotonic() - t_start
+    finally:
+        if probe is not None:
+            probe.stop()
+
+    print(f"Replayed {rows} rows in {elapsed:.2f} s")
+    print(f"Emit throughput: {rows / elapsed:.1f} rows/s")
+    print(f"Sustained throughput to disk: {rows / elapsed_written:.1f} rows/s")
+    if args.speed:
+        print(f"Max lag behind schedule: {max_lag * 1000:.2f} ms")
+    if probe is not None:
+        print(f"Emit to readable in file: {summarise(probe.latencies)}")
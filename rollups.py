@@ -0,0 +1,198 @@
+"""Summarise measurements over fixed time windows while they're acquired."""
+import math
+import pathlib
+
+from onlinestats import AllanVariance, RunningStats
+from storage import COLUMNS, TSVWriter
+
+# statistics written for each column
+STATISTICS = ["mean", "std", "min", "max", "adev"]
+
+
+def rollup_path(save_path, window):
+    """Get the path of a rollup file for a save file.
+
+    Parameters
+    ----------
+    save_path : str or pathlib.Path
+        Path to save file.
+    window : float
+        Window length in s.
+
+    Returns
+    -------
+    path : pathlib.Path
+        Path to rollup tsv file.
+    """
+    save_path = pathlib.Path(save_path)
+    return save_path.with_name(f"{save_path.name}.rollup_{window:g}s.tsv")
+
+
+class RollupLevel:
+    """Statistics of each column over consecutive windows of one length.
+
+    Windows are aligned to multiples of the window length since the epoch, so windows
+    of different lengths nest. Each window record holds the number of samples and the
+    mean, standard deviation, minimum, and maximum of each column. It also holds the
+    Allan deviation of the averages of the next shorter windows within it. For the
+    shortest windows that's the Allan deviation of the samples themselves.
+
+    Parameters
+    ----------
+    window : float
+        Window length in s.
+    ncols : int
+        Number of columns.
+    """
+
+    def __init__(self, window, ncols):
+        self.window = window
+        self.ncols = ncols
+        self.index = None
+        self._reset()
+
+    def _reset(self):
+        self.stats = [RunningStats() for _ in range(self.ncols)]
+        self.allan = [AllanVariance() for _ in range(self.ncols)]
+
+    def add(self, values):
+        """Add a sample to the current window.
+
+        Parameters
+        ----------
+        values : list of float
+            Sample value of each column.
+        """
+        for stats, value in zip(self.stats, values):
+            stats.update(value)
+
+    def add_average(self, averages, index=None):
+        """Add the averages of a shorter window within the current window.
+
+        Parameters
+        ----------
+        averages : list of float
+            Average of each column.
+        index : int, optional
+            Index of the shorter window, so only adjacent windows are compared.
+        """
+        for allan, average in zip(self.allan, averages):
+            allan.update(average, index)
+
+    def record(self):
+        """Get the record of the current window.
+
+        Returns
+        -------
+        record : list of float
+            Window start time, number of samples, and the statistics of each column.
+        """
+        record = [self.index * self.window, self.stats[0].n]
+        for stats, allan in zip(self.stats, self.allan):
+            std = stats.std if stats.n > 1 else math.nan
+            record += [stats.mean, std, stats.min, stats.max, allan.deviation]
+        return record
+
+
+class Rollups:
+    """Write rollup files of statistics over several window lengths.
+
+    Memory use is constant: each window length keeps running statistics of its
+    current window only. A window's record is written once a sample from a later
+    window arrives, and the current windows are written when the rollups are closed.
+
+    Parameters
+    ----------
+    save_path : str or pathlib.Path
+        Path to save file. Rollup files are written alongside it, see `rollup_path`.
+    windows : list of float
+        Window lengths in s, from shortest to longest.
+    columns : list of str
+        Names of the columns to summarise.
+    all_columns : list of str
+        Column names of the measured rows. Column 0 must be the timestamp.
+    """
+
+    def __init__(
+        self,
+        save_path,
+        windows=(1, 60, 3600),
+        columns=("X (V)", "Y (V)", "R (V)", "Phase (deg)"),
+        all_columns=COLUMNS,
+    ):
+        if list(windows) != sorted(windows):
+            raise ValueError(
+                f"Invalid rollup windows: {windows}. Must be in increasing order."
+            )
+        for name in columns:
+            if name not in all_columns:
+                raise ValueError(
+                    f"Invalid column: {name}. Must be one of {all_columns}."
+                )
+
+        self.indices = [all_columns.index(name) for name in columns]
+        self.levels = [RollupLevel(window, len(columns)) for window in windows]
+
+        header = ["window start (s)", "n"]
+        for name in columns:
+            header += [f"{name} {statistic}" for statistic in STATISTICS]
+
+        self.writers = []
+        for window in windows:
+            path = rollup_path(save_path, window)
+            if not path.exists():
+                with open(path, "w", newline="\n") as f:
+                    f.write("\t".join(header) + "\n")
+            self.writers.append(TSVWriter(path))
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit the runtime context."""
+        self.close()
+
+    def add(self, row):
+        """Add a measured row.
+
+        Parameters
+        ----------
+        row : list of float
+            Measured row.
+        """
+        t = row[0]
+        values = [row[i] for i in self.indices]
+
+        # averages of the shorter window that just finished, if any
+        finished = None
+        for level, writer in zip(self.levels, self.writers):
+            if finished is not None:
+                level.add_average(*finished)
+                finished = None
+
+            index = math.floor(t / level.window)
+            if level.index != index:
+                if level.index is not None:
+                    writer.writerow(level.record())
+                    finished = ([stats.mean for stats in level.stats], level.index)
+                level.index = index
+                level._reset()
+
+        # the shortest windows compare individual samples
+        self.levels[0].add_average(values)
+        for level in self.levels:
+            level.add(values)
+
+    def close(self):
+        """Write the records of the current windows and close the rollup files."""
+        finished = None
+        for level, writer in zip(self.levels, self.writers):
+            if finished is not None:
+                level.add_average(*finished)
+            if (level.index is not None) and (level.stats[0].n > 0):
+                writer.writerow(level.record())
+                finished = ([stats.mean for stats in level.stats], level.index)
+            else:
+                finished = None
+            writer.close()
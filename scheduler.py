@@ -0,0 +1,193 @@
+"""Schedule measurements at regular intervals without drift."""
+import math
+import time
+
+from onlinestats import RunningStats
+
+
+class DeadlineScheduler:
+    """Wait until absolute deadlines spaced at a regular interval.
+
+    Deadlines are measured on the monotonic clock from the first call to `wait`, so
+    the time taken by each measurement doesn't accumulate into the period.
+
+    Parameters
+    ----------
+    interval : float
+        Interval between deadlines in s. If zero, `wait` returns immediately.
+    missed_slots : str
+        What to do when a measurement overruns past the next deadline. "skip" waits
+        for the next deadline still in the future, leaving a gap in the time series.
+        "flag" measures immediately and reports the overrun.
+    log_every : int or None
+        Print a summary of jitter and overrun statistics every `log_every` points.
+        If None, no summary is printed.
+    """
+
+    def __init__(self, interval, missed_slots="skip", log_every=None):
+        if missed_slots not in ["skip", "flag"]:
+            raise ValueError(
+                f"Invalid missed slot policy: {missed_slots}. Must be 'skip' or "
+                + "'flag'."
+            )
+
+        self.interval = interval
+        self.missed_slots = missed_slots
+        self.log_every = log_every
+
+        self._t0 = None
+        self._slot = 0
+
+        self.points = 0
+        # number of deadlines that had already passed when waited for
+        self.overruns = 0
+        # number of slots skipped because of overruns
+        self.skipped = 0
+        # time after its deadline each wait returned in s
+        self.jitter = RunningStats()
+
+    def set_interval(self, interval):
+        """Change the interval between deadlines from the next deadline on.
+
+        Parameters
+        ----------
+        interval : float
+            New interval in s.
+        """
+        if self._t0 is not None:
+            # measure later deadlines from the last one
+            self._t0 += self._slot * self.interval
+            self._slot = 0
+        self.interval = interval
+
+    def wait(self):
+        """Sleep until the next deadline.
+
+        Returns
+        -------
+        lateness : float
+            Time after the deadline this call returned in s.
+        """
+        now = time.monotonic()
+        if self._t0 is None:
+            self._t0 = now
+            deadline = now
+        elif self.interval <= 0:
+            deadline = now
+        else:
+            self._slot += 1
+            deadline = self._t0 + self._slot * self.interval
+            if now > deadline:
+                self.overruns += 1
+                if self.missed_slots == "skip":
+                    missed = math.ceil((now - deadline) / self.interval)
+                    self._slot += missed
+                    self.skipped += missed
+                    deadline += missed * self.interval
+                else:
+                    print(f"Measurement overran its slot by {now - deadline:.3f} s.")
+
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+        lateness = time.monotonic() - deadline
+        self.points += 1
+        self.jitter.update(lateness)
+        if (self.log_every is not None) and (self.points % self.log_every == 0):
+            print(self.summary())
+
+        return lateness
+
+    def summary(self):
+        """Summarise the scheduling statistics.
+
+        Returns
+        -------
+        summary : str
+            Jitter and overrun statistics.
+        """
+        return (
+            f"{self.points} points: jitter mean={self.jitter.mean * 1000:.2f} ms, "
+            + f"std={self.jitter.std * 1000:.2f} ms, "
+            + f"max={self.jitter.max * 1000:.2f} ms; {self.overruns} overruns, "
+            + f"{self.skipped} skipped slots"
+        )
+
+
+class AdaptiveInterval:
+    """Adapt the measurement interval to how fast the signal is changing.
+
+    After each measurement, the largest change in any monitored column since the
+    previous measurement is compared with that column's tolerance. The interval is
+    narrowed when the signal moved by more than the tolerance, and widened when it
+    moved by less than `quiet` times the tolerance.
+
+    Parameters
+    ----------
+    interval : float
+        Initial interval in s.
+    min_interval : float
+        Shortest interval in s.
+    max_interval : float
+        Longest interval in s.
+    tolerances : dict
+        Absolute tolerances keyed by column index.
+    widen : float
+        Factor the interval is multiplied by when the signal is quiet.
+    narrow : float
+        Factor the interval is multiplied by when the signal is changing.
+    quiet : float
+        Fraction of the tolerances below which the signal is considered quiet.
+    """
+
+    def __init__(
+        self,
+        interval,
+        min_interval,
+        max_interval,
+        tolerances,
+        widen=1.5,
+        narrow=0.5,
+        quiet=0.25,
+    ):
+        if min_interval > max_interval:
+            raise ValueError(
+                f"Invalid interval range: {min_interval} - {max_interval}. Minimum "
+                + "must not be greater than maximum."
+            )
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.tolerances = tolerances
+        self.widen = widen
+        self.narrow = narrow
+        self.quiet = quiet
+        self._last = None
+
+    def update(self, row):
+        """Update the interval after a measurement.
+
+        Parameters
+        ----------
+        row : list
+            Measured row.
+
+        Returns
+        -------
+        interval : float
+            Interval until the next measurement in s.
+        """
+        if self._last is not None:
+            change = max(
+                abs(row[i] - self._last[i]) / tolerance
+                for i, tolerance in self.tolerances.items()
+            )
+            if change > 1:
+                self.interval = max(self.interval * self.narrow, self.min_interval)
+            elif change < self.quiet:
+                self.interval = min(self.interval * self.widen, self.max_interval)
+        self._last = row
+
+        return self.interval
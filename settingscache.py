@@ -0,0 +1,132 @@
+"""Write-through cache of instrument settings to avoid redundant bus transactions."""
+import time
+
+# settings that hold their value until they're written or changed by the instrument
+CACHED_SETTINGS = {
+    "input_configuration",
+    "input_coupling",
+    "input_shield_grounding",
+    "line_notch_filter_status",
+    "reference_source",
+    "reference_trigger",
+    "harmonic",
+    "sync_filter_status",
+    "reserve_mode",
+    "time_constant",
+    "lowpass_filter_slope",
+    "sensitivity",
+    "sample_rate",
+    "end_of_buffer_mode",
+}
+
+# settings changed by instrument functions, which must be read again afterwards
+INVALIDATED_BY = {
+    "auto_gain": {"sensitivity"},
+    "auto_reserve": {"reserve_mode"},
+    "connect": CACHED_SETTINGS,
+    "reset": CACHED_SETTINGS,
+}
+
+
+class CachedInstrument:
+    """Proxy for an instrument that caches the last known value of each setting.
+
+    Reads of cached settings are served from the cache and writes that wouldn't
+    change a setting are skipped. Other attributes and methods pass straight through.
+    The reference frequency isn't cached because with an external reference it's a
+    measurement. Cached values are discarded after functions that change settings,
+    e.g. auto-gain, and after `max_age` seconds to pick up changes made on the front
+    panel.
+
+    Parameters
+    ----------
+    instrument : object
+        Instrument object.
+    max_age : float or None
+        Maximum age of a cached value in s. If None, values never expire.
+    """
+
+    def __init__(self, instrument, max_age=None):
+        object.__setattr__(self, "_instrument", instrument)
+        object.__setattr__(self, "_max_age", max_age)
+        # cached values as (value, time cached) pairs
+        object.__setattr__(self, "_cache", {})
+        # numbers of bus transactions avoided
+        object.__setattr__(self, "saved_reads", 0)
+        object.__setattr__(self, "saved_writes", 0)
+
+    @property
+    def saved(self):
+        """Total number of bus transactions avoided."""
+        return self.saved_reads + self.saved_writes
+
+    def invalidate(self, *names):
+        """Discard cached settings so they're read from the instrument next time.
+
+        Parameters
+        ----------
+        *names : str
+            Names of settings to discard. If none are given, all are discarded.
+        """
+        if len(names) == 0:
+            self._cache.clear()
+        for name in names:
+            self._cache.pop(name, None)
+
+    def _cached(self, name):
+        """Get a cached value as a tuple, or None if it isn't cached or expired."""
+        if name not in self._cache:
+            return None
+
+        value, t_cached = self._cache[name]
+        age = time.monotonic() - t_cached
+        if (self._max_age is not None) and (age > self._max_age):
+            del self._cache[name]
+            return None
+
+        return (value,)
+
+    def __getattr__(self, name):
+        """Get an attribute, serving cached settings from the cache."""
+        if name in CACHED_SETTINGS:
+            cached = self._cached(name)
+            if cached is not None:
+                object.__setattr__(self, "saved_reads", self.saved_reads + 1)
+                return cached[0]
+            value = getattr(self._instrument, name)
+            self._cache[name] = (value, time.monotonic())
+            return value
+
+        value = getattr(self._instrument, name)
+        if name in INVALIDATED_BY:
+
+            def invalidating(*args, **kwargs):
+                try:
+                    return value(*args, **kwargs)
+                finally:
+                    self.invalidate(*INVALIDATED_BY[name])
+
+            return invalidating
+
+        return value
+
+    def __setattr__(self, name, value):
+        """Set an attribute, skipping writes that wouldn't change a setting."""
+        if name in CACHED_SETTINGS:
+            cached = self._cached(name)
+            if (cached is not None) and (cached[0] == value):
+                object.__setattr__(self, "saved_writes", self.saved_writes + 1)
+                return
+            try:
+                setattr(self._instrument, name, value)
+            except Exception:
+                # the instrument state is unknown if the write failed
+                self.invalidate(name)
+                raise
+            self._cache[name] = (value, time.monotonic())
+        else:
+            setattr(self._instrument, name, value)
+
+    def __delattr__(self, name):
+        """Delete an attribute of the instrument."""
+        delattr(self._instrument, name)
@@ -0,0 +1,199 @@
+"""Ring buffer of measurements in shared memory for live plotting."""
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# header layout: int64 fields followed by the first timestamp as float64
+_SEQ = 0
+_TOTAL = 1
+_CAPACITY = 2
+_NCOLS = 3
+_N_FIELDS = 4
+# byte offset of the first timestamp ever written
+_T0_OFFSET = _N_FIELDS * 8
+# byte offset of the data, aligned to a cache line
+_DATA_OFFSET = 64
+
+
+class SharedRingBuffer:
+    """Fixed-size buffer of the most recent rows in shared memory.
+
+    One process writes rows and any number of processes read them without locks. A
+    sequence counter is incremented before and after each write, so it's odd while a
+    write is in progress. Readers take numpy views of the shared memory, copy out only
+    the rows and columns they need, and retry if the counter changed in the meantime.
+    This relies on stores becoming visible in program order, which holds on x86.
+
+    Use `create` or `attach` rather than calling the constructor directly.
+
+    Parameters
+    ----------
+    shm : multiprocessing.shared_memory.SharedMemory
+        Shared memory block.
+    owner : bool
+        Whether this object created the block and should unlink it when closed.
+    notify : multiprocessing.Event, optional
+        Event set after each write, so readers can wait for new rows instead of
+        polling.
+    """
+
+    def __init__(self, shm, owner=False, notify=None):
+        self._shm = shm
+        self._owner = owner
+        self._notify = notify
+        self._header = np.ndarray((_N_FIELDS,), dtype="<i8", buffer=shm.buf)
+        self._t0 = np.ndarray((1,), dtype="<f8", buffer=shm.buf, offset=_T0_OFFSET)
+        self.capacity = int(self._header[_CAPACITY])
+        self.ncols = int(self._header[_NCOLS])
+        self._data = np.ndarray(
+            (self.capacity, self.ncols),
+            dtype="<f8",
+            buffer=shm.buf,
+            offset=_DATA_OFFSET,
+        )
+
+    @classmethod
+    def create(cls, capacity, ncols, name=None):
+        """Create a new shared ring buffer.
+
+        Parameters
+        ----------
+        capacity : int
+            Maximum number of rows held.
+        ncols : int
+            Number of columns.
+        name : str, optional
+            Name of the shared memory block. If None, a unique name is chosen.
+
+        Returns
+        -------
+        buffer : SharedRingBuffer
+            New buffer, which unlinks the shared memory when closed.
+        """
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity: {capacity}. Must be at least 1.")
+
+        size = _DATA_OFFSET + capacity * ncols * 8
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((_N_FIELDS,), dtype="<i8", buffer=shm.buf)
+        header[:] = [0, 0, capacity, ncols]
+        np.ndarray((1,), dtype="<f8", buffer=shm.buf, offset=_T0_OFFSET)[0] = np.nan
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, notify=None):
+        """Attach to an existing shared ring buffer.
+
+        Parameters
+        ----------
+        name : str
+            Name of the shared memory block.
+        notify : multiprocessing.Event, optional
+            Event set after each write by this object.
+
+        Returns
+        -------
+        buffer : SharedRingBuffer
+            Attached buffer.
+        """
+        return cls(shared_memory.SharedMemory(name=name), notify=notify)
+
+    @property
+    def name(self):
+        """Name of the shared memory block."""
+        return self._shm.name
+
+    @property
+    def total(self):
+        """Total number of rows ever written."""
+        return int(self._header[_TOTAL])
+
+    @property
+    def t0(self):
+        """First timestamp ever written, or nan if nothing has been written."""
+        return float(self._t0[0])
+
+    def extend(self, rows):
+        """Add rows, overwriting the oldest rows if full.
+
+        Only one process may write to a buffer.
+
+        Parameters
+        ----------
+        rows : array-like
+            2D array of rows.
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.ncols)
+        n = len(rows)
+        if n == 0:
+            return
+
+        total = int(self._header[_TOTAL])
+        if n > self.capacity:
+            total += n - self.capacity
+            rows = rows[-self.capacity :]
+            n = self.capacity
+
+        # odd while writing
+        self._header[_SEQ] += 1
+        if np.isnan(self._t0[0]):
+            self._t0[0] = rows[0, 0]
+        head = total % self.capacity
+        first = min(n, self.capacity - head)
+        self._data[head : head + first] = rows[:first]
+        self._data[: n - first] = rows[first:]
+        self._header[_TOTAL] = total + n
+        self._header[_SEQ] += 1
+
+        if self._notify is not None:
+            self._notify.set()
+
+    def read(self, since=0, usecols=None):
+        """Read rows written since a given total.
+
+        Parameters
+        ----------
+        since : int
+            Total number of rows written at the last read. Rows overwritten since
+            then are skipped.
+        usecols : list of int or None
+            Indices of columns to return. If None, all columns are returned.
+
+        Returns
+        -------
+        data : numpy.ndarray
+            Copy of the new rows, oldest first.
+        total : int
+            Total number of rows written, to pass as `since` next time.
+        """
+        while True:
+            seq = int(self._header[_SEQ])
+            if seq % 2 == 1:
+                # write in progress
+                time.sleep(0)
+                continue
+
+            total = int(self._header[_TOTAL])
+            n = max(0, min(total - since, self.capacity))
+            start = (total - n) % self.capacity
+            if start + n <= self.capacity:
+                views = [self._data[start : start + n]]
+            else:
+                views = [self._data[start:], self._data[: start + n - self.capacity]]
+            if usecols is None:
+                data = np.concatenate(views)
+            else:
+                data = np.concatenate([view[:, usecols] for view in views])
+
+            if int(self._header[_SEQ]) == seq:
+                return data, total
+
+    def close(self):
+        """Detach from the shared memory, unlinking it if this object created it."""
+        # views must be released before the block can be closed
+        self._header = self._t0 = self._data = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
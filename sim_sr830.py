@@ -0,0 +1,614 @@
+"""Simulated SRS SR830 lock-in amplifier.
+
+Provides an in-process stand-in for `sr830.sr830` so the freerun loop can be run and
+profiled without tying up a real instrument. Only the parts of the driver API used by
+this package are implemented.
+
+The simulated input is a sinusoid of amplitude R and fixed phase, optionally with step
+changes in amplitude. The outputs are passed through a model of the lock-in's
+cascaded RC low-pass filter (order set by `lowpass_filter_slope`) so they settle
+after a step with the configured time constant. Every command sent to the instrument
+incurs a configurable bus latency plus a per-byte transfer time.
+"""
+import math
+import random
+import re
+import struct
+import threading
+import time
+
+# full scale sensitivity in V
+SENSITIVITIES = [
+    2e-9,
+    5e-9,
+    10e-9,
+    20e-9,
+    50e-9,
+    100e-9,
+    200e-9,
+    500e-9,
+    1e-6,
+    2e-6,
+    5e-6,
+    10e-6,
+    20e-6,
+    50e-6,
+    100e-6,
+    200e-6,
+    500e-6,
+    1e-3,
+    2e-3,
+    5e-3,
+    10e-3,
+    20e-3,
+    50e-3,
+    100e-3,
+    200e-3,
+    500e-3,
+    1,
+]
+
+# time constants in s
+TIME_CONSTANTS = [
+    10e-6,
+    30e-6,
+    100e-6,
+    300e-6,
+    1e-3,
+    3e-3,
+    10e-3,
+    30e-3,
+    100e-3,
+    300e-3,
+    1,
+    3,
+    10,
+    30,
+    100,
+    300,
+    1e3,
+    3e3,
+    10e3,
+    30e3,
+]
+
+# buffer sample rates in Hz, the last setting is triggered sampling
+SAMPLE_RATES = [0.0625 * 2 ** i for i in range(14)] + ["Trigger"]
+
+# maximum number of points that can be stored in a data buffer
+BUFFER_LENGTH = 16383
+
+# fraction of full scale at which an input overload is reported
+OVERLOAD = 1.09
+
+
+def filter_step_response(t, time_constant, order):
+    """Calculate the unit step response of a cascaded RC low-pass filter.
+
+    Parameters
+    ----------
+    t : float
+        Time since the step in s.
+    time_constant : float
+        Time constant of each filter stage in s.
+    order : int
+        Number of filter stages (1 to 4 for 6 to 24 dB/oct).
+
+    Returns
+    -------
+    response : float
+        Fraction of the step seen at the filter output.
+    """
+    if t <= 0:
+        return 0.0
+
+    x = t / time_constant
+    if x > 50:
+        return 1.0
+
+    return 1 - math.exp(-x) * sum(x ** k / math.factorial(k) for k in range(order))
+
+
+class _SimResource:
+    """Minimal simulated PyVISA resource for raw commands.
+
+    Only binary buffer transfers (TRCB) and LIA status queries (LIAS?) are supported.
+    """
+
+    def __init__(self, lockin):
+        self._lockin = lockin
+        self._response = b""
+
+    def write(self, command):
+        """Write a command to the simulated instrument.
+
+        Parameters
+        ----------
+        command : str
+            Command string.
+        """
+        self._lockin._transact()
+        match = re.fullmatch(r"TRCB\?\s*(\d+),(\d+),(\d+)", command.strip())
+        if match is None:
+            raise ValueError(f"Unsupported command: {command}")
+        channel, start_bin, bins = (int(x) for x in match.groups())
+        data = self._lockin._buffer_data(channel, start_bin, bins)
+        self._response = struct.pack(f"<{len(data)}f", *data)
+
+    def query(self, command):
+        """Write a query to the simulated instrument and read the response.
+
+        Parameters
+        ----------
+        command : str
+            Query string.
+
+        Returns
+        -------
+        response : str
+            Response string.
+        """
+        if command.strip() != "LIAS?":
+            raise ValueError(f"Unsupported command: {command}")
+        self._lockin._transact(4)
+        return f"{self._lockin._lia_status()}\n"
+
+    def read_bytes(self, count):
+        """Read bytes from the simulated instrument.
+
+        Parameters
+        ----------
+        count : int
+            Number of bytes to read.
+
+        Returns
+        -------
+        data : bytes
+            Response bytes.
+        """
+        data, self._response = self._response[:count], self._response[count:]
+        self._lockin._transact(len(data), command=False)
+        return data
+
+
+def _setting(name):
+    """Create a property for a simple instrument setting.
+
+    Reads and writes each cost one bus transaction.
+    """
+
+    def getter(self):
+        self._transact()
+        return self._settings[name]
+
+    def setter(self, value):
+        self._transact()
+        self._settings[name] = value
+
+    return property(getter, setter)
+
+
+class sr830:
+    """Simulated SR830 lock-in amplifier.
+
+    Parameters
+    ----------
+    signal : float
+        Initial signal amplitude (R) in V.
+    phase : float
+        Signal phase in degrees.
+    noise : float
+        Relative RMS noise on each output sample.
+    noise_floor : float
+        Absolute RMS noise on each output sample in V.
+    steps : list of tuple
+        Step changes in signal amplitude as `(time, amplitude)` pairs, where time is
+        measured in s from when the instrument was connected.
+    step_every : float or None
+        If not None, change the signal amplitude to a log-uniformly distributed random
+        value within `step_range` every `step_every` seconds.
+    step_range : tuple of float
+        Minimum and maximum amplitudes of random steps in V.
+    gain_glitch : float
+        Fractional disturbance of the filtered output caused by a sensitivity
+        change. The disturbance decays with the filter response.
+    latency : float
+        Time taken for each command round-trip on the bus in s.
+    byte_time : float
+        Additional time taken to transfer each byte of a response in s.
+    auto_gain_time : float
+        Time taken by the instrument's auto-gain function in units of the current time
+        constant.
+    seed : int or None
+        Seed for the noise generator.
+    """
+
+    sensitivities = SENSITIVITIES
+    time_constants = TIME_CONSTANTS
+    sample_rates = SAMPLE_RATES
+    lowpass_filter_slopes = [6, 12, 18, 24]
+    input_configurations = ["A", "A-B", "I (1 MOhm)", "I (100 MOhm)"]
+    input_couplings = ["AC", "DC"]
+    groundings = ["Float", "Ground"]
+    input_line_notch_filter_statuses = [
+        "No filters",
+        "Line notch",
+        "2x line notch",
+        "Both notch",
+    ]
+    reference_sources = ["External", "Internal"]
+    triggers = ["Sine zero crossing", "TTL rising edge", "TTL falling edge"]
+    reserve_modes = ["High reserve", "Normal", "Low noise"]
+
+    def __init__(
+        self,
+        signal=1e-6,
+        phase=45.0,
+        noise=0.01,
+        noise_floor=1e-9,
+        steps=None,
+        step_every=None,
+        step_range=(1e-7, 1e-2),
+        gain_glitch=0.2,
+        latency=0.002,
+        byte_time=1e-6,
+        auto_gain_time=10,
+        seed=None,
+    ):
+        self.phase = phase
+        self.noise = noise
+        self.noise_floor = noise_floor
+        self.steps = sorted(steps or [])
+        self.step_every = step_every
+        self.step_range = step_range
+        self.gain_glitch = gain_glitch
+        self.latency = latency
+        self.byte_time = byte_time
+        self.auto_gain_time = auto_gain_time
+
+        # number of bus transactions made
+        self.transactions = 0
+
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._t0 = time.time()
+        self._initial_signal = signal
+        # input amplitude changes as (time, delta) pairs in absolute time
+        self._events = []
+        # output disturbances from gain changes as (time, size) pairs
+        self._disturbances = []
+        self._next_random_step = None
+
+        self._settings = {
+            "input_configuration": 0,
+            "input_coupling": 0,
+            "input_shield_grounding": 1,
+            "line_notch_filter_status": 0,
+            "reference_source": 1,
+            "reference_frequency": 1000.0,
+            "reference_trigger": 1,
+            "harmonic": 1,
+            "sync_filter_status": 0,
+            "reserve_mode": 1,
+            "time_constant": 8,
+            "lowpass_filter_slope": 1,
+            "sensitivity": 26,
+            "sample_rate": 13,
+            "end_of_buffer_mode": 1,
+        }
+        self._displays = {1: [1, 0], 2: [1, 0]}
+
+        # buffer acquisition segments as [start time, stop time or None]
+        self._segments = []
+
+        # raw resource for commands not wrapped by the driver
+        self.instr = _SimResource(self)
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit the runtime context."""
+        self.disconnect()
+
+    def connect(self, output_interface=1, **kwargs):
+        """Connect to the simulated instrument.
+
+        Parameters
+        ----------
+        output_interface : int
+            Output communication interface (ignored).
+        **kwargs
+            PyVISA resource arguments (ignored).
+        """
+        with self._lock:
+            self._t0 = time.time()
+            self._events = [(self._t0 - 1e9, self._initial_signal)]
+            self._events.extend((self._t0 + t, 0) for t, _ in self.steps)
+            # convert absolute step amplitudes to deltas
+            amplitude = self._initial_signal
+            for i, (_, new_amplitude) in enumerate(self.steps, start=1):
+                self._events[i] = (self._events[i][0], new_amplitude - amplitude)
+                amplitude = new_amplitude
+            if self.step_every is not None:
+                self._next_random_step = self._t0 + self.step_every
+        self._transact()
+
+    def disconnect(self):
+        """Disconnect from the simulated instrument."""
+        pass
+
+    def _transact(self, nbytes=0, command=True):
+        """Simulate the time taken for a bus transaction.
+
+        Parameters
+        ----------
+        nbytes : int
+            Number of bytes in the response.
+        command : bool
+            Whether a command round-trip is made, as opposed to only reading a
+            response.
+        """
+        if command:
+            with self._lock:
+                self.transactions += 1
+        time.sleep(self.latency * command + nbytes * self.byte_time)
+
+    # simple instrument settings
+    input_configuration = _setting("input_configuration")
+    input_coupling = _setting("input_coupling")
+    input_shield_grounding = _setting("input_shield_grounding")
+    line_notch_filter_status = _setting("line_notch_filter_status")
+    reference_source = _setting("reference_source")
+    reference_frequency = _setting("reference_frequency")
+    reference_trigger = _setting("reference_trigger")
+    harmonic = _setting("harmonic")
+    sync_filter_status = _setting("sync_filter_status")
+    reserve_mode = _setting("reserve_mode")
+    time_constant = _setting("time_constant")
+    lowpass_filter_slope = _setting("lowpass_filter_slope")
+    end_of_buffer_mode = _setting("end_of_buffer_mode")
+
+    @property
+    def sample_rate(self):
+        """Get the buffer sample rate setting."""
+        self._transact()
+        return self._settings["sample_rate"]
+
+    @sample_rate.setter
+    def sample_rate(self, value):
+        """Set the buffer sample rate setting, this also resets the buffers."""
+        self._transact()
+        with self._lock:
+            self._settings["sample_rate"] = value
+            self._segments = []
+
+    @property
+    def sensitivity(self):
+        """Get the sensitivity setting."""
+        self._transact()
+        return self._settings["sensitivity"]
+
+    @sensitivity.setter
+    def sensitivity(self, value):
+        """Set the sensitivity setting.
+
+        Changing the sensitivity disturbs the filtered output, which then settles with
+        the filter response.
+        """
+        self._transact()
+        self._set_sensitivity(value)
+
+    def _set_sensitivity(self, value):
+        with self._lock:
+            if value != self._settings["sensitivity"]:
+                now = time.time()
+                self._disturbances.append((now, self.gain_glitch * self._input(now)))
+                # old disturbances have decayed completely, so discard them
+                horizon = now - 60 * self._tc()
+                self._disturbances = [d for d in self._disturbances if d[0] > horizon]
+            self._settings["sensitivity"] = value
+
+    def set_display(self, channel, display, ratio=0):
+        """Set a channel display.
+
+        Parameters
+        ----------
+        channel : int
+            Channel, 1 or 2.
+        display : int
+            Display setting, e.g. 0 = X/Y, 1 = R/Phase.
+        ratio : int
+            Ratio setting.
+        """
+        self._transact()
+        self._displays[channel] = [display, ratio]
+
+    def _tc(self):
+        return self.time_constants[self._settings["time_constant"]]
+
+    def _input(self, t):
+        """Get the unfiltered input amplitude at time t."""
+        self._random_steps(t)
+        return sum(delta for t_event, delta in self._events if t_event <= t)
+
+    def _random_steps(self, t):
+        """Add random steps to the input up to time t if enabled."""
+        if self._next_random_step is None:
+            return
+
+        while self._next_random_step <= t:
+            amplitude = sum(
+                delta
+                for t_event, delta in self._events
+                if t_event <= self._next_random_step
+            )
+            new_amplitude = math.exp(
+                self._rng.uniform(*(math.log(x) for x in self.step_range))
+            )
+            self._events.append((self._next_random_step, new_amplitude - amplitude))
+            self._next_random_step += self.step_every
+
+    def _filtered(self, t):
+        """Get the noise-free filtered amplitude at time t."""
+        tc = self._tc()
+        order = self._settings["lowpass_filter_slope"] + 1
+        self._random_steps(t)
+        r = sum(
+            delta * filter_step_response(t - t_event, tc, order)
+            for t_event, delta in self._events
+        )
+        r -= sum(
+            size * (1 - filter_step_response(t - t_dist, tc, order))
+            for t_dist, size in self._disturbances
+            if t_dist <= t
+        )
+        return r
+
+    def _outputs(self, t):
+        """Get noisy X, Y, R, and phase at time t."""
+        r = self._filtered(t)
+        r = abs(r + self._rng.gauss(0, self.noise * abs(r) + self.noise_floor))
+        phase = self.phase + self._rng.gauss(0, math.degrees(self.noise))
+        # outputs saturate when the input overloads
+        r = min(r, OVERLOAD * self.sensitivities[self._settings["sensitivity"]])
+        x = r * math.cos(math.radians(phase))
+        y = r * math.sin(math.radians(phase))
+        return x, y, r, phase
+
+    def _lia_status(self):
+        """Get the LIA status byte, reporting overloads at the current time only."""
+        with self._lock:
+            t = time.time()
+            full_scale = OVERLOAD * self.sensitivities[self._settings["sensitivity"]]
+            status = 0
+            if abs(self._input(t)) > full_scale:
+                # input overload
+                status |= 0b001
+            if abs(self._filtered(t)) > full_scale:
+                # output overload
+                status |= 0b100
+        return status
+
+    def _display(self, channel, t):
+        """Get the value shown on a channel display at time t."""
+        x, y, r, phase = self._outputs(t)
+        display = self._displays[channel][0]
+        if channel == 1:
+            return {0: x, 1: r}.get(display, 0.0)
+        else:
+            return {0: y, 1: phase}.get(display, 0.0)
+
+    def measure_multiple(self, parameters):
+        """Measure multiple parameters simultaneously.
+
+        Parameters
+        ----------
+        parameters : list of int
+            Parameters to measure: 1 = X, 2 = Y, 3 = R, 4 = Phase, 5-8 = Aux In 1-4,
+            9 = Reference frequency, 10 = CH1 display, 11 = CH2 display.
+
+        Returns
+        -------
+        values : tuple of float
+            Measured values.
+        """
+        with self._lock:
+            t = time.time()
+            x, y, r, phase = self._outputs(t)
+            lookup = {
+                1: x,
+                2: y,
+                3: r,
+                4: phase,
+                5: 0.0,
+                6: 0.0,
+                7: 0.0,
+                8: 0.0,
+                9: self._settings["reference_frequency"],
+                10: self._display(1, t),
+                11: self._display(2, t),
+            }
+            values = tuple(lookup[p] for p in parameters)
+        self._transact(15 * len(parameters))
+        return values
+
+    def auto_gain(self):
+        """Perform the instrument's auto-gain function."""
+        self._transact()
+        time.sleep(self.auto_gain_time * self._tc())
+        with self._lock:
+            r = self._filtered(time.time())
+            for ix, sensitivity in enumerate(self.sensitivities):
+                if r < 0.8 * sensitivity:
+                    break
+            self._set_sensitivity(ix)
+
+    def reset_data_buffers(self):
+        """Reset the data buffers."""
+        self._transact()
+        with self._lock:
+            self._segments = []
+
+    def start(self):
+        """Start or resume data storage."""
+        self._transact()
+        with self._lock:
+            if (len(self._segments) == 0) or (self._segments[-1][1] is not None):
+                self._segments.append([time.time(), None])
+
+    def pause(self):
+        """Pause data storage."""
+        self._transact()
+        with self._lock:
+            if (len(self._segments) > 0) and (self._segments[-1][1] is None):
+                self._segments[-1][1] = time.time()
+
+    def _sample_times(self):
+        """Get the times at which buffered points were sampled."""
+        rate = self.sample_rates[self._settings["sample_rate"]]
+        now = time.time()
+        times = []
+        for start, stop in self._segments:
+            stop = now if stop is None else stop
+            n = int((stop - start) * rate)
+            times.extend(start + (i + 1) / rate for i in range(n))
+        return times[:BUFFER_LENGTH]
+
+    @property
+    def buffer_size(self):
+        """Get the number of points stored in the buffer."""
+        self._transact(6)
+        with self._lock:
+            return len(self._sample_times())
+
+    def _buffer_data(self, channel, start_bin, bins):
+        """Get points stored in a channel buffer."""
+        with self._lock:
+            times = self._sample_times()[start_bin : start_bin + bins]
+            return [self._display(channel, t) for t in times]
+
+    def get_ascii_buffer_data(self, channel, start_bin, bins):
+        """Get points stored in a channel buffer using ASCII transfer.
+
+        Parameters
+        ----------
+        channel : int
+            Channel buffer to read, 1 or 2.
+        start_bin : int
+            Index of first point to read.
+        bins : int
+            Number of points to read.
+
+        Returns
+        -------
+        data : list of float
+            Buffer data.
+        """
+        # format and parse the response like the real transfer
+        response = ",".join(
+            f"{x:e}" for x in self._buffer_data(channel, start_bin, bins)
+        )
+        self._transact(len(response))
+        return [float(x) for x in response.split(",") if x != ""]
@@ -0,0 +1,116 @@
+"""Benchmark the startup time of the Dash GUI.
+
+Each repeat runs in a fresh interpreter so module imports aren't cached. The time to
+import the app and its pages is measured, then the time for the server to build and
+serve the first render of each page.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from metrics import summarise
+
+# pages to render
+PAGES = ["/experiment", "/lia", "/livedata", "/metrics"]
+
+
+def page_request(pathname):
+    """Make the request body the browser sends to render a page.
+
+    Parameters
+    ----------
+    pathname : str
+        Page path.
+
+    Returns
+    -------
+    body : dict
+        Request body for the `display_page` callback.
+    """
+    return {
+        "output": "page-content.children",
+        "outputs": {"id": "page-content", "property": "children"},
+        "inputs": [{"id": "url", "property": "pathname", "value": pathname}],
+        "changedPropIds": ["url.pathname"],
+        "state": [{"id": "save_path", "property": "children", "value": ""}],
+    }
+
+
+def measure_startup(simulate=False):
+    """Measure the import and first render times in this interpreter.
+
+    Parameters
+    ----------
+    simulate : bool
+        Use the simulated lock-in amplifier module in place of the driver.
+
+    Returns
+    -------
+    timings : dict
+        Times in s keyed by startup phase.
+    """
+    if simulate:
+        import sim_sr830
+
+        sys.modules["sr830"] = sim_sr830
+
+    timings = {}
+    t_start = time.perf_counter()
+    import index
+
+    timings["import"] = time.perf_counter() - t_start
+
+    client = index.app.server.test_client()
+    t_start = time.perf_counter()
+    client.get("/")
+    client.get("/_dash-layout")
+    client.get("/_dash-dependencies")
+    timings["shell"] = time.perf_counter() - t_start
+
+    for pathname in PAGES:
+        t_start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=page_request(pathname))
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to render {pathname}: {response.status}")
+        timings[pathname] = time.perf_counter() - t_start
+
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--repeats", type=int, default=5, help="Number of fresh starts."
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="Use a simulated lock-in amplifier instead of the instrument driver.",
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_startup(args.simulate)))
+        raise SystemExit
+
+    command = [sys.executable, __file__, "--child"]
+    if args.simulate:
+        command.append("--simulate")
+
+    samples = {}
+    totals = []
+    for _ in range(args.repeats):
+        t_start = time.perf_counter()
+        output = subprocess.run(command, capture_output=True, check=True, text=True)
+        totals.append(time.perf_counter() - t_start)
+        for phase, duration in json.loads(output.stdout.splitlines()[-1]).items():
+            samples.setdefault(phase, []).append(duration)
+
+    print(f"Interpreter start to exit: {summarise(totals)}")
+    labels = {"import": "Import", "shell": "App shell (index, layout, dependencies)"}
+    for phase, durations in samples.items():
+        label = labels.get(phase, f"First render of {phase}")
+        print(f"{label}: {summarise(durations)}")
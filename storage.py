@@ -0,0 +1,360 @@
+"""Writers for freerun save files."""
+import collections
+import csv
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+# columns of a save file
+COLUMNS = [
+    "timestamp (s)",
+    "X (V)",
+    "Y (V)",
+    "Aux In 1 (V)",
+    "Aux In 2 (V)",
+    "Aux In 3 (V)",
+    "Aux In 4 (V)",
+    "R (V)",
+    "Phase (deg)",
+    "Freq (Hz)",
+    "Ch1 display",
+    "Ch2 display",
+]
+
+# header of a tsv save file
+HEADER = "\t".join(COLUMNS) + "\n"
+
+# columns of a save file recorded in streaming mode
+STREAM_COLUMNS = ["timestamp (s)", "Ch1 display", "Ch2 display"]
+
+
+class BufferedWriter:
+    """Base class for save file writers that write rows in batches.
+
+    Rows are held in memory and written in batches according to the durability
+    policy. All held rows are written when the writer is closed, including when an
+    exception or KeyboardInterrupt leaves its context. Subclasses implement
+    `_write_rows`, `_flush_file`, and `_close_file`.
+
+    Parameters
+    ----------
+    flush_rows : int
+        Write held rows once this many have accumulated.
+    flush_interval : float or None
+        Write held rows once this many seconds have passed since the last write. If
+        None, only `flush_rows` applies.
+    fsync : bool
+        If True, force written rows onto disk with `os.fsync` after each write.
+    """
+
+    def __init__(self, flush_rows=1, flush_interval=None, fsync=False):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self.closed = False
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit the runtime context."""
+        self.close()
+
+    def writerow(self, row):
+        """Add a row, writing held rows to the file if the policy requires it.
+
+        Parameters
+        ----------
+        row : list
+            Row of data.
+        """
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+        else:
+            self.poll()
+
+    def writerows(self, rows):
+        """Add several rows, writing held rows to the file if the policy requires it.
+
+        Parameters
+        ----------
+        rows : iterable of list
+            Rows of data.
+        """
+        self._rows.extend(rows)
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self):
+        """Write held rows if `flush_interval` has passed since the last write."""
+        if (
+            (len(self._rows) > 0)
+            and (self.flush_interval is not None)
+            and (time.monotonic() - self._last_flush >= self.flush_interval)
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write held rows to the file."""
+        if len(self._rows) > 0:
+            self._write_rows(self._rows)
+            self._rows = []
+        self._flush_file()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Write held rows and close the file."""
+        if not self.closed:
+            try:
+                self.flush()
+            finally:
+                self._close_file()
+                self.closed = True
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _flush_file(self):
+        raise NotImplementedError
+
+    def _close_file(self):
+        raise NotImplementedError
+
+
+class TSVWriter(BufferedWriter):
+    """Append rows to a tsv save file that is kept open between writes.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to save file.
+    **kwargs
+        Durability policy, see `BufferedWriter`.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._f = open(path, "a", newline="\n")
+        self._writer = csv.writer(self._f, delimiter="\t")
+
+    def _write_rows(self, rows):
+        self._writer.writerows(rows)
+
+    def _flush_file(self):
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+    def _close_file(self):
+        self._f.close()
+
+
+class QueuedWriter:
+    """Hand rows to another writer running in a background thread.
+
+    Rows are passed through a bounded queue so the measurement loop never waits on
+    disk I/O, unless the queue fills up and `backpressure` is "block".
+
+    Parameters
+    ----------
+    writer : BufferedWriter
+        Writer that rows are written with. It's closed when this writer is closed.
+    maxsize : int
+        Maximum number of rows in the queue.
+    backpressure : str
+        What to do when the queue is full. "block" waits for space. "drop_oldest"
+        discards the oldest queued row. "spill" appends rows to a temporary file
+        until the writer thread catches up, preserving their order.
+    """
+
+    def __init__(self, writer, maxsize=1000, backpressure="block"):
+        if backpressure not in ["block", "drop_oldest", "spill"]:
+            raise ValueError(
+                f"Invalid backpressure policy: {backpressure}. Must be 'block', "
+                + "'drop_oldest', or 'spill'."
+            )
+
+        self.writer = writer
+        self.maxsize = maxsize
+        self.backpressure = backpressure
+
+        # number of rows dropped or spilled because the queue was full
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._spill = None
+        self._spill_pending = 0
+        self._spill_read = 0
+        # number of rows taken from the queue but not yet written
+        self._in_flight = 0
+        # whether the writer thread is using the writer
+        self._busy = False
+        self._error = None
+        self.closed = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Exit the runtime context."""
+        self.close()
+
+    @property
+    def depth(self):
+        """Number of rows waiting to be written."""
+        with self._cond:
+            return len(self._queue) + self._spill_pending + self._in_flight
+
+    def writerow(self, row):
+        """Queue a row for writing.
+
+        Parameters
+        ----------
+        row : list
+            Row of data.
+        """
+        with self._cond:
+            self._raise_error()
+
+            if self._spill_pending > 0:
+                # keep spilling until the writer catches up to keep rows in order
+                self._spill_row(row)
+            elif len(self._queue) >= self.maxsize:
+                if self.backpressure == "block":
+                    while (len(self._queue) >= self.maxsize) and (self._error is None):
+                        self._cond.wait()
+                    self._raise_error()
+                    self._queue.append(row)
+                elif self.backpressure == "drop_oldest":
+                    self._queue.popleft()
+                    self._queue.append(row)
+                    self.dropped += 1
+                else:
+                    self._spill_row(row)
+            else:
+                self._queue.append(row)
+
+            self.max_depth = max(self.max_depth, len(self._queue) + self._spill_pending)
+            self._cond.notify_all()
+
+    def writerows(self, rows):
+        """Queue several rows for writing.
+
+        Parameters
+        ----------
+        rows : iterable of list
+            Rows of data.
+        """
+        for row in rows:
+            self.writerow(row)
+
+    def _spill_row(self, row):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        self._spill.seek(0, os.SEEK_END)
+        pickle.dump(row, self._spill)
+        self._spill_pending += 1
+        self.spilled += 1
+
+    def _unspill_rows(self):
+        """Read up to `maxsize` spilled rows, emptying the spill file when done."""
+        self._spill.seek(self._spill_read)
+        rows = []
+        while (len(rows) < self.maxsize) and (self._spill_pending > 0):
+            rows.append(pickle.load(self._spill))
+            self._spill_pending -= 1
+        self._spill_read = self._spill.tell()
+        if self._spill_pending == 0:
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read = 0
+        return rows
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError("Writer thread failed.") from self._error
+
+    def _run(self):
+        """Write queued rows until closed and the queue is empty."""
+        try:
+            while True:
+                with self._cond:
+                    while (
+                        (len(self._queue) == 0)
+                        and (self._spill_pending == 0)
+                        and (not self.closed)
+                    ):
+                        # wake up periodically to honour the flush interval
+                        if not self._cond.wait(self.writer.flush_interval):
+                            break
+                    if len(self._queue) > 0:
+                        rows = list(self._queue)
+                        self._queue.clear()
+                    elif self._spill_pending > 0:
+                        rows = self._unspill_rows()
+                    elif self.closed:
+                        return
+                    else:
+                        rows = []
+                    self._in_flight = len(rows)
+                    self._busy = True
+                    self._cond.notify_all()
+
+                for row in rows:
+                    self.writer.writerow(row)
+                self.writer.poll()
+
+                with self._cond:
+                    self._in_flight = 0
+                    self._busy = False
+                    self._cond.notify_all()
+        except BaseException as err:
+            with self._cond:
+                self._error = err
+                self._cond.notify_all()
+
+    def flush(self):
+        """Wait for queued rows to be written, then flush the writer."""
+        with self._cond:
+            while (
+                (len(self._queue) + self._spill_pending > 0 or self._busy)
+                and (self._error is None)
+            ):
+                self._cond.wait()
+            self._raise_error()
+            # the writer thread can't take more rows while the lock is held
+            self.writer.flush()
+
+    def close(self):
+        """Write all queued rows then close the writer."""
+        if self.closed:
+            return
+
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+        try:
+            self.writer.close()
+        finally:
+            if self._spill is not None:
+                self._spill.close()
+        self._raise_error()
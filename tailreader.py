@@ -0,0 +1,208 @@
+"""Incrementally read rows appended to a tsv save file."""
+import os
+
+import numpy as np
+
+# number of bytes read at a time when searching back from the end of a file
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+class TailReader:
+    """Read only the rows appended to a tsv save file since the last read.
+
+    The reader remembers its byte offset in the file, so the cost of each read
+    depends only on how much data was appended. A partly written row at the end of
+    the file is held back until it's completed.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to tsv save file.
+    usecols : list of int or None
+        Indices of columns to return. If None, all columns are returned.
+    ncols : int
+        Number of columns in the file.
+    tail_rows : int or None
+        If given, the first read, and the first read after the file is truncated or
+        replaced, starts this many rows from the end of the file instead of at the
+        start, so its cost doesn't grow with the length of the file.
+    """
+
+    def __init__(self, path, usecols=None, ncols=12, tail_rows=None):
+        self.path = path
+        self.usecols = usecols
+        self.ncols = ncols
+        self.tail_rows = tail_rows
+        self.offset = 0
+        self._partial = b""
+
+    def reset(self):
+        """Read from the start of the file again on the next read."""
+        self.offset = 0
+        self._partial = b""
+
+    def read(self):
+        """Read rows appended since the last read.
+
+        Returns
+        -------
+        data : numpy.ndarray
+            New rows as a 2D array.
+        reset : bool
+            True if the file was truncated or replaced since the last read, in which
+            case the data are read from the start of the file, or from `tail_rows`
+            rows before the end.
+        """
+        reset = False
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return self._empty(), reset
+
+        if size < self.offset:
+            self.reset()
+            reset = True
+
+        with open(self.path, "rb") as f:
+            if (self.offset == 0) and (self.tail_rows is not None):
+                self.offset = self._tail_offset(f, size)
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        self.offset += len(chunk)
+
+        chunk = self._partial + chunk
+        end = chunk.rfind(b"\n") + 1
+        self._partial = chunk[end:]
+
+        return self._parse(chunk[:end]), reset
+
+    def _tail_offset(self, f, size):
+        """Find the start of the row `tail_rows` rows from the end of the file.
+
+        The file is searched backwards from the end in blocks, so only about
+        `tail_rows` rows are read. If the file has fewer rows, 0 is returned.
+        """
+        blocks = []
+        newlines = 0
+        position = size
+        # read back until the newline that ends the row before the first one wanted
+        while (position > 0) and (newlines <= self.tail_rows):
+            step = min(TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            blocks.insert(0, f.read(step))
+            newlines += blocks[0].count(b"\n")
+
+        if newlines <= self.tail_rows:
+            return 0
+
+        tail = b"".join(blocks)
+        end = len(tail)
+        for _ in range(self.tail_rows + 1):
+            end = tail.rfind(b"\n", 0, end)
+        return position + end + 1
+
+    def _empty(self):
+        ncols = self.ncols if self.usecols is None else len(self.usecols)
+        return np.empty((0, ncols))
+
+    def _parse(self, block):
+        """Parse complete lines into an array, skipping the header."""
+        lines = block.splitlines()
+        if (len(lines) > 0) and (lines[0][:1].isalpha()):
+            lines = lines[1:]
+        if len(lines) == 0:
+            return self._empty()
+
+        try:
+            data = np.array(b"\t".join(lines).split(b"\t"), dtype=float)
+            data = data.reshape(len(lines), self.ncols)
+        except ValueError:
+            # fall back to parsing line by line, skipping malformed rows
+            rows = []
+            for line in lines:
+                try:
+                    row = [float(x) for x in line.split(b"\t")]
+                except ValueError:
+                    continue
+                if len(row) == self.ncols:
+                    rows.append(row)
+            if len(rows) == 0:
+                return self._empty()
+            data = np.array(rows)
+
+        if self.usecols is not None:
+            data = data[:, self.usecols]
+
+        return data
+
+
+class RingBuffer:
+    """Fixed-size buffer holding the most recent rows of data.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of rows held.
+    ncols : int
+        Number of columns.
+    """
+
+    def __init__(self, capacity, ncols):
+        self.capacity = capacity
+        self.ncols = ncols
+        self._data = np.empty((capacity, ncols))
+        self.clear()
+
+    def __len__(self):
+        """Get the number of rows held."""
+        return self._count
+
+    def clear(self):
+        """Remove all rows."""
+        # index of the next row to write
+        self._head = 0
+        self._count = 0
+        # total number of rows ever added
+        self.total = 0
+
+    def extend(self, rows):
+        """Add rows, overwriting the oldest rows if full.
+
+        Parameters
+        ----------
+        rows : array-like
+            2D array of rows.
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.ncols)
+        n = len(rows)
+        self.total += n
+        if n >= self.capacity:
+            self._data[:] = rows[-self.capacity :]
+            self._head = 0
+            self._count = self.capacity
+            return
+
+        first = min(n, self.capacity - self._head)
+        self._data[self._head : self._head + first] = rows[:first]
+        self._data[: n - first] = rows[first:]
+        self._head = (self._head + n) % self.capacity
+        self._count = min(self._count + n, self.capacity)
+
+    def view(self):
+        """Get the rows held in order from oldest to newest.
+
+        Returns
+        -------
+        data : numpy.ndarray
+            2D array of rows. This is a view of the buffer if the rows aren't
+            wrapped around its end, otherwise a copy.
+        """
+        if self._count < self.capacity:
+            return self._data[: self._count]
+        elif self._head == 0:
+            return self._data
+        else:
+            return np.concatenate(
+                (self._data[self._head :], self._data[: self._head])
+            )
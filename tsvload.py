@@ -0,0 +1,380 @@
+"""Load tsv save files in blocks with bounded memory use.
+
+The file is read in blocks of complete rows. Each block is split into fields in one
+go and only the selected columns are converted to floats, which is where most of the
+time goes, so loading a few columns of a long file is much quicker than parsing every
+column with `numpy.genfromtxt`. Rows in a time range are found by binary searching
+the file for the start time, assuming timestamps increase down the file, so the rows
+before it aren't read at all.
+
+Run this module as a script to benchmark loading a save file against
+`numpy.genfromtxt`.
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from storage import COLUMNS
+
+# max number of bytes read at once
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# size of the byte range left when the binary search for the start time stops, so the
+# last few rows before it are filtered by timestamp instead
+SEARCH_RESOLUTION = 64 * 1024
+
+
+def _convert(fields, nrows, usecols, ncols):
+    """Convert selected columns of a flat list of fields to floats."""
+    data = np.empty((nrows, len(usecols)))
+    for i, col in enumerate(usecols):
+        data[:, i] = np.array(fields[col::ncols], dtype=float)
+    return data
+
+
+def parse_lines(lines, usecols=None, ncols=len(COLUMNS)):
+    """Parse lines of a tsv save file.
+
+    Parameters
+    ----------
+    lines : list of bytes
+        Lines without line endings.
+    usecols : list of int or None
+        Indices of columns to return. If None, all columns are returned.
+    ncols : int
+        Number of columns in the file.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Selected columns of the valid rows.
+    valid : numpy.ndarray
+        Boolean mask of the lines that are valid rows. The header and malformed rows
+        are skipped.
+    """
+    if usecols is None:
+        usecols = list(range(ncols))
+
+    valid = np.ones(len(lines), dtype=bool)
+    header = int((len(lines) > 0) and lines[0][:1].isalpha())
+    valid[:header] = False
+
+    fields = b"\t".join(lines[header:]).split()
+    if len(fields) == valid.sum() * ncols:
+        try:
+            return _convert(fields, valid.sum(), usecols, ncols), valid
+        except ValueError:
+            pass
+
+    # fall back to parsing line by line, skipping malformed rows
+    rows = []
+    for i, line in enumerate(lines[header:], header):
+        try:
+            row = [float(x) for x in line.split(b"\t")]
+        except ValueError:
+            row = []
+        if len(row) == ncols:
+            rows.append(row)
+        else:
+            valid[i] = False
+    data = np.array(rows).reshape(-1, ncols)
+
+    return data[:, usecols], valid
+
+
+def parse_block(block, usecols=None, ncols=len(COLUMNS)):
+    """Parse a block of complete rows of a tsv save file.
+
+    Parameters
+    ----------
+    block : bytes
+        Rows, each ending with a newline. The header and malformed rows are skipped.
+    usecols : list of int or None
+        Indices of columns to return. If None, all columns are returned.
+    ncols : int
+        Number of columns in the file.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Selected columns of the valid rows.
+    """
+    if usecols is None:
+        usecols = list(range(ncols))
+
+    if not block[:1].isalpha():
+        # fast path without splitting the block into lines first
+        fields = block.split()
+        nrows = block.count(b"\n")
+        if len(fields) == nrows * ncols:
+            try:
+                return _convert(fields, nrows, usecols, ncols)
+            except ValueError:
+                pass
+
+    data, _ = parse_lines(block.split(b"\n")[:-1], usecols, ncols)
+    return data
+
+
+def read_columns(path):
+    """Read the column names of a tsv save file.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to tsv save file.
+
+    Returns
+    -------
+    columns : list of str
+        Column names from the header, or `storage.COLUMNS` if the file has no header.
+    offset : int
+        Byte offset of the first row.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+    if header[:1].isalpha():
+        return header.decode("utf-8").rstrip("\r\n").split("\t"), len(header)
+    return list(COLUMNS), 0
+
+
+def find_offset(f, t, start, end):
+    """Binary search a tsv save file for the first row at or after a time.
+
+    Timestamps must increase down the file.
+
+    Parameters
+    ----------
+    f : file object
+        Save file opened in binary mode.
+    t : float
+        Time to search for.
+    start : int
+        Byte offset of the first row.
+    end : int
+        Byte offset of the end of the file.
+
+    Returns
+    -------
+    offset : int
+        Byte offset of the start of a row at or before the first row with a
+        timestamp of at least `t`, within `SEARCH_RESOLUTION` bytes of it.
+    """
+    # every row starting before lo has a timestamp before t
+    lo, hi = start, end
+    while hi - lo > SEARCH_RESOLUTION:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        # skip to the start of the next row
+        f.readline()
+        row_start = f.tell()
+        line = f.readline()
+        try:
+            timestamp = float(line.split(b"\t", 1)[0])
+        except ValueError:
+            # e.g. a partly written row at the end of the file
+            timestamp = None
+
+        if (timestamp is not None) and line.endswith(b"\n") and (timestamp < t):
+            lo = row_start
+        else:
+            hi = mid
+
+    return lo
+
+
+def read_blocks(path, columns=None, t_start=None, t_end=None, block_size=BLOCK_SIZE):
+    """Read a tsv save file in blocks of rows.
+
+    Only one block of the file is held in memory at a time. A partly written row at
+    the end of the file is ignored.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to tsv save file.
+    columns : list of str or None
+        Names of columns to return. If None, all columns are returned.
+    t_start : float or None
+        Only return rows with timestamps at or after this time. If None, rows are
+        returned from the start of the file.
+    t_end : float or None
+        Only return rows with timestamps at or before this time. If None, rows are
+        returned up to the end of the file.
+    block_size : int
+        Max number of bytes read at once.
+
+    Yields
+    ------
+    data : numpy.ndarray
+        Selected columns of a block of rows.
+    """
+    all_columns, start = read_columns(path)
+    if columns is None:
+        columns = all_columns
+    for name in columns:
+        if name not in all_columns:
+            raise ValueError(f"Invalid column: {name}. Must be one of {all_columns}.")
+    # the timestamp is always read for filtering
+    usecols = [0] + [all_columns.index(name) for name in columns]
+
+    with open(path, "rb") as f:
+        offset = start
+        if t_start is not None:
+            offset = find_offset(f, t_start, start, os.path.getsize(path))
+        f.seek(offset)
+
+        partial = b""
+        while True:
+            chunk = f.read(block_size)
+            if len(chunk) == 0:
+                break
+            chunk = partial + chunk
+            end = chunk.rfind(b"\n") + 1
+            partial = chunk[end:]
+            if end == 0:
+                continue
+
+            data = parse_block(chunk[:end], usecols, len(all_columns))
+            if t_start is not None:
+                data = data[data[:, 0] >= t_start]
+            finished = (t_end is not None) and (len(data) > 0) and (data[-1, 0] > t_end)
+            if t_end is not None:
+                data = data[data[:, 0] <= t_end]
+            if len(data) > 0:
+                yield data[:, 1:]
+            if finished:
+                break
+
+
+def load(path, columns=None, t_start=None, t_end=None, block_size=BLOCK_SIZE):
+    """Load rows of a tsv save file.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path to tsv save file.
+    columns : list of str or None
+        Names of columns to load. If None, all columns are loaded.
+    t_start : float or None
+        Only load rows with timestamps at or after this time.
+    t_end : float or None
+        Only load rows with timestamps at or before this time.
+    block_size : int
+        Max number of bytes read at once.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Selected columns of the rows as a 2D array.
+    columns : list of str
+        Column names.
+    """
+    if columns is None:
+        columns, _ = read_columns(path)
+    blocks = list(read_blocks(path, columns, t_start, t_end, block_size))
+    if len(blocks) == 0:
+        return np.empty((0, len(columns))), list(columns)
+    return np.concatenate(blocks), list(columns)
+
+
+def profile(func, *args, **kwargs):
+    """Measure the time taken and peak memory allocated by a function call.
+
+    The function is called twice, since tracing memory allocations slows it down.
+
+    Parameters
+    ----------
+    func : callable
+        Function to call.
+    *args, **kwargs
+        Arguments passed to the function.
+
+    Returns
+    -------
+    result
+        Return value of the function.
+    elapsed : float
+        Time taken in s.
+    peak : int
+        Peak memory allocated during the call in bytes.
+    """
+    t_start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - t_start
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def load_genfromtxt(path, columns=None, t_start=None, t_end=None):
+    """Load rows of a tsv save file with `numpy.genfromtxt` for comparison.
+
+    Parameters are the same as `load`.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        Selected columns of the rows as a 2D array.
+    """
+    all_columns, _ = read_columns(path)
+    if columns is None:
+        columns = all_columns
+    usecols = [0] + [all_columns.index(name) for name in columns]
+    data = np.genfromtxt(
+        path, delimiter="\t", skip_header=1, usecols=usecols, invalid_raise=False
+    ).reshape(-1, len(usecols))
+    if t_start is not None:
+        data = data[data[:, 0] >= t_start]
+    if t_end is not None:
+        data = data[data[:, 0] <= t_end]
+    return data[:, 1:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark loading a tsv save file against numpy.genfromtxt."
+    )
+    parser.add_argument("path", help="Path to tsv save file.")
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        default=None,
+        help="Names of columns to load, e.g. 'timestamp (s)' 'R (V)' 'Phase (deg)'.",
+    )
+    parser.add_argument(
+        "--t-start", type=float, default=None, help="Start of the time range."
+    )
+    parser.add_argument(
+        "--t-end", type=float, default=None, help="End of the time range."
+    )
+    args = parser.parse_args()
+
+    size = os.path.getsize(args.path) / 1e6
+    print(f"File size: {size:.1f} MB")
+
+    results = {}
+    for name, func in [("tsvload", load), ("genfromtxt", load_genfromtxt)]:
+        result, elapsed, peak = profile(
+            func, args.path, args.columns, args.t_start, args.t_end
+        )
+        data = result[0] if name == "tsvload" else result
+        results[name] = (data, elapsed)
+        print(
+            f"{name}: {len(data)} rows in {elapsed:.2f} s, {size / elapsed:.1f} MB/s, "
+            + f"peak memory {peak / 1e6:.1f} MB"
+        )
+
+    data, elapsed = results["tsvload"]
+    reference, reference_elapsed = results["genfromtxt"]
+    print(f"Speed-up: {reference_elapsed / elapsed:.1f}x")
+    print(f"Same data: {np.array_equal(data, reference, equal_nan=True)}")
@@ -0,0 +1,369 @@
+"""Run acquisition in a separate process managed by the GUI server."""
+import copy
+import datetime
+import multiprocessing
+import pathlib
+import queue
+import threading
+import time
+import traceback
+
+import yaml
+
+import freerun
+import replay
+from shmring import SharedRingBuffer
+from storage import COLUMNS
+
+# experiment page settings and the configuration keys they map to
+EXPERIMENT_SETTINGS = {"interval": "interval", "device_id": "device_id"}
+
+# lock-in amplifier page settings and the setup keys they map to. Select values are
+# 1-indexed (see apps/lia.py) so they're decremented.
+LIA_SELECTS = {
+    "input_configuration": "input_configuration",
+    "input_coupling": "input_coupling",
+    "input_grounding": "input_shield_grounding",
+    "line_notch": "line_notch_filter_status",
+    "ref_source": "reference_source",
+    "ref_trigger": "reference_trigger",
+    "sensitivity": "sensitivity",
+    "reserve_mode": "reserve_mode",
+}
+LIA_NUMBERS = {"ref_freq": "reference_frequency", "harmonic": "harmonic"}
+
+
+def build_config(base_config, experiment=None, lia=None):
+    """Build an acquisition configuration from the GUI settings.
+
+    Parameters
+    ----------
+    base_config : dict
+        Configuration dictionary providing everything the GUI doesn't set, e.g.
+        loaded from example_config.yaml.
+    experiment : dict, optional
+        Experiment page settings. Missing or empty values keep the base setting.
+    lia : dict, optional
+        Lock-in amplifier page settings, with Select values as 1-indexed strings or
+        ints. Missing or empty values keep the base setting.
+
+    Returns
+    -------
+    config : dict
+        Configuration dictionary for a single instrument.
+    """
+    config = copy.deepcopy(base_config)
+    experiment = experiment or {}
+    lia = lia or {}
+
+    for key, config_key in EXPERIMENT_SETTINGS.items():
+        if experiment.get(key) not in [None, ""]:
+            config[config_key] = experiment[key]
+
+    lia_config = freerun.instrument_configs(config)[0]
+    setup = lia_config["setup"]
+    for key, setup_key in LIA_SELECTS.items():
+        if lia.get(key) not in [None, ""]:
+            setup[setup_key] = int(lia[key]) - 1
+    for key, setup_key in LIA_NUMBERS.items():
+        if lia.get(key) not in [None, ""]:
+            setup[setup_key] = lia[key]
+    config["lia"] = lia_config
+
+    return config
+
+
+def new_save_path(save_folder, device_id, output_format="tsv"):
+    """Get a timestamped save path for a new run.
+
+    Parameters
+    ----------
+    save_folder : str
+        Parent folder for the save file. If empty, the current working directory is
+        used.
+    device_id : str
+        Device ID used in the file name.
+    output_format : str
+        Save file format, "tsv" or "binary".
+
+    Returns
+    -------
+    save_path : pathlib.Path
+        Save path.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    name = f"{device_id}_{timestamp}"
+    if output_format == "tsv":
+        name += ".tsv"
+    return pathlib.Path(save_folder or ".").joinpath(name)
+
+
+def acquire(
+    config,
+    save_path,
+    stop,
+    status,
+    duration=None,
+    simulate=False,
+    live_name=None,
+    new_data=None,
+    replay_source=None,
+    replay_speed=1.0,
+):
+    """Acquire data until stopped, reporting status on a queue.
+
+    This is the target of the worker process.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration dictionary for a single instrument.
+    save_path : pathlib.Path
+        Path to save file.
+    stop : multiprocessing.Event
+        Event that stops the measurements when set.
+    status : multiprocessing.Queue
+        Queue that (state, message) status tuples are put on.
+    duration : float or None
+        Total experiment time in s. If None, measurements run until stopped.
+    simulate : bool
+        Use a simulated lock-in amplifier instead of a real instrument.
+    live_name : str, optional
+        Name of a `SharedRingBuffer` that measured rows are added to.
+    new_data : multiprocessing.Event, optional
+        Event set whenever rows are added to the shared buffer.
+    replay_source : str or pathlib.Path, optional
+        Path to a tsv save file to replay instead of measuring, see `replay.replay`.
+    replay_speed : float or None
+        Replay speed-up factor. If None or zero, rows are replayed as fast as
+        possible.
+    """
+    if duration is not None:
+        timer = threading.Timer(duration, stop.set)
+        timer.daemon = True
+        timer.start()
+
+    live = None
+    try:
+        if live_name is not None:
+            live = SharedRingBuffer.attach(live_name, notify=new_data)
+        lia_config = config["lia"]
+        freerun.init_save_file(
+            save_path,
+            config.get("output_format", "tsv"),
+            freerun.save_columns(config),
+            interactive=False,
+        )
+        if replay_source is not None:
+            status.put(("running", f"Replaying {replay_source} to {save_path}"))
+            with freerun.open_writer(save_path, config) as writer:
+                rows, elapsed, _ = replay.replay(
+                    replay_source,
+                    writer,
+                    replay_speed,
+                    stop,
+                    live,
+                    freerun.save_columns(config),
+                )
+            print(f"Replayed {rows} rows at {rows / elapsed:.1f} rows/s.")
+        else:
+            status.put(
+                ("running", f"Measuring {lia_config['device_id']} to {save_path}")
+            )
+            if simulate:
+                import sim_sr830 as sr830
+            else:
+                import sr830
+
+            with sr830.sr830() as lia:
+                freerun.run(lia, config, lia_config, save_path, stop, live)
+    except Exception as err:
+        traceback.print_exc()
+        status.put(("error", f"{type(err).__name__}: {err}"))
+    else:
+        status.put(("stopped", f"Finished measuring to {save_path}"))
+    finally:
+        if live is not None:
+            live.close()
+
+
+class AcquisitionWorker:
+    """Start, stop, and monitor an acquisition process.
+
+    Acquisition runs in its own process, so it has its own interpreter and GIL and
+    handling GUI requests can't delay measurements. Measured rows are shared with the
+    server through a `SharedRingBuffer` created for each run, which stays readable
+    after the run finishes until the next one starts.
+
+    Parameters
+    ----------
+    simulate : bool
+        Use a simulated lock-in amplifier instead of a real instrument.
+    live_points : int
+        Number of most recent rows held in the shared buffer.
+    replay_source : str or pathlib.Path, optional
+        Path to a tsv save file to replay instead of measuring, for load testing.
+    replay_speed : float or None
+        Replay speed-up factor. If None or zero, rows are replayed as fast as
+        possible.
+    """
+
+    def __init__(
+        self, simulate=False, live_points=10000, replay_source=None, replay_speed=1.0
+    ):
+        self.simulate = simulate
+        self.live_points = live_points
+        self.replay_source = replay_source
+        self.replay_speed = replay_speed
+        # spawn a fresh interpreter rather than forking the server
+        self._context = multiprocessing.get_context("spawn")
+        # shared buffer of the current or last run
+        self.live = None
+        # set by the acquisition process whenever it adds rows to the shared buffer
+        self.new_data = self._context.Event()
+        self._process = None
+        self._stop = None
+        self._status = None
+        self.state = "idle"
+        self.message = ""
+        self.save_path = None
+        self.t_start = None
+        # callbacks run concurrently in the server's threads, so the process and its
+        # status are only changed by one at a time
+        self._lock = threading.RLock()
+
+    @property
+    def running(self):
+        """Whether the acquisition process is running."""
+        return (self._process is not None) and self._process.is_alive()
+
+    def start(self, config, save_path, duration=None):
+        """Start acquisition in a new process.
+
+        Parameters
+        ----------
+        config : dict
+            Configuration dictionary for a single instrument.
+        save_path : pathlib.Path
+            Path to save file.
+        duration : float or None
+            Total experiment time in s. If None, measurements run until stopped.
+        """
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Acquisition is already running.")
+
+            if self.live is not None:
+                self.live.close()
+                self.live = None
+            if config.get("mode", "poll") == "poll":
+                self.live = SharedRingBuffer.create(self.live_points, len(COLUMNS))
+
+            self._stop = self._context.Event()
+            self._status = self._context.Queue()
+            self._process = self._context.Process(
+                target=acquire,
+                args=(config, save_path, self._stop, self._status, duration),
+                kwargs={
+                    "simulate": self.simulate,
+                    "live_name": None if self.live is None else self.live.name,
+                    "new_data": self.new_data,
+                    "replay_source": self.replay_source,
+                    "replay_speed": self.replay_speed,
+                },
+                name="acquisition",
+                daemon=True,
+            )
+            self._process.start()
+            self.state = "starting"
+            self.message = "Starting acquisition"
+            self.save_path = save_path
+            self.t_start = time.time()
+
+    def stop(self, timeout=None):
+        """Ask the acquisition process to stop after the current measurement.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Time to wait for the process to exit in s before terminating it. If
+            None, return without waiting.
+        """
+        with self._lock:
+            if not self.running:
+                return
+
+            self._stop.set()
+            self.state = "stopping"
+            self.message = "Stopping after the current measurement"
+            if timeout is not None:
+                self._process.join(timeout)
+                if self._process.is_alive():
+                    self._process.terminate()
+                    self._process.join()
+                self.poll()
+
+    def close(self):
+        """Stop acquisition and release the shared buffer."""
+        with self._lock:
+            self.stop(30)
+            if self.live is not None:
+                self.live.close()
+                self.live = None
+
+    def poll(self):
+        """Update the status from messages sent by the acquisition process.
+
+        Returns
+        -------
+        state : str
+            "idle", "starting", "running", "stopping", "stopped", or "error".
+        message : str
+            Status message.
+        """
+        with self._lock:
+            # the process and its status queue are read together so they're from the
+            # same run
+            process, status, stop = self._process, self._status, self._stop
+            if process is None:
+                return self.state, self.message
+
+            exited = not process.is_alive()
+            while True:
+                try:
+                    # once the process has exited, allow time for its last message to
+                    # arrive
+                    self.state, self.message = status.get(timeout=0.1 * exited)
+                except queue.Empty:
+                    break
+
+            if (self.state == "running") and stop.is_set():
+                # the process reported it was running before it was asked to stop
+                self.state = "stopping"
+                self.message = "Stopping after the current measurement"
+
+            if exited and (self.state in ["starting", "running", "stopping"]):
+                # exited without reporting, e.g. terminated or crashed
+                self.state = "error"
+                self.message = (
+                    f"Acquisition process exited with code {process.exitcode}"
+                )
+
+            return self.state, self.message
+
+
+def load_base_config(config_path="example_config.yaml"):
+    """Load the configuration that GUI settings are applied on top of.
+
+    Parameters
+    ----------
+    config_path : str or pathlib.Path
+        Path to configuration file (yaml format).
+
+    Returns
+    -------
+    config : dict
+        Configuration dictionary.
+    """
+    with open(config_path, "r") as f:
+        return yaml.load(f, Loader=yaml.FullLoader)
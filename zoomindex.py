@@ -0,0 +1,477 @@
+"""Multi-resolution index of a tsv save file for zooming into long runs.
+
+The index of a save file is a folder alongside it, `<save file>.zoom`, holding one
+file per level in the format of `binstore` chunks. Each record is a tile summarising
+consecutive rows of the save file: its first and last timestamps, the byte offsets of
+the start of its first row and the end of its last row, its number of rows, and the
+min, max, and sum of each indexed column. Level 0 tiles summarise `tile_rows` rows
+and each tile of a higher level summarises `factor` tiles of the level below.
+
+The first timestamps and offsets of the level 0 tiles are a sparse index into the save
+file, so the rows in a time range can be read without parsing the rest of the file.
+The index is updated incrementally by reading only the rows appended since the last
+update, and timestamps must increase down the file.
+
+Run this module as a script to build or update the index of a save file.
+"""
+import argparse
+import bisect
+import functools
+import json
+import math
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+import numpy as np
+
+import binstore
+from storage import COLUMNS
+from tsvload import BLOCK_SIZE, parse_lines
+
+# number of rows summarised by a level 0 tile
+TILE_ROWS = 64
+
+# number of tiles of one level summarised by a tile of the next level
+FACTOR = 8
+
+# number of levels
+LEVELS = 6
+
+# columns summarised by default
+INDEX_COLUMNS = ["R (V)", "Phase (deg)"]
+
+
+def index_path(save_path):
+    """Get the path of the index of a save file.
+
+    Parameters
+    ----------
+    save_path : str or pathlib.Path
+        Path to tsv save file.
+
+    Returns
+    -------
+    path : pathlib.Path
+        Path to index folder.
+    """
+    save_path = pathlib.Path(save_path)
+    return save_path.with_name(f"{save_path.name}.zoom")
+
+
+def tile_columns(columns):
+    """Get the column names of tile records.
+
+    Parameters
+    ----------
+    columns : list of str
+        Names of the indexed columns.
+
+    Returns
+    -------
+    names : list of str
+        Column names of tile records.
+    """
+    names = ["t first (s)", "t last (s)", "start", "end", "n"]
+    for name in columns:
+        names += [f"{name} min", f"{name} max", f"{name} sum"]
+    return names
+
+
+def row_tiles(data, starts, ends):
+    """Make a tile of each row.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Rows with the timestamp followed by the indexed columns.
+    starts : numpy.ndarray
+        Byte offset of the start of each row in the save file.
+    ends : numpy.ndarray
+        Byte offset of the end of each row in the save file.
+
+    Returns
+    -------
+    tiles : numpy.ndarray
+        Tile records.
+    """
+    ncols = data.shape[1] - 1
+    tiles = np.empty((len(data), 5 + 3 * ncols))
+    tiles[:, 0] = data[:, 0]
+    tiles[:, 1] = data[:, 0]
+    tiles[:, 2] = starts
+    tiles[:, 3] = ends
+    tiles[:, 4] = 1
+    for i in range(3):
+        tiles[:, 5 + i :: 3] = data[:, 1:]
+    return tiles
+
+
+def merge_tiles(tiles, size):
+    """Merge groups of consecutive tiles.
+
+    Parameters
+    ----------
+    tiles : numpy.ndarray
+        Tile records. The number of records must be a multiple of `size`.
+    size : int
+        Number of tiles in each group.
+
+    Returns
+    -------
+    merged : numpy.ndarray
+        A tile record for each group.
+    """
+    groups = tiles.reshape(-1, size, tiles.shape[1])
+    merged = np.empty((len(groups), tiles.shape[1]))
+    merged[:, [0, 2]] = groups[:, 0, [0, 2]]
+    merged[:, [1, 3]] = groups[:, -1, [1, 3]]
+    merged[:, 4] = groups[:, :, 4].sum(axis=1)
+    merged[:, 5::3] = groups[:, :, 5::3].min(axis=1)
+    merged[:, 6::3] = groups[:, :, 6::3].max(axis=1)
+    merged[:, 7::3] = groups[:, :, 7::3].sum(axis=1)
+    return merged
+
+
+def _locked(method):
+    """Hold the index's lock while a method runs."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class ZoomIndex:
+    """Multi-resolution index of a tsv save file.
+
+    Tiles that aren't complete yet, including the most recent rows, are held in
+    memory, so queries include every row read by the last update.
+
+    Updates and queries hold the index's lock, so it can be shared between threads,
+    e.g. concurrent callbacks of a threaded web server. Two updates running at once
+    would otherwise both append the same tiles to the files. Only one `ZoomIndex`
+    should be open for each save file.
+
+    Parameters
+    ----------
+    save_path : str or pathlib.Path
+        Path to tsv save file.
+    columns : list of str
+        Names of the columns to index.
+    tile_rows : int
+        Number of rows summarised by a level 0 tile.
+    factor : int
+        Number of tiles of one level summarised by a tile of the next level.
+    levels : int
+        Number of levels.
+    all_columns : list of str
+        Column names of the save file. Column 0 must be the timestamp.
+    """
+
+    def __init__(
+        self,
+        save_path,
+        columns=INDEX_COLUMNS,
+        tile_rows=TILE_ROWS,
+        factor=FACTOR,
+        levels=LEVELS,
+        all_columns=COLUMNS,
+    ):
+        for name in columns:
+            if name not in all_columns:
+                raise ValueError(
+                    f"Invalid column: {name}. Must be one of {all_columns}."
+                )
+
+        self.save_path = pathlib.Path(save_path)
+        self.path = index_path(save_path)
+        self.columns = list(columns)
+        self.tile_rows = tile_rows
+        self.factor = factor
+        self.levels = levels
+        self.usecols = [0] + [all_columns.index(name) for name in columns]
+        self.ncols = len(all_columns)
+        self._record_columns = tile_columns(columns)
+        # reentrant, so callers can also hold it across several calls
+        self.lock = threading.RLock()
+
+        if not self._open():
+            self._create()
+
+    @property
+    def settings(self):
+        """Settings the index was built with."""
+        return {
+            "columns": self.columns,
+            "tile_rows": self.tile_rows,
+            "factor": self.factor,
+            "levels": self.levels,
+        }
+
+    def _level_path(self, level):
+        return self.path.joinpath(f"level_{level}.bin")
+
+    def _empty(self):
+        return np.empty((0, len(self._record_columns)))
+
+    def _create(self):
+        """Start a new, empty index."""
+        # release memory maps of the old index before deleting it
+        self._tiles = []
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path.joinpath("settings.json"), "w") as f:
+            json.dump(self.settings, f)
+
+        header = binstore.make_header(self._record_columns)
+        for level in range(self.levels):
+            with open(self._level_path(level), "wb") as f:
+                f.write(header)
+
+        # byte offset in the save file of the next row to read
+        self.offset = 0
+        self._tiles = [self._empty() for _ in range(self.levels)]
+        # tiles of the level below, or rows for level 0, not yet in a complete tile
+        self._pending = [self._empty() for _ in range(self.levels)]
+
+    def _open(self):
+        """Open an existing index.
+
+        Returns
+        -------
+        opened : bool
+            False if there's no index, it was built with different settings, or it
+            doesn't match the save file, in which case it must be rebuilt.
+        """
+        try:
+            with open(self.path.joinpath("settings.json"), "r") as f:
+                if json.load(f) != self.settings:
+                    return False
+
+            record_size = np.dtype(binstore.DTYPE).itemsize
+            record_size *= len(self._record_columns)
+            for level in range(self.levels):
+                path = self._level_path(level)
+                # drop any partly written record
+                _, offset = binstore.read_header(path)
+                count = (os.path.getsize(path) - offset) // record_size
+                with open(path, "r+b") as f:
+                    f.truncate(offset + count * record_size)
+            self._tiles = [self._read_tiles(level) for level in range(self.levels)]
+        except (OSError, ValueError):
+            return False
+
+        self._pending = [self._empty()]
+        for level in range(1, self.levels):
+            below = self._tiles[level - 1][len(self._tiles[level]) * self.factor :]
+            if len(below) >= self.factor:
+                # a tile of this level wasn't written before the index was closed
+                return False
+            self._pending.append(np.array(below))
+
+        # rows after the last level 0 tile are read again
+        self.offset = int(self._tiles[0][-1, 3]) if len(self._tiles[0]) > 0 else 0
+        return self.offset <= os.path.getsize(self.save_path)
+
+    def _read_tiles(self, level):
+        data, columns = binstore.open_chunk(self._level_path(level))
+        if columns != self._record_columns:
+            raise ValueError(f"Columns of level {level} don't match: {columns}.")
+        return data
+
+    def _push(self, level, tiles):
+        """Add tiles of the level below, or rows for level 0, to a level."""
+        tiles = np.concatenate([self._pending[level], tiles])
+        size = self.tile_rows if level == 0 else self.factor
+        complete = len(tiles) // size * size
+        self._pending[level] = tiles[complete:]
+        if complete == 0:
+            return
+
+        merged = merge_tiles(tiles[:complete], size)
+        with open(self._level_path(level), "ab") as f:
+            f.write(merged.astype(binstore.DTYPE).tobytes())
+        self._tiles[level] = self._read_tiles(level)
+
+        if level + 1 < self.levels:
+            self._push(level + 1, merged)
+
+    @_locked
+    def update(self):
+        """Index rows appended to the save file since the last update.
+
+        If the save file was truncated or replaced, the index is rebuilt.
+
+        Returns
+        -------
+        rows : int
+            Number of rows indexed.
+        """
+        try:
+            size = os.path.getsize(self.save_path)
+        except FileNotFoundError:
+            return 0
+
+        if size < self.offset:
+            self._create()
+
+        rows = 0
+        with open(self.save_path, "rb") as f:
+            while self.offset < size:
+                f.seek(self.offset)
+                chunk = f.read(min(size - self.offset, BLOCK_SIZE))
+                end = chunk.rfind(b"\n") + 1
+                if end == 0:
+                    # no complete rows
+                    break
+
+                lines = chunk[:end].split(b"\n")[:-1]
+                ends = self.offset + np.cumsum([len(line) + 1 for line in lines])
+                starts = ends - [len(line) + 1 for line in lines]
+                data, valid = parse_lines(lines, self.usecols, self.ncols)
+                self._push(0, row_tiles(data, starts[valid], ends[valid]))
+
+                self.offset += end
+                rows += len(data)
+
+        return rows
+
+    @_locked
+    def time_range(self):
+        """Get the first and last indexed timestamps.
+
+        Returns
+        -------
+        time_range : tuple of float or None
+            First and last timestamps, or None if no rows have been indexed.
+        """
+        tiles = [t for t in self._tiles[:1] + self._pending if len(t) > 0]
+        if len(tiles) == 0:
+            return None
+        # the most recent rows are the pending rows of level 0, if any
+        last = self._pending[0] if len(self._pending[0]) > 0 else self._tiles[0]
+        return tiles[0][0, 0], last[-1, 1]
+
+    def _find(self, level, t_start, t_end):
+        """Find the complete tiles of a level that overlap a time range.
+
+        Binary searches the memory-mapped tiles, so only a few records are read.
+        """
+        tiles = self._tiles[level]
+        first = bisect.bisect_left(tiles[:, 1], t_start)
+        last = bisect.bisect_right(tiles[:, 0], t_end)
+        return first, max(first, last)
+
+    def _tail(self, level):
+        """Get the tiles covering the rows after the last complete tile of a level."""
+        if level < 0:
+            return self._pending[0]
+        return np.concatenate(self._pending[level::-1])
+
+    def _count(self, level, t_start, t_end):
+        """Count the points a query at a level would return."""
+        tail = self._tail(level)
+        count = np.count_nonzero((tail[:, 1] >= t_start) & (tail[:, 0] <= t_end))
+        first, last = self._find(max(level, 0), t_start, t_end)
+        return count + (last - first) * (self.tile_rows if level < 0 else 1)
+
+    def _read_rows(self, first, last):
+        """Read the rows of a range of level 0 tiles from the save file."""
+        if last == first:
+            return self._empty()
+
+        start = int(self._tiles[0][first, 2])
+        end = int(self._tiles[0][last - 1, 3])
+        with open(self.save_path, "rb") as f:
+            f.seek(start)
+            lines = f.read(end - start).split(b"\n")[:-1]
+        data, valid = parse_lines(lines, self.usecols, self.ncols)
+        # byte offsets aren't needed
+        return row_tiles(data, np.nan, np.nan)
+
+    @_locked
+    def query(self, t_start=-math.inf, t_end=math.inf, width=1000):
+        """Summarise the rows in a time range at a resolution suited to a plot.
+
+        The finest resolution that gives at most `width` points is used, down to the
+        individual rows. Only the tiles or rows returned are read, so the time taken
+        depends on `width` rather than the length of the save file or time range.
+        Tiles overlapping the ends of the range are included whole.
+
+        Parameters
+        ----------
+        t_start : float
+            Start of the time range.
+        t_end : float
+            End of the time range.
+        width : int
+            Max number of points, e.g. the width of the plot in pixels.
+
+        Returns
+        -------
+        data : numpy.ndarray
+            One row per point with columns: timestamp, number of rows summarised,
+            then the min, max, and mean of each indexed column. Points summarising
+            several rows are timestamped with the middle of their first and last
+            timestamps.
+        level : int
+            Level of the tiles the points were made from, or -1 for rows.
+        """
+        # use the coarsest level if even that gives too many points
+        level = self.levels - 1
+        for candidate in range(-1, self.levels - 1):
+            if self._count(candidate, t_start, t_end) <= width:
+                level = candidate
+                break
+
+        first, last = self._find(max(level, 0), t_start, t_end)
+        if level < 0:
+            complete = self._read_rows(first, last)
+        else:
+            complete = self._tiles[level][first:last]
+        tiles = np.concatenate([complete, self._tail(level)])
+        tiles = tiles[(tiles[:, 1] >= t_start) & (tiles[:, 0] <= t_end)]
+
+        data = np.empty((len(tiles), 2 + 3 * len(self.columns)))
+        data[:, 0] = (tiles[:, 0] + tiles[:, 1]) / 2
+        data[:, 1] = tiles[:, 4]
+        data[:, 2::3] = tiles[:, 5::3]
+        data[:, 3::3] = tiles[:, 6::3]
+        data[:, 4::3] = tiles[:, 7::3] / tiles[:, [4]]
+
+        return data, level
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("save_path", help="Path to tsv save file.")
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        default=INDEX_COLUMNS,
+        help="Names of the columns to index.",
+    )
+    args = parser.parse_args()
+
+    t_start = time.perf_counter()
+    index = ZoomIndex(args.save_path, args.columns)
+    rows = index.update()
+    elapsed = time.perf_counter() - t_start
+    print(f"Indexed {rows} new rows in {elapsed:.2f} s")
+
+    time_range = index.time_range()
+    if time_range is not None:
+        for level in range(index.levels):
+            print(f"Level {level}: {len(index._tiles[level])} tiles")
+        t_start = time.perf_counter()
+        data, level = index.query(*time_range)
+        elapsed = (time.perf_counter() - t_start) * 1000
+        print(
+            f"Queried the whole file at level {level}, {len(data)} points, in "
+            + f"{elapsed:.1f} ms"
+        )